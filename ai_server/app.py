@@ -2,43 +2,82 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from flask import Flask, request, jsonify, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import json
 import os
 from typing import List, Dict, Any
-import xml.etree.ElementTree as ET
-import html
-import re
 from pydantic import BaseModel
 
 # Import our AI agent modules
-from chat_agent import query_perplexity
-from recommendations_agent import get_recommendations
-from tech_review_agent import run_tech_review
-from walk_me_through_code_agent import walk_me_through_code_agent
-from cost_agent import run_cost_analysis
-from custom_code_agent import call_custom_code_agent
+from chat_agent import chat_turn, CHAT_EDIT_MODE
+from chat_sessions import chat_inputs, remember_turn, get_session_store
+from recommendations_agent import recommend, get_recommendation_index
+from tech_review_agent import run_tech_review, AnswerFormat as TechReviewAnswer
+from walk_me_through_code_agent import walk_me_through_code_agent, stream_walk_me_through_code_agent, AnswerFormat as WalkthroughAnswer
+from cost_agent import run_cost_analysis, AnswerFormat as CostAnswer
+from custom_code_agent import call_custom_code_agent, stream_custom_code_agent, AnswerFormat as CustomCodeAnswer
 from personality_agent import stream_personality_response
+from finalize import run_reviews
+from batch_review import plan_batch, run_batch
+from doc_registry import resolve_search_filters
+from job_queue import get_job_queue, job_user, job_events, JobQueueFull
+from prefetch import wants_speculation, walkthrough_tech_stack, speculate_walkthrough, claim_walkthrough, job_result, job_deltas
+import metrics
+import model_router
+import rate_limit
+import response_cache
+import single_flight
+from responses import (
+    format_code_output, format_chat_response, format_chat_code,
+    format_tech_review, format_cost_analysis, review_section_result, error_status,
+    CodeStream, STREAM_OPENED
+)
+from structured_output import parse_agent_output
+from script_validation import validate_code_answer
+from sse import SSE_HEADERS, format_event, coalesce
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with metrics.stage("serialization"):
+            return super().dumps(obj, **kwargs)
+
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
-import xml.etree.ElementTree as ET
-import html
-from typing import Dict, Any
+@app.before_request
+def start_request_timing():
+    metrics.begin_request(request.endpoint or 'unknown', request.headers.get('X-Server-Timing') == '1')
+    if request.is_json:
+        with metrics.stage("request_parse"):
+            request.get_json(silent=True)
 
-def xml_to_json(input_str: str) -> dict:
-    try:
-        # Remove <think>...</think> block if present
-        cleaned_str = re.sub(r"<think>.*?</think>", "", input_str, flags=re.DOTALL).strip()
+@app.after_request
+def finish_request_timing(response):
+    timings = metrics.end_request(response.status_code)
+    if timings is not None and timings.server_timing:
+        response.headers['Server-Timing'] = timings.header()
+    if timings is not None and timings.models:
+        response.headers['X-AI-Model'] = ", ".join(timings.models)
+    return response
 
-        # Attempt to load remaining content as JSON
-        return json.loads(cleaned_str)
-    
-    except json.JSONDecodeError as e:
-        print("❌ Failed to parse JSON. Error:", e)
-        raise ValueError("Input is not valid JSON after removing <think> block.")
+def wants_stream(data: dict) -> bool:
+    return bool(data.get('stream')) or request.args.get('stream', '').lower() == 'true'
 
+def stream_code_generation(deltas, answer_format):
+    """Relay upstream deltas as SSE, plus each JSON field as soon as it completes"""
+    yield STREAM_OPENED
+    stream = CodeStream(answer_format)
+    try:
+        for delta in deltas:
+            yield from stream.feed(delta)
+        yield stream.finish()
+    
+    except Exception as e:
+        yield CodeStream.error(e)
 
 @app.route('/api/ai/recommendations', methods=['POST'])
 def get_agent_recommendations():
@@ -51,19 +90,25 @@ def get_agent_recommendations():
         # Convert config to search filters if needed
         search_filters = []
         
-        recommendations = get_recommendations(search_filters, user_prompt)
-        recommendations_json = xml_to_json(recommendations)
+        # A prompt close to an earlier one reuses its answer
+        recommendations_json, similar_prompt = recommend(search_filters, user_prompt)
+        
+        speculate = wants_speculation(data)
+        if speculate:
+            speculate_walkthrough(data, recommendations_json)
         
         return jsonify({
             "success": True,
-            "recommendations": recommendations_json
+            "recommendations": recommendations_json,
+            "similarPrompt": similar_prompt,
+            "walkthroughPrefetched": speculate
         })
     
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }), *error_status(e)
 
 @app.route('/api/ai/walkthrough', methods=['POST'])
 def walkthrough_code():
@@ -72,26 +117,31 @@ def walkthrough_code():
         data = request.get_json()
         user_prompt = data.get('prompt', '')
         options = data.get('options', {})
-        tech_stack = data.get('techStack', '')
+        tech_stack = walkthrough_tech_stack(options, data.get('techStack', ''))
         
-        search_filters = []  # Could be populated from options
+        search_filters = resolve_search_filters(options)
+        job = claim_walkthrough(data)
         
-        code_output = walk_me_through_code_agent(search_filters, tech_stack, user_prompt)
-        code_json = xml_to_json(code_output)
+        if wants_stream(data):
+            if job is not None:
+                deltas = job_deltas(job, lambda: stream_walk_me_through_code_agent(search_filters, tech_stack, user_prompt))
+            else:
+                deltas = stream_walk_me_through_code_agent(search_filters, tech_stack, user_prompt)
+            return Response(stream_code_generation(deltas, WalkthroughAnswer), mimetype='text/event-stream', headers=SSE_HEADERS)
         
-        return jsonify({
-            "success": True,
-            "name": code_json.get("Name", ""),
-            "cli": code_json.get("CLI", ""),
-            "python": code_json.get("python", ""),
-            "conclusion": code_json.get("conclusion", "")
-        })
+        if job is not None:
+            code_output = job_result(job, lambda: walk_me_through_code_agent(search_filters, tech_stack, user_prompt))
+        else:
+            code_output = walk_me_through_code_agent(search_filters, tech_stack, user_prompt)
+        code_json = validate_code_answer(parse_agent_output(code_output, WalkthroughAnswer))
+        
+        return jsonify({"success": True, **format_code_output(code_json)})
     
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }), *error_status(e)
 
 @app.route('/api/ai/custom', methods=['POST'])
 def generate_custom_code():
@@ -100,66 +150,75 @@ def generate_custom_code():
         data = request.get_json()
         user_prompt = data.get('prompt', '')
         search_filters = data.get('searchFilters', [])
-        print("search_filters : " , search_filters )
+        
+        if wants_stream(data):
+            deltas = stream_custom_code_agent(search_filters, user_prompt)
+            return Response(stream_code_generation(deltas, CustomCodeAnswer), mimetype='text/event-stream', headers=SSE_HEADERS)
         
         custom_output = call_custom_code_agent(search_filters, user_prompt)
-        print(f"Raw output from call_custom_code_agent: {custom_output}")
-        print ("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-        custom_json = xml_to_json(custom_output)
+        custom_json = validate_code_answer(parse_agent_output(custom_output, CustomCodeAnswer))
         
-        print(jsonify({
-            "success": True,
-            "name": custom_json.get("Name", ""),
-            "cli": custom_json.get("CLI", ""),
-            "python": custom_json.get("python", ""),
-            "conclusion": custom_json.get("conclusion", "")
-        }))
-        return jsonify({
-            "success": True,
-            "name": custom_json.get("Name", ""),
-            "cli": custom_json.get("CLI", ""),
-            "python": custom_json.get("python", ""),
-            "conclusion": custom_json.get("conclusion", "")
-        })
+        return jsonify({"success": True, **format_code_output(custom_json)})
         
     
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }), *error_status(e)
 
 @app.route('/api/ai/chat', methods=['POST'])
 def chat_with_agent():
     """Handle chat interactions with the agent"""
     try:
         data = request.get_json()
-        agent_id = data.get('agentId')
-        message = data.get('message', '')
-        context_urls = data.get('contextUrls', [])
-        current_code = data.get('currentCode', '')
-        messages_history = data.get('messagesHistory', [])
+        # Fields left out of the request come from the agent's server-side session
+        context_urls, current_code, message, messages_history = chat_inputs(data)
+        edit_mode = data.get('editMode', CHAT_EDIT_MODE) == 'edits'
         
         # Query Perplexity for response
-        response = query_perplexity(context_urls, current_code, message, messages_history)
-        response_json = xml_to_json(response)
+        response_json = chat_turn(context_urls, current_code, message, messages_history, edit_mode)
+        remember_turn(data, response_json)
         
-        return jsonify({
-            "success": True,
-            "response": response_json.get("Response", ""),
-            "requestType": response_json.get("Request_type", ""),
-            "updatedCode": {
-                "cli": response_json.get("CLI", ""),
-                "python": response_json.get("python", "")
-            },
-            "agentName": response_json.get("Name", "")
-        })
+        return jsonify({"success": True, **format_chat_response(response_json)})
     
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }), *error_status(e)
+
+@app.route('/api/ai/chat/stream', methods=['POST'])
+def chat_with_agent_stream():
+    """Chat with the agent, streaming the personality rewrite of the reply as SSE"""
+    # Checked before the stream opens, so a bad request gets a JSON error and not a broken stream
+    try:
+        data = request.get_json()
+        context_urls, current_code, message, messages_history = chat_inputs(data)
+        edit_mode = data.get('editMode', CHAT_EDIT_MODE) == 'edits'
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    def generate():
+        yield STREAM_OPENED
+        try:
+            response_json = chat_turn(context_urls, current_code, message, messages_history, edit_mode)
+            remember_turn(data, response_json)
+            
+            # Code changes are final as soon as the chat agent returns
+            yield format_event("code", {"success": True, **format_chat_code(response_json)})
+            
+            for text in coalesce(stream_personality_response(response_json.get("Response", ""))):
+                yield format_event("delta", {"content": text})
+            yield format_event("done", {"success": True})
+        
+        except Exception as e:
+            yield format_event("error", {"success": False, "error": str(e)})
+    
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
 
 @app.route('/api/ai/tech-review', methods=['POST'])
 def tech_review():
@@ -169,22 +228,17 @@ def tech_review():
         python_script = data.get('pythonScript', '')
         search_context = data.get('searchContext', [])
         
-        review_output = run_tech_review(search_context, python_script)
-        review_json = xml_to_json(review_output)
+        # "chunked" reviews top-level functions and classes separately and reuses the unchanged ones
+        review_output = run_tech_review(search_context, python_script, data.get('reviewMode'))
+        review_json = parse_agent_output(review_output, TechReviewAnswer)
         
-        return jsonify({
-            "success": True,
-            "scriptSummary": review_json.get("ScriptSummary", ""),
-            "technicalImprovements": review_json.get("TechnicalImprovements", ""),
-            "featureSuggestions": review_json.get("FeatureSuggestions", ""),
-            "conclusion": review_json.get("conclusion", "")
-        })
+        return jsonify({"success": True, **format_tech_review(review_json)})
     
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }), *error_status(e)
 
 @app.route('/api/ai/cost-analysis', methods=['POST'])
 def cost_analysis():
@@ -194,27 +248,150 @@ def cost_analysis():
         python_script = data.get('pythonScript', '')
         
         cost_output = run_cost_analysis(python_script)
-        cost_json = xml_to_json(cost_output)
+        cost_json = parse_agent_output(cost_output, CostAnswer)
         
+        return jsonify({"success": True, **format_cost_analysis(cost_json)})
+    
+    except Exception as e:
         return jsonify({
-            "success": True,
-            "analysis": cost_json.get("Analysis", ""),
-            "costEstimation": cost_json.get("CostEstimation", ""),
-            "conclusion": cost_json.get("conclusion", "")
+            "success": False,
+            "error": str(e)
+        }), *error_status(e)
+
+@app.route('/api/ai/finalize', methods=['POST'])
+def finalize_agent():
+    """Run every post-chat review agent concurrently"""
+    try:
+        data = request.get_json()
+        python_script = data.get('pythonScript', '')
+        search_context = data.get('searchContext', [])
+        sections = data.get('sections')
+        
+        results = run_reviews(python_script, search_context, sections)
+        
+        if wants_stream(data):
+            # One NDJSON line per section, flushed as soon as that agent finishes
+            def generate():
+                for section, output, error in results:
+                    yield json.dumps(review_section_result(section, output, error)) + "\n"
+            return Response(generate(), mimetype='application/x-ndjson')
+        
+        sections_json = {}
+        for section, output, error in results:
+            result = review_section_result(section, output, error)
+            del result["section"]
+            sections_json[section] = result
+        
+        return jsonify({
+            "success": all(result["success"] for result in sections_json.values()),
+            **sections_json
         })
     
     except Exception as e:
         return jsonify({
             "success": False,
             "error": str(e)
-        }), 500
+        }), *error_status(e)
+
+@app.route('/api/ai/batch/review', methods=['POST'])
+def batch_review():
+    """Run review agents over many scripts, streaming one NDJSON line per script and analysis"""
+    try:
+        data = request.get_json()
+        calls, item_count = plan_batch(data)
+        
+        return Response(run_batch(calls, item_count), mimetype='application/x-ndjson')
+    
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), *error_status(e)
+
+@app.route('/api/ai/jobs', methods=['POST'])
+def submit_job():
+    """Queue a custom, walkthrough or chat generation and return its job ID"""
+    try:
+        data = request.get_json()
+        job_id = get_job_queue().submit(data.get('kind', ''), data.get('request', {}), job_user(data, request.headers))
+        
+        return jsonify({"success": True, "jobId": job_id, "status": "queued"}), 202
+    
+    except JobQueueFull as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 429
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), *error_status(e)
+
+@app.route('/api/ai/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and result of a queued job"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": f"Unknown job: {job_id}"}), 404
+    return jsonify({"success": True, **job})
+
+@app.route('/api/ai/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    """Follow a queued job's status and progress as SSE"""
+    return Response(job_events(get_job_queue(), job_id), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/api/ai/chat/sessions/<agent_id>', methods=['GET'])
+def get_chat_session(agent_id):
+    """History, current script and context URLs stored for an agent's chat"""
+    store = get_session_store()
+    session = store.get(agent_id) if store is not None else None
+    if session is None:
+        return jsonify({"success": False, "error": f"No chat session for agent {agent_id}"}), 404
+    return jsonify({"success": True, "agentId": agent_id, **session})
+
+@app.route('/api/ai/chat/sessions/<agent_id>', methods=['DELETE'])
+def delete_chat_session(agent_id):
+    """Forget an agent's chat session"""
+    store = get_session_store()
+    return jsonify({"success": True, "deleted": store.delete(agent_id) if store is not None else False})
+
+@app.route('/api/ai/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the agent response cache and the recommendations prompt index"""
+    cache = response_cache.get_cache()
+    flight = single_flight.get_single_flight()
+    index = get_recommendation_index()
+    return jsonify({
+        "enabled": cache is not None,
+        **(cache.stats() if cache is not None else {}),
+        "coalesced": flight.coalesced if flight is not None else 0,
+        "promptIndex": index.stats() if index is not None else None
+    })
+
+@app.route('/api/ai/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latency histograms and upstream token counters in Prometheus format"""
+    return Response(metrics.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
 
 @app.route('/api/ai/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         "status": "healthy",
-        "message": "AI orchestration server is running"
+        "message": "AI orchestration server is running",
+        "upstream": rate_limit.stats(),
+        "routing": model_router.stats()
     })
 
 if __name__ == '__main__':
@@ -222,4 +399,8 @@ if __name__ == '__main__':
     if not os.getenv('PERPLEXITY_API_KEY'):
         print("Warning: PERPLEXITY_API_KEY environment variable not set")
     
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    # Jobs re-queued from a process that died resume now, not on the first job request
+    get_job_queue()
+    
+    # Development server only; use start_ai_server.py for the ASGI deployment
+    app.run(host='0.0.0.0', port=5001, debug=os.getenv('AI_SERVER_DEBUG') == '1')
\ No newline at end of file
@@ -0,0 +1,401 @@
+"""ASGI deployment of the AI orchestration server.
+
+Serves the same routes and JSON shapes as ``app.py``, but every handler is a
+coroutine running on one event loop and awaits the async agent entry
+points. A slow upstream call therefore costs an idle socket instead of a
+whole worker thread. Run it through ``start_ai_server.py``.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import json
+
+from quart import Quart, request, jsonify, Response
+from quart.json.provider import DefaultJSONProvider
+from quart_cors import cors
+
+from chat_agent import achat_turn, CHAT_EDIT_MODE
+from chat_sessions import chat_inputs, remember_turn, get_session_store
+from recommendations_agent import arecommend, get_recommendation_index
+from tech_review_agent import arun_tech_review, AnswerFormat as TechReviewAnswer
+from walk_me_through_code_agent import awalk_me_through_code_agent, astream_walk_me_through_code_agent, AnswerFormat as WalkthroughAnswer
+from cost_agent import arun_cost_analysis, AnswerFormat as CostAnswer
+from custom_code_agent import acall_custom_code_agent, astream_custom_code_agent, AnswerFormat as CustomCodeAnswer
+from personality_agent import astream_personality_response
+from finalize import arun_reviews
+from batch_review import plan_batch, arun_batch
+from doc_registry import resolve_search_filters
+from job_queue import get_job_queue, job_user, ajob_events, JobQueueFull
+from prefetch import wants_speculation, walkthrough_tech_stack, aspeculate_walkthrough, claim_walkthrough, ajob_result, ajob_deltas
+import perplexity_client
+import metrics
+import model_router
+import rate_limit
+import response_cache
+import single_flight
+from responses import (
+    format_code_output, format_chat_response, format_chat_code,
+    format_tech_review, format_cost_analysis, review_section_result, error_status,
+    CodeStream, STREAM_OPENED
+)
+from structured_output import parse_agent_output
+from script_validation import avalidate_code_answer
+from sse import SSE_HEADERS, format_event, acoalesce
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        with metrics.stage("serialization"):
+            return super().dumps(obj, **kwargs)
+
+
+app = Quart(__name__)
+app.json = TimedJSONProvider(app)
+app = cors(app)
+
+
+@app.before_request
+async def start_request_timing():
+    metrics.begin_request(request.endpoint or 'unknown', request.headers.get('X-Server-Timing') == '1')
+    if request.is_json:
+        with metrics.stage("request_parse"):
+            await request.get_json(silent=True)
+
+
+@app.after_request
+async def finish_request_timing(response):
+    timings = metrics.end_request(response.status_code)
+    if timings is not None and timings.server_timing:
+        response.headers['Server-Timing'] = timings.header()
+    if timings is not None and timings.models:
+        response.headers['X-AI-Model'] = ", ".join(timings.models)
+    return response
+
+
+@app.before_serving
+async def start_job_workers():
+    # Jobs re-queued from a process that died resume now, not on the first job request
+    await asyncio.to_thread(get_job_queue)
+
+
+@app.after_serving
+async def close_upstream_client():
+    await perplexity_client.aclose()
+
+
+def wants_stream(data: dict) -> bool:
+    return bool(data.get('stream')) or request.args.get('stream', '').lower() == 'true'
+
+
+def error_response(e: Exception):
+    return jsonify({
+        "success": False,
+        "error": str(e)
+    }), *error_status(e)
+
+
+async def stream_code_generation(deltas, answer_format):
+    """Relay upstream deltas as SSE, plus each JSON field as soon as it completes"""
+    yield STREAM_OPENED
+    stream = CodeStream(answer_format)
+    try:
+        async for delta in deltas:
+            for event in stream.feed(delta):
+                yield event
+        yield await stream.afinish()
+
+    except Exception as e:
+        yield CodeStream.error(e)
+
+
+@app.route('/api/ai/recommendations', methods=['POST'])
+async def get_agent_recommendations():
+    """Get AI recommendations for agent configuration"""
+    try:
+        data = await request.get_json()
+        user_prompt = data.get('prompt', '')
+
+        # A prompt close to an earlier one reuses its answer
+        recommendations_json, similar_prompt = await arecommend([], user_prompt)
+
+        speculate = wants_speculation(data)
+        if speculate:
+            aspeculate_walkthrough(data, recommendations_json)
+
+        return jsonify({
+            "success": True,
+            "recommendations": recommendations_json,
+            "similarPrompt": similar_prompt,
+            "walkthroughPrefetched": speculate
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/walkthrough', methods=['POST'])
+async def walkthrough_code():
+    """Walk through and generate agent code"""
+    try:
+        data = await request.get_json()
+        user_prompt = data.get('prompt', '')
+        options = data.get('options', {})
+        tech_stack = walkthrough_tech_stack(options, data.get('techStack', ''))
+
+        search_filters = resolve_search_filters(options)
+        job = claim_walkthrough(data)
+
+        if wants_stream(data):
+            if job is not None:
+                deltas = ajob_deltas(job, lambda: astream_walk_me_through_code_agent(search_filters, tech_stack, user_prompt))
+            else:
+                deltas = astream_walk_me_through_code_agent(search_filters, tech_stack, user_prompt)
+            return Response(stream_code_generation(deltas, WalkthroughAnswer), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+        if job is not None:
+            code_output = await ajob_result(job, lambda: awalk_me_through_code_agent(search_filters, tech_stack, user_prompt))
+        else:
+            code_output = await awalk_me_through_code_agent(search_filters, tech_stack, user_prompt)
+        code_json = await avalidate_code_answer(parse_agent_output(code_output, WalkthroughAnswer))
+
+        return jsonify({"success": True, **format_code_output(code_json)})
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/custom', methods=['POST'])
+async def generate_custom_code():
+    """Generate custom agent code based on user requirements"""
+    try:
+        data = await request.get_json()
+        user_prompt = data.get('prompt', '')
+        search_filters = data.get('searchFilters', [])
+
+        if wants_stream(data):
+            deltas = astream_custom_code_agent(search_filters, user_prompt)
+            return Response(stream_code_generation(deltas, CustomCodeAnswer), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+        custom_output = await acall_custom_code_agent(search_filters, user_prompt)
+        custom_json = await avalidate_code_answer(parse_agent_output(custom_output, CustomCodeAnswer))
+
+        return jsonify({"success": True, **format_code_output(custom_json)})
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/chat', methods=['POST'])
+async def chat_with_agent():
+    """Handle chat interactions with the agent"""
+    try:
+        data = await request.get_json()
+        # Fields left out of the request come from the agent's server-side session
+        context_urls, current_code, message, messages_history = await asyncio.to_thread(chat_inputs, data)
+        edit_mode = data.get('editMode', CHAT_EDIT_MODE) == 'edits'
+
+        response_json = await achat_turn(context_urls, current_code, message, messages_history, edit_mode)
+        await asyncio.to_thread(remember_turn, data, response_json)
+
+        return jsonify({"success": True, **format_chat_response(response_json)})
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/chat/stream', methods=['POST'])
+async def chat_with_agent_stream():
+    """Chat with the agent, streaming the personality rewrite of the reply as SSE"""
+    # Checked before the stream opens, so a bad request gets a JSON error and not a broken stream
+    try:
+        data = await request.get_json()
+        context_urls, current_code, message, messages_history = await asyncio.to_thread(chat_inputs, data)
+        edit_mode = data.get('editMode', CHAT_EDIT_MODE) == 'edits'
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+
+    async def generate():
+        yield STREAM_OPENED
+        try:
+            response_json = await achat_turn(context_urls, current_code, message, messages_history, edit_mode)
+            await asyncio.to_thread(remember_turn, data, response_json)
+
+            yield format_event("code", {"success": True, **format_chat_code(response_json)})
+
+            async for text in acoalesce(astream_personality_response(response_json.get("Response", ""))):
+                yield format_event("delta", {"content": text})
+            yield format_event("done", {"success": True})
+
+        except Exception as e:
+            yield format_event("error", {"success": False, "error": str(e)})
+
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@app.route('/api/ai/tech-review', methods=['POST'])
+async def tech_review():
+    """Analyze agent code for technical improvements"""
+    try:
+        data = await request.get_json()
+        python_script = data.get('pythonScript', '')
+        search_context = data.get('searchContext', [])
+
+        # "chunked" reviews top-level functions and classes separately and reuses the unchanged ones
+        review_output = await arun_tech_review(search_context, python_script, data.get('reviewMode'))
+        review_json = parse_agent_output(review_output, TechReviewAnswer)
+
+        return jsonify({"success": True, **format_tech_review(review_json)})
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/cost-analysis', methods=['POST'])
+async def cost_analysis():
+    """Analyze cost implications of the agent"""
+    try:
+        data = await request.get_json()
+        python_script = data.get('pythonScript', '')
+
+        cost_output = await arun_cost_analysis(python_script)
+        cost_json = parse_agent_output(cost_output, CostAnswer)
+
+        return jsonify({"success": True, **format_cost_analysis(cost_json)})
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/finalize', methods=['POST'])
+async def finalize_agent():
+    """Run every post-chat review agent concurrently"""
+    try:
+        data = await request.get_json()
+        python_script = data.get('pythonScript', '')
+        search_context = data.get('searchContext', [])
+        sections = data.get('sections')
+
+        results = arun_reviews(python_script, search_context, sections)
+
+        if wants_stream(data):
+            async def generate():
+                async for section, output, error in results:
+                    yield json.dumps(review_section_result(section, output, error)) + "\n"
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        sections_json = {}
+        async for section, output, error in results:
+            result = review_section_result(section, output, error)
+            del result["section"]
+            sections_json[section] = result
+
+        return jsonify({
+            "success": all(result["success"] for result in sections_json.values()),
+            **sections_json
+        })
+
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/batch/review', methods=['POST'])
+async def batch_review():
+    """Run review agents over many scripts, streaming one NDJSON line per script and analysis"""
+    try:
+        data = await request.get_json()
+        calls, item_count = plan_batch(data)
+
+        return Response(arun_batch(calls, item_count), mimetype='application/x-ndjson')
+
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/jobs', methods=['POST'])
+async def submit_job():
+    """Queue a custom, walkthrough or chat generation and return its job ID"""
+    try:
+        data = await request.get_json()
+        user = job_user(data, request.headers)
+        job_id = await asyncio.to_thread(lambda: get_job_queue().submit(data.get('kind', ''), data.get('request', {}), user))
+
+        return jsonify({"success": True, "jobId": job_id, "status": "queued"}), 202
+
+    except JobQueueFull as e:
+        return jsonify({"success": False, "error": str(e)}), 429
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return error_response(e)
+
+
+@app.route('/api/ai/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """Status, progress and result of a queued job"""
+    job = await asyncio.to_thread(lambda: get_job_queue().get(job_id))
+    if job is None:
+        return jsonify({"success": False, "error": f"Unknown job: {job_id}"}), 404
+    return jsonify({"success": True, **job})
+
+
+@app.route('/api/ai/jobs/<job_id>/events', methods=['GET'])
+async def get_job_events(job_id):
+    """Follow a queued job's status and progress as SSE"""
+    queue = await asyncio.to_thread(get_job_queue)
+    return Response(ajob_events(queue, job_id), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@app.route('/api/ai/chat/sessions/<agent_id>', methods=['GET'])
+async def get_chat_session(agent_id):
+    """History, current script and context URLs stored for an agent's chat"""
+    store = await asyncio.to_thread(get_session_store)
+    session = await asyncio.to_thread(store.get, agent_id) if store is not None else None
+    if session is None:
+        return jsonify({"success": False, "error": f"No chat session for agent {agent_id}"}), 404
+    return jsonify({"success": True, "agentId": agent_id, **session})
+
+
+@app.route('/api/ai/chat/sessions/<agent_id>', methods=['DELETE'])
+async def delete_chat_session(agent_id):
+    """Forget an agent's chat session"""
+    store = await asyncio.to_thread(get_session_store)
+    deleted = await asyncio.to_thread(store.delete, agent_id) if store is not None else False
+    return jsonify({"success": True, "deleted": deleted})
+
+
+@app.route('/api/ai/cache/stats', methods=['GET'])
+async def cache_stats():
+    """Hit/miss counters for the agent response cache and the recommendations prompt index"""
+    cache = response_cache.get_cache()
+    flight = single_flight.get_single_flight()
+    index = get_recommendation_index()
+    stats = await asyncio.to_thread(cache.stats) if cache is not None else {}
+    return jsonify({
+        "enabled": cache is not None,
+        **stats,
+        "coalesced": flight.coalesced if flight is not None else 0,
+        "promptIndex": index.stats() if index is not None else None
+    })
+
+
+@app.route('/api/ai/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Stage latency histograms and upstream token counters in Prometheus format"""
+    return Response(metrics.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/api/ai/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    return jsonify({
+        "status": "healthy",
+        "message": "AI orchestration server is running",
+        "upstream": rate_limit.stats(),
+        "routing": model_router.stats()
+    })
@@ -0,0 +1,141 @@
+"""Review agents run over many scripts in one request, for ``/api/ai/batch/review``.
+
+Each script is paired with every requested analysis (any section of
+``finalize.REVIEW_AGENTS``). Identical scripts are reviewed once and the
+result is reported for each of them. At most ``AI_BATCH_CONCURRENCY``
+upstream calls run at a time (in each request, and across requests on the
+shared thread pool), so a large batch is paced by the rate limiter rather
+than rejected by it, and one NDJSON line is produced per script and
+analysis as soon as its call completes. A failed call only fails its own
+lines.
+"""
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from finalize import REVIEW_AGENTS, check_sections
+from responses import review_section_result
+
+BATCH_CONCURRENCY = int(os.getenv("AI_BATCH_CONCURRENCY", "8"))
+BATCH_MAX_SCRIPTS = int(os.getenv("AI_BATCH_MAX_SCRIPTS", "500"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_batch_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool for the sync batch route, created on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch-review")
+    return _executor
+
+
+def _script_key(python_script: str, search_context: list) -> str:
+    canonical = json.dumps([python_script, search_context], ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def plan_batch(data: dict) -> tuple:
+    """Validate a batch request and group it into unique calls.
+
+    Returns ``(calls, item_count)`` where ``calls`` maps ``(script key,
+    section)`` to ``(python_script, search_context, [item ids])``.
+    """
+    scripts = data.get('scripts')
+    if not isinstance(scripts, list) or not scripts:
+        raise ValueError("'scripts' must be a non-empty list")
+    if len(scripts) > BATCH_MAX_SCRIPTS:
+        raise ValueError(f"At most {BATCH_MAX_SCRIPTS} scripts can be reviewed in one batch")
+    sections = check_sections(data.get('analyses'))
+    calls = {}
+    for index, item in enumerate(scripts):
+        if isinstance(item, str):
+            item = {"pythonScript": item}
+        if not isinstance(item, dict) or not isinstance(item.get('pythonScript'), str):
+            raise ValueError(f"Script {index} has no 'pythonScript'")
+        item_id = item.get('id', index)
+        search_context = item.get('searchContext', data.get('searchContext', []))
+        key = _script_key(item['pythonScript'], search_context)
+        for section in sections:
+            calls.setdefault((key, section), (item['pythonScript'], search_context, []))[2].append(item_id)
+    return calls, len(scripts)
+
+
+def _result_lines(ids: list, section: str, output, error) -> list:
+    result = review_section_result(section, output, error)
+    return [json.dumps({"id": item_id, **result}) + "\n" for item_id in ids]
+
+
+def _summary_line(item_count: int, calls: dict, failed: int) -> str:
+    return json.dumps({"done": True, "scripts": item_count, "calls": len(calls), "failedCalls": failed}) + "\n"
+
+
+def run_batch(calls: dict, item_count: int):
+    """Yield NDJSON lines in completion order, then a summary line.
+
+    Only ``BATCH_CONCURRENCY`` calls are submitted at a time, so a large batch
+    does not queue its whole backlog on the shared pool.
+    """
+    executor = get_batch_executor()
+    queued = deque(calls.items())
+    futures = {}
+
+    def top_up():
+        while queued and len(futures) < BATCH_CONCURRENCY:
+            (_key, section), (python_script, search_context, ids) = queued.popleft()
+            # Each call runs in a copy of the caller's context so its metrics are attributed to the request
+            future = executor.submit(contextvars.copy_context().run, REVIEW_AGENTS[section][0], python_script, search_context)
+            futures[future] = (section, ids)
+
+    failed = 0
+    try:
+        top_up()
+        while futures:
+            done, _running = wait(futures, return_when=FIRST_COMPLETED)
+            finished = [(future, *futures.pop(future)) for future in done]
+            top_up()
+            for future, section, ids in finished:
+                error = future.exception()
+                failed += error is not None
+                yield from _result_lines(ids, section, None if error else future.result(), error)
+    finally:
+        # The client went away; drop the calls that have not started
+        for future in futures:
+            future.cancel()
+    yield _summary_line(item_count, calls, failed)
+
+
+async def arun_batch(calls: dict, item_count: int):
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def review(section, python_script, search_context):
+        async with semaphore:
+            return await REVIEW_AGENTS[section][1](python_script, search_context)
+
+    tasks = {
+        asyncio.ensure_future(review(section, python_script, search_context)): (section, ids)
+        for (_key, section), (python_script, search_context, ids) in calls.items()
+    }
+    pending = set(tasks)
+    failed = 0
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                section, ids = tasks[task]
+                error = task.exception()
+                failed += error is not None
+                for line in _result_lines(ids, section, None if error else task.result(), error):
+                    yield line
+    finally:
+        for task in pending:
+            task.cancel()
+    yield _summary_line(item_count, calls, failed)
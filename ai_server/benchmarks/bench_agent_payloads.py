@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Benchmark agent payload construction and server import time.
+
+Per request, each agent's ``build_*_payload`` is compared with the previous
+approach of regenerating the ``AnswerFormat`` JSON schema and re-assembling
+the whole payload on every call. For cold start, importing the Flask and ASGI
+apps is timed in fresh interpreters, with httpx imported up front (as before)
+and lazily (as now).
+
+    python benchmarks/bench_agent_payloads.py [--repeat 2000] [--imports 7]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import timeit
+
+AI_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_SERVER_DIR)
+
+import chat_agent
+import cost_agent
+import custom_code_agent
+import recommendations_agent
+import tech_review_agent
+import walk_me_through_code_agent
+
+HISTORY = [{"role": "user", "content": "How do I add memory?"}, {"role": "assistant", "content": "Use a buffer."}]
+CODE = "import os\n\nprint('agent')\n" * 50
+
+
+def per_call_payload(module, template: dict, messages: list, **fields) -> dict:
+    """The payload as the agents used to build it: schema regenerated, every dict rebuilt."""
+    return {
+        "model": template["model"],
+        "messages": [dict(message) for message in messages],
+        **{key: dict(value) if isinstance(value, dict) else value for key, value in template.items()
+           if key not in ("model", "response_format")},
+        **fields,
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"schema": module.AnswerFormat.model_json_schema()},
+        },
+    }
+
+
+CASES = [
+    ("tech_review",
+     lambda: tech_review_agent.build_tech_review_payload(["https://docs.example.com"], CODE),
+     lambda: per_call_payload(tech_review_agent, tech_review_agent.PAYLOAD_TEMPLATE,
+                              [tech_review_agent.SYSTEM_MESSAGE, {"role": "user", "content": CODE}],
+                              search_domain_filter=["https://docs.example.com"])),
+    ("cost_analysis",
+     lambda: cost_agent.build_cost_analysis_payload(CODE),
+     lambda: per_call_payload(cost_agent, cost_agent.PAYLOAD_TEMPLATE,
+                              [cost_agent.SYSTEM_MESSAGE, {"role": "user", "content": CODE}])),
+    ("recommendations",
+     lambda: recommendations_agent.build_recommendations_payload("", "A research assistant"),
+     lambda: per_call_payload(recommendations_agent, recommendations_agent.PAYLOAD_TEMPLATE,
+                              [recommendations_agent.SYSTEM_MESSAGE, {"role": "user", "content": "A research assistant"}])),
+    ("walkthrough",
+     lambda: walk_me_through_code_agent.build_walk_me_through_payload([], "{}", "A research assistant"),
+     lambda: per_call_payload(walk_me_through_code_agent, walk_me_through_code_agent.PAYLOAD_TEMPLATE,
+                              [walk_me_through_code_agent.SYSTEM_MESSAGE, {"role": "user", "content": "A research assistant"}],
+                              search_domain_filter=[])),
+    ("custom_code",
+     lambda: custom_code_agent.build_custom_code_payload([], "A research assistant"),
+     lambda: per_call_payload(custom_code_agent, custom_code_agent.PAYLOAD_TEMPLATE,
+                              [custom_code_agent.SYSTEM_MESSAGE, {"role": "user", "content": "A research assistant"}],
+                              search_domain_filter=[])),
+    ("chat",
+     lambda: chat_agent.build_chat_payload([], CODE, "Add memory", HISTORY),
+     lambda: per_call_payload(chat_agent, chat_agent.PAYLOAD_TEMPLATE,
+                              [chat_agent.SYSTEM_MESSAGE, *HISTORY, {"role": "user", "content": CODE}],
+                              search_domain_filter=[])),
+]
+
+
+def import_ms(modules: str, preload: str) -> float:
+    """Milliseconds to import ``modules`` in a fresh interpreter that has already imported ``preload``."""
+    script = (
+        f"import time\nimport {preload}\n"
+        f"started = time.perf_counter()\nimport {modules}\n"
+        "print((time.perf_counter() - started) * 1000)\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=AI_SERVER_DIR, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="payload builds per timing")
+    parser.add_argument("--imports", type=int, default=7, help="fresh interpreters per import timing")
+    args = parser.parse_args()
+
+    print(f"{'agent':>16} {'per-call us':>12} {'prebuilt us':>12} {'speedup':>8}")
+    for name, build, rebuild in CASES:
+        old = min(timeit.repeat(rebuild, number=args.repeat, repeat=3)) / args.repeat
+        new = min(timeit.repeat(build, number=args.repeat, repeat=3)) / args.repeat
+        print(f"{name:>16} {old * 1e6:>12.1f} {new * 1e6:>12.1f} {old / new:>7.1f}x")
+
+    print()
+    print(f"{'import':>16} {'eager httpx ms':>15} {'lazy httpx ms':>14}")
+    for module, framework in (("app", "flask"), ("asgi_app", "quart")):
+        # The web framework is imported beforehand in both runs, so only the server's own imports are compared
+        eager = statistics.median(import_ms(f"httpx, {module}", framework) for _ in range(args.imports))
+        lazy = statistics.median(import_ms(module, framework) for _ in range(args.imports))
+        print(f"{module:>16} {eager:>15.1f} {lazy:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Benchmark the static cost estimate of generated agent scripts.
+
+A synthetic script with a given number of helper functions, each making an
+LLM or embedding call, is estimated and rendered repeatedly; the time per
+script is what a cost analysis takes instead of a ``sonar-pro`` call.
+
+    python benchmarks/bench_cost_estimator.py [--functions 40] [--runs 50]
+"""
+import argparse
+import os
+import sys
+import time
+
+AI_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_SERVER_DIR)
+
+import cost_estimator
+
+HEADER = '''import os
+from openai import OpenAI
+from anthropic import Anthropic
+
+SYSTEM_PROMPT = """You are a careful research assistant. Answer with citations and keep it short."""
+openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+anthropic_client = Anthropic()
+'''
+CALLS = [
+    '''    reply = openai_client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[{{"role": "system", "content": SYSTEM_PROMPT}}, {{"role": "user", "content": text}}],
+        max_tokens={limit},
+    )
+    return reply.choices[0].message.content''',
+    '''    reply = anthropic_client.messages.create(
+        model="claude-3-5-haiku-latest", max_tokens={limit}, system=SYSTEM_PROMPT,
+        messages=[{{"role": "user", "content": text}}],
+    )
+    return reply.content[0].text''',
+    '''    vectors = []
+    for part in text.split("\\n\\n"):
+        vectors.append(openai_client.embeddings.create(model="text-embedding-3-small", input=part))
+    return vectors''',
+]
+
+
+def synthetic_script(functions: int) -> str:
+    parts = [HEADER]
+    for index in range(functions):
+        body = CALLS[index % len(CALLS)].format(limit=200 + index)
+        parts.append(f"\n\ndef step_{index}(text):\n    '''Step {index} of the pipeline.'''\n{body}\n")
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", type=int, default=40, help="helper functions in the script")
+    parser.add_argument("--runs", type=int, default=50, help="estimates per timing")
+    args = parser.parse_args()
+
+    script = synthetic_script(args.functions)
+    cost_estimator.load_pricing()
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        result = cost_estimator.estimate(script)
+        cost_estimator.render(result)
+        cost_estimator.conclusion(result)
+    elapsed = (time.perf_counter() - started) / args.runs
+    print(f"{len(script.splitlines())} lines, {len(result['components'])} priced models: "
+          f"{elapsed * 1000:.2f} ms per estimate, ${result['monthly']['Moderate']:,.2f}/month at Moderate traffic")
+
+
+if __name__ == "__main__":
+    main()
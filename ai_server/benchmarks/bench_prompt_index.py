@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Benchmark lookups in a full recommendations prompt index.
+
+The index is filled with synthetic prompts, then near-duplicate and unrelated
+prompts are looked up; the lookup time is what a reused recommendation
+costs instead of an upstream ``sonar-pro`` call.
+
+    python benchmarks/bench_prompt_index.py [--entries 2000] [--lookups 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+AI_SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AI_SERVER_DIR)
+
+from prompt_index import PromptIndex
+
+TASKS = ["chat with", "summarize", "answer questions about", "search", "monitor", "classify", "translate", "extract data from"]
+SUBJECTS = ["my PDFs", "research papers", "customer emails", "YouTube videos", "news sites", "invoices", "Slack threads",
+            "legal contracts", "product reviews", "GitHub issues", "support tickets", "meeting notes"]
+AUDIENCES = ["for my team", "for students", "for a law firm", "for my shop", "every morning", "in Spanish", "with citations"]
+
+
+def synthetic_prompts(count: int, rng: random.Random) -> list:
+    return [f"{rng.choice(TASKS)} {rng.choice(SUBJECTS)} {rng.choice(AUDIENCES)} #{index}" for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=2000, help="prompts in the index")
+    parser.add_argument("--lookups", type=int, default=500, help="lookups per timing")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    index = PromptIndex("bench", path=None, max_entries=args.entries)
+    prompts = synthetic_prompts(args.entries, rng)
+    started = time.perf_counter()
+    for prompt in prompts:
+        index.add(prompt, {"core_concept": prompt})
+    print(f"filled {args.entries} entries in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    near = [f"An agent to {rng.choice(prompts)}" for _ in range(args.lookups)]
+    unrelated = [f"play chess against {rng.choice(AUDIENCES)}" for _ in range(args.lookups)]
+    for name, queries in (("near-duplicate", near), ("unrelated", unrelated)):
+        started = time.perf_counter()
+        hits = sum(index.lookup(query) is not None for query in queries)
+        elapsed = (time.perf_counter() - started) / len(queries)
+        print(f"{name:>16}: {elapsed * 1e6:8.1f} us per lookup, {hits}/{len(queries)} reused")
+
+
+if __name__ == "__main__":
+    main()
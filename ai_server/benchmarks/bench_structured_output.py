@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""Benchmark structured_output.parse_agent_output on large reasoning-model responses.
+
+Compares it with the previous regex-strip-then-json.loads approach on
+responses with a multi-hundred-KB <think> block, for each think size given.
+
+    python benchmarks/bench_structured_output.py [--sizes 100 300 800] [--repeat 50]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_output import parse_agent_output
+from custom_code_agent import AnswerFormat
+
+
+def regex_parse(text: str) -> dict:
+    cleaned = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip()
+    return json.loads(cleaned)
+
+
+def make_response(think_kb: int, script_kb: int = 40) -> str:
+    thought = "Let me consider the {framework} docs and the retrieval step carefully. "
+    think = (thought * (think_kb * 1024 // len(thought) + 1))[:think_kb * 1024]
+    script = ("def step(x):\n    return {'value': x}\n\n" * (script_kb * 1024 // 40 + 1))[:script_kb * 1024]
+    answer = {"Name": "Bench Bot", "CLI": "pip install httpx", "python": script, "conclusion": "Done?"}
+    return "<think>" + think + "</think>\n```json\n" + json.dumps(answer) + "\n```"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 800], help="think block sizes in KB")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'think KB':>9} {'total KB':>9} {'regex+loads ms':>15} {'parse_agent_output ms':>22} {'speedup':>8}")
+    for size in args.sizes:
+        text = make_response(size)
+        assert parse_agent_output(text, AnswerFormat)["Name"] == "Bench Bot"
+        # The old parser cannot handle the markdown fence, so time it on the unfenced text
+        unfenced = text.replace("```json\n", "").replace("\n```", "")
+        old = min(timeit.repeat(lambda: regex_parse(unfenced), number=args.repeat, repeat=3)) / args.repeat
+        new = min(timeit.repeat(lambda: parse_agent_output(text, AnswerFormat), number=args.repeat, repeat=3)) / args.repeat
+        print(f"{size:>9} {len(text) // 1024:>9} {old * 1000:>15.3f} {new * 1000:>22.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
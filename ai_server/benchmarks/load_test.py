@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""End-to-end load test for the AI orchestration server.
+
+Drives every route at a target concurrency and reports, per route,
+throughput and p50/p95/p99 latency (plus time to the first SSE event for
+streaming routes), and for the server process its peak RSS, peak thread
+count and mean in-flight requests (Little's law: throughput x latency).
+
+Run it against a server that already points at the mock upstream:
+
+    python benchmarks/load_test.py --url http://127.0.0.1:5001 --concurrency 32 --duration 30
+
+or let it start the mock and the server itself, in either deployment mode:
+
+    python benchmarks/load_test.py --spawn asgi --concurrency 64 --mock-args "--latency lognormal:800,0.4 --error-429 0.02"
+
+Prompts are made unique per request by default so the response cache and
+single-flight coalescing do not hide the upstream path; pass --repeat-prompts
+to measure them instead.
+"""
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import mock_perplexity
+
+REPO_ROOT = os.path.dirname(os.path.dirname(BENCH_DIR))
+
+# The mock has no quota, so spawned servers get limits far above the load offered
+UNLIMITED = {"rpm": 10 ** 6, "tpm": 10 ** 9}
+SPAWN_RATE_LIMITS = json.dumps({model: UNLIMITED for model in ("sonar", "sonar-pro", "sonar-reasoning-pro", "default")})
+
+SCRIPT = mock_perplexity.SAMPLE_SCRIPT
+HISTORY = [
+    {"role": "user", "content": "Build me a research agent"},
+    {"role": "assistant", "content": "Here is a first version of the agent."},
+]
+
+
+def _body(route: str, n: int) -> dict:
+    prompt = f"Build an agent that summarises support tickets #{n}"
+    if route == "recommendations":
+        return {"prompt": prompt}
+    if route in ("walkthrough", "walkthrough-stream"):
+        return {"prompt": prompt, "techStack": "LangChain, OpenAI, Chroma"}
+    if route in ("custom", "custom-stream"):
+        return {"prompt": prompt, "searchFilters": ["python.langchain.com"]}
+    if route in ("chat", "chat-stream"):
+        return {"message": prompt, "contextUrls": [], "currentCode": SCRIPT, "messagesHistory": HISTORY}
+    if route in ("tech-review", "finalize"):
+        return {"pythonScript": SCRIPT + f"\n# {n}\n", "searchContext": []}
+    if route == "cost-analysis":
+        return {"pythonScript": SCRIPT + f"\n# {n}\n"}
+    return {}
+
+
+# route name -> (method, path, streams)
+ROUTES = {
+    "recommendations": ("POST", "/api/ai/recommendations", False),
+    "walkthrough": ("POST", "/api/ai/walkthrough", False),
+    "walkthrough-stream": ("POST", "/api/ai/walkthrough?stream=true", True),
+    "custom": ("POST", "/api/ai/custom", False),
+    "custom-stream": ("POST", "/api/ai/custom?stream=true", True),
+    "chat": ("POST", "/api/ai/chat", False),
+    "chat-stream": ("POST", "/api/ai/chat/stream", True),
+    "tech-review": ("POST", "/api/ai/tech-review", False),
+    "cost-analysis": ("POST", "/api/ai/cost-analysis", False),
+    "finalize": ("POST", "/api/ai/finalize", False),
+    "health": ("GET", "/api/ai/health", False),
+}
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.first_event = []
+        self.errors = defaultdict(int)
+
+
+class ProcessSampler(threading.Thread):
+    """Sample RSS and thread count of a server process from /proc."""
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_kb = 0
+        self.peak_threads = 0
+        self.stopped = threading.Event()
+
+    def _read(self):
+        values = {}
+        with open(f"/proc/{self.pid}/status") as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "Threads"):
+                    values[key] = int(value.split()[0])
+        return values
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                values = self._read()
+            except OSError:
+                return
+            self.peak_rss_kb = max(self.peak_rss_kb, values.get("VmRSS", 0))
+            self.peak_threads = max(self.peak_threads, values.get("Threads", 0))
+
+
+def run_request(client: httpx.Client, base_url: str, route: str, n: int, stats: RouteStats):
+    method, path, streams = ROUTES[route]
+    started = time.perf_counter()
+    try:
+        if streams:
+            with client.stream(method, base_url + path, json=_body(route, n)) as response:
+                first = None
+                outcome = None
+                for line in response.iter_lines():
+                    if line.startswith("event:"):
+                        if first is None:
+                            first = time.perf_counter() - started
+                        outcome = line[6:].strip()
+                if first is not None:
+                    stats.first_event.append(first)
+                if response.status_code != 200 or outcome != "done":
+                    stats.errors[outcome or str(response.status_code)] += 1
+        else:
+            response = client.request(method, base_url + path, json=_body(route, n) if method == "POST" else None)
+            if response.status_code != 200:
+                stats.errors[str(response.status_code)] += 1
+            elif response.json().get("success") is False:
+                stats.errors["success=false"] += 1
+    except httpx.HTTPError as e:
+        stats.errors[type(e).__name__] += 1
+    stats.latencies.append(time.perf_counter() - started)
+
+
+def run_load(base_url: str, routes: list, concurrency: int, duration: float, total: int, unique: bool):
+    stats = {route: RouteStats() for route in routes}
+    counter = iter(range(10 ** 12))
+    counter_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    client = httpx.Client(timeout=httpx.Timeout(600, connect=10), limits=limits)
+
+    def worker():
+        while True:
+            with counter_lock:
+                n = next(counter)
+            if (total and n >= total) or (not total and time.perf_counter() >= deadline):
+                return
+            route = routes[n % len(routes)]
+            run_request(client, base_url, route, n if unique else 0, stats[route])
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    client.close()
+    return stats, time.perf_counter() - started
+
+
+def report(stats: dict, wall: float, sampler: ProcessSampler = None, upstream: dict = None):
+    print(f"{'route':<20}{'reqs':>7}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'first ev p50':>14}")
+    all_latencies = []
+    for route, route_stats in stats.items():
+        latencies = route_stats.latencies
+        all_latencies.extend(latencies)
+        first = f"{percentile(route_stats.first_event, 50) * 1000:.0f}" if route_stats.first_event else "-"
+        print(
+            f"{route:<20}{len(latencies):>7}{sum(route_stats.errors.values()):>6}{len(latencies) / wall:>9.1f}"
+            f"{percentile(latencies, 50) * 1000:>10.0f}{percentile(latencies, 95) * 1000:>10.0f}"
+            f"{percentile(latencies, 99) * 1000:>10.0f}{first:>14}"
+        )
+        for kind, count in sorted(route_stats.errors.items()):
+            print(f"{'':<4}{kind}: {count}")
+    print(f"\ntotal: {len(all_latencies)} requests in {wall:.1f}s = {len(all_latencies) / wall:.1f} req/s")
+    print(f"mean in-flight (server concurrency): {sum(all_latencies) / wall:.1f}")
+    if sampler is not None:
+        print(f"server peak RSS: {sampler.peak_rss_kb / 1024:.1f} MiB, peak threads: {sampler.peak_threads}")
+    if upstream:
+        calls = upstream.get("requests", 0)
+        mean_upstream = upstream.get("upstream_seconds", 0) / calls * 1000 if calls else 0
+        print(
+            f"upstream: {calls} calls, {upstream.get('429', 0)} x 429, {upstream.get('5xx', 0)} x 5xx,"
+            f" mean upstream latency {mean_upstream:.0f} ms"
+        )
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_healthy(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(base_url + "/api/ai/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not become healthy in time")
+
+
+def spawn(mode: str, mock_args: str, workers: int):
+    """Start the mock upstream in-process and the server as a subprocess."""
+    mock = mock_perplexity.start(mock_perplexity.build_arg_parser().parse_args(shlex.split(mock_args) + ["--port", "0"]))
+    port = _free_port()
+    env = {
+        **os.environ,
+        "PERPLEXITY_API_URL": f"http://127.0.0.1:{mock.server_port}/chat/completions",
+        "PERPLEXITY_API_KEY": os.getenv("PERPLEXITY_API_KEY", "mock"),
+        "PERPLEXITY_HTTP2": "0",
+        "PERPLEXITY_RATE_LIMITS": os.getenv("PERPLEXITY_RATE_LIMITS", SPAWN_RATE_LIMITS),
+        "AI_SERVER_MODE": mode,
+        "AI_SERVER_HOST": "127.0.0.1",
+        "AI_SERVER_PORT": str(port),
+        "AI_SERVER_WORKERS": str(workers),
+        "AI_SERVER_LOG_LEVEL": "warning",
+    }
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_ROOT, "start_ai_server.py")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_healthy(base_url, process)
+    except Exception:
+        process.kill()
+        raise
+    return base_url, process, mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5001", help="server to test when not spawning one")
+    parser.add_argument("--spawn", choices=["asgi", "flask"], help="start the mock upstream and this server mode")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --spawn asgi")
+    parser.add_argument("--mock-args", default="--latency lognormal:800,0.4", help="options for mock_perplexity.py")
+    parser.add_argument("--server-pid", type=int, help="sample memory and threads of this process")
+    parser.add_argument("--routes", nargs="+", default=list(ROUTES), choices=list(ROUTES))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests")
+    parser.add_argument("--repeat-prompts", action="store_true", help="send identical prompts on every request")
+    args = parser.parse_args()
+
+    process = mock = None
+    base_url = args.url.rstrip("/")
+    pid = args.server_pid
+    if args.spawn:
+        base_url, process, mock = spawn(args.spawn, args.mock_args, args.workers)
+        pid = process.pid
+
+    sampler = None
+    if pid and os.path.exists(f"/proc/{pid}/status"):
+        sampler = ProcessSampler(pid)
+        sampler.start()
+
+    try:
+        stats, wall = run_load(base_url, args.routes, args.concurrency, args.duration, args.requests, not args.repeat_prompts)
+        upstream = None
+        if mock is not None:
+            upstream = httpx.get(f"http://127.0.0.1:{mock.server_port}/stats").json()
+        if sampler is not None:
+            sampler.stopped.set()
+            sampler.join()
+        print(f"{args.spawn or base_url}: concurrency {args.concurrency}\n")
+        report(stats, wall, sampler, upstream)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if mock is not None:
+            mock.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Local stand-in for the Perplexity /chat/completions endpoint.
+
+Answers every request with JSON that conforms to the request's
+``response_format`` schema (plain prose when there is none), so all agents
+and routes run end to end without paid upstream calls. Latency, streaming
+pace, think-block size and injected 429/5xx errors are configurable.
+
+    python benchmarks/mock_perplexity.py --port 18080 --latency lognormal:800,0.4 --error-429 0.02
+    PERPLEXITY_API_URL=http://127.0.0.1:18080/chat/completions python ../start_ai_server.py
+
+Latency specs are in milliseconds: ``constant:MS``, ``uniform:LOW,HIGH`` or
+``lognormal:MEDIAN,SIGMA``. ``GET /stats`` returns request and error counts.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_SCRIPT = '''import os
+
+import requests
+
+
+def run(query: str) -> str:
+    """Answer a query with the configured model."""
+    response = requests.post(
+        "https://api.perplexity.ai/chat/completions",
+        headers={"Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"},
+        json={"model": "sonar", "messages": [{"role": "user", "content": query}]},
+        timeout=60,
+    )
+    return response.json()["choices"][0]["message"]["content"]
+
+
+if __name__ == "__main__":
+    print(run("hello"))
+'''
+
+# Values for well-known answer fields; every other string field gets filler text
+FIELD_VALUES = {
+    "python": SAMPLE_SCRIPT,
+    "CLI": "pip install requests",
+    "Request_type": "Cross_questioning",
+    "Name": "Mock Agent",
+    "framework": "LangChain",
+    "LLM_provider": "OpenAI",
+    "Embedder": "OpenAI",
+    "Database_used": "Chroma",
+    "Tool_use": "Tavily",
+    "approach": "RAG",
+}
+
+
+def parse_latency(spec: str):
+    """Return a zero-argument sampler of delays in seconds for a latency spec."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "constant":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        mu, sigma = math.log(values[0] / 1000), values[1]
+        return lambda: random.lognormvariate(mu, sigma)
+    raise ValueError(f"Unknown latency spec: {spec!r}")
+
+
+def _resolve(schema: dict, root: dict) -> dict:
+    ref = schema.get("$ref")
+    if ref is None:
+        return schema
+    node = root
+    for part in ref.lstrip("#/").split("/"):
+        node = node[part]
+    return node
+
+
+def sample_value(name: str, schema: dict, root: dict, filler: str):
+    """Build a value for ``name`` that validates against ``schema``."""
+    schema = _resolve(schema, root)
+    kind = schema.get("type")
+    if kind == "object" or "properties" in schema:
+        return {key: sample_value(key, sub, root, filler) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample_value(name, schema.get("items", {}), root, filler)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return True
+    return FIELD_VALUES.get(name, filler)
+
+
+def build_answer(payload: dict, think_chars: int, filler: str) -> str:
+    schema = ((payload.get("response_format") or {}).get("json_schema") or {}).get("schema")
+    think = "<think>" + ("Considering the request. " * (think_chars // 24 + 1))[:think_chars] + "</think>\n" if think_chars else ""
+    if schema is None:
+        return filler
+    return think + json.dumps(sample_value("", schema, schema, filler))
+
+
+class MockState:
+    def __init__(self, args):
+        self.latency = parse_latency(args.latency)
+        self.ttft = parse_latency(args.ttft) if args.ttft else self.latency
+        self.chunk_delay = args.chunk_delay_ms / 1000
+        self.chunk_chars = args.chunk_chars
+        self.think_chars = args.think_kb * 1024
+        self.filler = "Mock analysis. " * args.filler_repeat
+        self.error_429 = args.error_429
+        self.error_5xx = args.error_5xx
+        self.retry_after = args.retry_after
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "streams": 0, "429": 0, "5xx": 0, "upstream_seconds": 0.0}
+
+    def count(self, key: str, amount=1):
+        with self.lock:
+            self.counts[key] += amount
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.state.lock:
+                self._send_json(200, dict(self.state.counts))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        state = self.state
+        started = time.perf_counter()
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        state.count("requests")
+
+        roll = random.random()
+        if roll < state.error_429:
+            state.count("429")
+            self._send_json(429, {"error": {"message": "Rate limit exceeded"}}, {"Retry-After": str(state.retry_after)})
+            return
+        if roll < state.error_429 + state.error_5xx:
+            state.count("5xx")
+            self._send_json(random.choice([500, 502, 503]), {"error": {"message": "Upstream unavailable"}})
+            return
+
+        answer = build_answer(payload, state.think_chars, state.filler)
+        usage = {"prompt_tokens": len(json.dumps(payload.get("messages", []))) // 4, "completion_tokens": len(answer) // 4}
+        if payload.get("stream"):
+            state.count("streams")
+            self._stream(answer, usage)
+        else:
+            time.sleep(state.latency())
+            self._send_json(200, {
+                "id": "mock",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+        state.count("upstream_seconds", time.perf_counter() - started)
+
+    def _stream(self, answer: str, usage: dict):
+        state = self.state
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        time.sleep(state.ttft())
+        for i in range(0, len(answer), state.chunk_chars):
+            chunk = {"choices": [{"index": 0, "delta": {"content": answer[i:i + state.chunk_chars]}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            if state.chunk_delay:
+                time.sleep(state.chunk_delay)
+        final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        self.close_connection = True
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", default="lognormal:800,0.4", help="non-streaming response latency")
+    parser.add_argument("--ttft", default=None, help="time to first streamed token (defaults to --latency)")
+    parser.add_argument("--chunk-delay-ms", type=float, default=5)
+    parser.add_argument("--chunk-chars", type=int, default=24)
+    parser.add_argument("--think-kb", type=int, default=0, help="size of the <think> block prefixed to JSON answers")
+    parser.add_argument("--filler-repeat", type=int, default=20, help="length of generated prose fields")
+    parser.add_argument("--error-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="fraction of requests answered with 5xx")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser
+
+
+def start(args) -> ThreadingHTTPServer:
+    """Start the mock server on a background thread and return it."""
+    if args.seed is not None:
+        random.seed(args.seed)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(args)})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    args = build_arg_parser().parse_args()
+    server = start(args)
+    print(f"Mock Perplexity API on http://{args.host}:{server.server_port}/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,45 @@
 
 import os
-import requests
+from typing import List
+from pydantic import BaseModel
 
+import perplexity_client
+import metrics
+from history import compact_history
+from code_edits import EditError, resolve_code_change
+from structured_output import parse_agent_output, answer_offset
+from script_validation import validate_code_answer, avalidate_code_answer
+from intent_classifier import confident_question
 
+# "full" regenerates the whole script on a code change, "edits" asks for search/replace operations
+CHAT_EDIT_MODE = os.getenv("CHAT_EDIT_MODE", "full")
+# Answer messages the local classifier is confident are questions with a cheaper call, without the code schema
+CHAT_QUESTION_SHORTCUT = os.getenv("AI_CHAT_QUESTION_SHORTCUT", "1") == "1"
 
-def query_perplexity(search_filter_custom: list, code: str , query:str , messages_incoming: list) -> str:
 
-    class AnswerFormat(BaseModel):
-        Request_type: str
-        Name: str
-        CLI: str
-        python: str
-        Response: str
 
-    
-    AGENT_INTENT_PROMPT = """
+class AnswerFormat(BaseModel):
+    Request_type: str
+    Name: str
+    CLI: str
+    python: str
+    Response: str
+
+
+class CodeEdit(BaseModel):
+    search: str
+    replace: str
+
+
+class EditAnswerFormat(BaseModel):
+    Request_type: str
+    Name: str
+    CLI: str
+    edits: List[CodeEdit]
+    Response: str
+
+
+AGENT_INTENT_PROMPT = """
     You are a world-class AI engineer and conversational-agent architect with
     deep experience in automated program repair, intent classification, and
     LLM-powered Q&A.
@@ -76,26 +101,149 @@ def query_perplexity(search_filter_custom: list, code: str , query:str , message
         YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON  , ABSOLUTELY NOTHING ELSE
 
     """
-    messages_system =[ {"role": "system", "content": AGENT_INTENT_PROMPT}]
+
+EDIT_MODE_PROMPT = """
+    ## Edit mode (this overrides the "python" field above)
+    Do NOT return the full script. Instead return an "edits" list where each
+    item is {"search": ..., "replace": ...}:
+        • "search" is copied verbatim from the current script and occurs in it
+        exactly once; keep it as short as possible while still unique.
+        • "replace" is the text that takes its place.
+        • Use an empty "search" to append new code at the end of the script.
+    For Cross_questioning return an empty "edits" list.
+
+    {
+    "Request_type": Cross_questioning/Code_change,
+    "Name": A witty name for this agent related to what it does,
+    "CLI": terminal commands or NULL,
+    "edits": list of search/replace operations,
+    "Response": summary of code changes **or** answer to the user
+    }
+        YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON  , ABSOLUTELY NOTHING ELSE
+    """
+
+AGENT_QUESTION_PROMPT = """
+    You are a world-class AI engineer and conversational-agent architect.
+    The user is asking about the Python script that implements their AI
+    agent; the script follows their message.
+
+    Answer the question concisely and accurately, searching for supporting
+    facts if helpful. Refer to the script's own functions and lines where
+    relevant. Do not rewrite the script: if a change would help, describe it
+    in a sentence and let the user ask for it.
+    Keep tone professional yet friendly and answer in Markdown.
+    """
+
+# Everything but the per-request fields, built once at import; shared by every request, so never mutate them
+PAYLOAD_TEMPLATE = {
+    "model": "sonar-reasoning-pro",
+    "web_search_options": {
+        "search_context_size": "medium"
+    },
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": AnswerFormat.model_json_schema()},
+    },
+}
+EDIT_PAYLOAD_TEMPLATE = {
+    **PAYLOAD_TEMPLATE,
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": EditAnswerFormat.model_json_schema()},
+    },
+}
+QUESTION_PAYLOAD_TEMPLATE = {
+    "model": "sonar-pro",
+    "web_search_options": {
+        "search_context_size": "low"
+    },
+}
+SYSTEM_MESSAGE = {"role": "system", "content": AGENT_INTENT_PROMPT}
+QUESTION_SYSTEM_MESSAGE = {"role": "system", "content": AGENT_QUESTION_PROMPT}
+EDIT_SYSTEM_MESSAGE = {"role": "system", "content": AGENT_INTENT_PROMPT + EDIT_MODE_PROMPT}
+
+
+@metrics.prompt_stage("chat")
+def build_chat_payload(search_filter_custom: list, code: str , query:str , messages_incoming: list, edit_mode: bool = False) -> dict:
+    messages_system = [EDIT_SYSTEM_MESSAGE if edit_mode else SYSTEM_MESSAGE]
     
     messages_static  = [{"role": "user", "content": query +" \n\n " + code}]
     
-    messages_system.extend(messages_incoming)
-    messages_incoming.extend(messages_static)
+    # Bounded history: older script copies deduplicated, oldest turns recapped
+    messages_system.extend(compact_history(messages_incoming, code))
+    messages_system.extend(messages_static)
 
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {"Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"}
-    payload = {
-        "model": "sonar-reasoning-pro",
+    return {
+        **(EDIT_PAYLOAD_TEMPLATE if edit_mode else PAYLOAD_TEMPLATE),
         "messages": messages_system,
-        "web_search_options": {
-            "search_context_size": "medium"
-        },
         "search_domain_filter": search_filter_custom,
-        "response_format": {
-                "type": "json_schema",
-            "json_schema": {"schema": AnswerFormat.model_json_schema()},
-        }
     }
-    response = requests.post(url, headers=headers, json=payload).json()
-    return response["choices"][0]["message"]["content"]
\ No newline at end of file
+
+
+@metrics.prompt_stage("chat_question")
+def build_question_payload(search_filter_custom: list, code: str, query: str, messages_incoming: list) -> dict:
+    return {
+        **QUESTION_PAYLOAD_TEMPLATE,
+        "messages": [
+            QUESTION_SYSTEM_MESSAGE,
+            *compact_history(messages_incoming, code),
+            {"role": "user", "content": query + " \n\n " + code},
+        ],
+        "search_domain_filter": search_filter_custom,
+    }
+
+
+def question_answer(answer: str) -> dict:
+    """The reply to a question, in the shape the chat agent gives a Cross_questioning answer."""
+    return {
+        "Request_type": "Cross_questioning",
+        "Name": "NULL",
+        "CLI": "NULL",
+        "python": "NULL",
+        "Response": answer[answer_offset(answer):].strip(),
+    }
+
+
+def is_question(query: str) -> bool:
+    return CHAT_QUESTION_SHORTCUT and confident_question(query)
+
+
+def query_perplexity(search_filter_custom: list, code: str , query:str , messages_incoming: list, edit_mode: bool = False) -> str:
+    return perplexity_client.complete(build_chat_payload(search_filter_custom, code, query, messages_incoming, edit_mode))
+
+
+async def aquery_perplexity(search_filter_custom: list, code: str , query:str , messages_incoming: list, edit_mode: bool = False) -> str:
+    return await perplexity_client.acomplete(build_chat_payload(search_filter_custom, code, query, messages_incoming, edit_mode))
+
+
+def chat_turn(search_filter_custom: list, code: str, query: str, messages_incoming: list, edit_mode: bool = False) -> dict:
+    """Run one chat turn and return the parsed reply, always carrying the full updated script.
+
+    In edit mode the model only returns search/replace edits, which are
+    applied to ``code`` locally; if they do not apply or the result does not
+    parse, the turn is retried once as a full rewrite. An updated script is
+    checked (and if needed repaired) by ``script_validation``. A message the
+    local intent classifier is confident is a question is answered by a
+    cheaper call that cannot change the script.
+    """
+    if is_question(query):
+        return question_answer(perplexity_client.complete(build_question_payload(search_filter_custom, code, query, messages_incoming)))
+    if edit_mode and code:
+        response_json = parse_agent_output(query_perplexity(search_filter_custom, code, query, messages_incoming, True), EditAnswerFormat)
+        try:
+            return validate_code_answer(resolve_code_change(response_json, code))
+        except EditError as e:
+            print("Edit mode failed, falling back to a full rewrite:", e)
+    return validate_code_answer(parse_agent_output(query_perplexity(search_filter_custom, code, query, messages_incoming), AnswerFormat))
+
+
+async def achat_turn(search_filter_custom: list, code: str, query: str, messages_incoming: list, edit_mode: bool = False) -> dict:
+    if is_question(query):
+        return question_answer(await perplexity_client.acomplete(build_question_payload(search_filter_custom, code, query, messages_incoming)))
+    if edit_mode and code:
+        response_json = parse_agent_output(await aquery_perplexity(search_filter_custom, code, query, messages_incoming, True), EditAnswerFormat)
+        try:
+            return await avalidate_code_answer(resolve_code_change(response_json, code))
+        except EditError as e:
+            print("Edit mode failed, falling back to a full rewrite:", e)
+    return await avalidate_code_answer(parse_agent_output(await aquery_perplexity(search_filter_custom, code, query, messages_incoming), AnswerFormat))
@@ -0,0 +1,198 @@
+"""Server-side chat sessions keyed by ``agentId``.
+
+The chat routes used to need the client to resend the whole
+``messagesHistory`` and ``currentCode`` on every turn. A session now keeps
+the history, the current script (``python``, ``CLI`` and agent name) and the
+``contextUrls`` of each agent in SQLite, shared by every worker process, so
+a client only has to send ``agentId`` and the new ``message``.
+
+Fields the client does send still take precedence, which keeps older
+clients working: a ``messagesHistory`` replaces the stored history, and
+``currentCode`` or ``contextUrls`` replace the stored values for that turn
+and onwards. Requests without an ``agentId`` do not use a session.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+CHAT_SESSIONS = os.getenv("AI_CHAT_SESSIONS", "1") == "1"
+CHAT_SESSION_DB_PATH = os.getenv("AI_CHAT_SESSION_DB_PATH", "ai_chat_sessions.sqlite3")
+# Oldest messages beyond this are deleted; compact_history trims further before each call
+CHAT_SESSION_MAX_MESSAGES = int(os.getenv("AI_CHAT_SESSION_MAX_MESSAGES", "200"))
+# Sessions untouched for this many seconds are deleted
+CHAT_SESSION_TTL = float(os.getenv("AI_CHAT_SESSION_TTL", str(30 * 86400)))
+
+
+class ChatSessionStore:
+    """SQLite-backed chat state; history is append-only so a turn writes two rows, not the whole history."""
+
+    def __init__(self, path: str = CHAT_SESSION_DB_PATH, max_messages: int = CHAT_SESSION_MAX_MESSAGES,
+                 ttl: float = CHAT_SESSION_TTL):
+        self.path = path
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            " agent_id TEXT PRIMARY KEY,"
+            " name TEXT NOT NULL DEFAULT '',"
+            " cli TEXT NOT NULL DEFAULT '',"
+            " python TEXT NOT NULL DEFAULT '',"
+            " context_urls TEXT NOT NULL DEFAULT '[]',"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " agent_id TEXT NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS chat_messages_agent ON chat_messages (agent_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS chat_sessions_updated ON chat_sessions (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def get(self, agent_id: str):
+        """Return ``{"name", "cli", "python", "contextUrls", "history", "updatedAt"}`` for a session, or None."""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM chat_sessions WHERE agent_id = ?", (agent_id,)).fetchone()
+        if row is None:
+            return None
+        messages = conn.execute(
+            "SELECT role, content FROM chat_messages WHERE agent_id = ? ORDER BY id", (agent_id,)
+        ).fetchall()
+        return {
+            "name": row["name"],
+            "cli": row["cli"],
+            "python": row["python"],
+            "contextUrls": json.loads(row["context_urls"]),
+            "history": [{"role": message["role"], "content": message["content"]} for message in messages],
+            "updatedAt": row["updated_at"],
+        }
+
+    def save_turn(self, agent_id: str, user_message: str, reply: str, fields: dict, history: list = None):
+        """Append one exchange and update the stored fields.
+
+        ``fields`` may hold ``name``, ``cli``, ``python`` and ``context_urls``;
+        a ``history`` replaces the stored messages before the exchange is added.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO chat_sessions (agent_id, updated_at) VALUES (?, ?)", (agent_id, now)
+            )
+            updates = {column: fields[column] for column in ("name", "cli", "python") if fields.get(column) is not None}
+            if fields.get("context_urls") is not None:
+                updates["context_urls"] = json.dumps(fields["context_urls"])
+            assignments = "".join(f", {column} = ?" for column in updates)
+            conn.execute(
+                f"UPDATE chat_sessions SET updated_at = ?{assignments} WHERE agent_id = ?",
+                (now, *updates.values(), agent_id),
+            )
+            if history is not None:
+                conn.execute("DELETE FROM chat_messages WHERE agent_id = ?", (agent_id,))
+            conn.executemany(
+                "INSERT INTO chat_messages (agent_id, role, content) VALUES (?, ?, ?)",
+                [(agent_id, message["role"], message["content"]) for message in history or []]
+                + [(agent_id, "user", user_message), (agent_id, "assistant", reply)],
+            )
+            conn.execute(
+                "DELETE FROM chat_messages WHERE agent_id = ? AND id NOT IN"
+                " (SELECT id FROM chat_messages WHERE agent_id = ? ORDER BY id DESC LIMIT ?)",
+                (agent_id, agent_id, self.max_messages),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._expire(now)
+
+    def _expire(self, now: float):
+        conn = self._connect()
+        expired = [row[0] for row in conn.execute(
+            "SELECT agent_id FROM chat_sessions WHERE updated_at < ?", (now - self.ttl,)
+        ).fetchall()]
+        for agent_id in expired:
+            self.delete(agent_id)
+
+    def delete(self, agent_id: str) -> bool:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = conn.execute("DELETE FROM chat_sessions WHERE agent_id = ?", (agent_id,)).rowcount
+            conn.execute("DELETE FROM chat_messages WHERE agent_id = ?", (agent_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return deleted > 0
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        return {
+            "sessions": conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0],
+            "messages": conn.execute("SELECT COUNT(*) FROM chat_messages").fetchone()[0],
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    """Return the process-wide session store, or None if sessions are disabled."""
+    global _store
+    if _store is None and CHAT_SESSIONS:
+        with _store_lock:
+            if _store is None:
+                _store = ChatSessionStore()
+    return _store
+
+
+def session_id(data: dict):
+    agent_id = data.get('agentId')
+    return None if agent_id in (None, "") else str(agent_id)
+
+
+def chat_inputs(data: dict) -> tuple:
+    """``(context_urls, current_code, message, messages_history)`` for a chat request.
+
+    Each field the request leaves out is taken from the agent's session.
+    """
+    agent_id = session_id(data)
+    store = get_session_store() if agent_id is not None else None
+    session = store.get(agent_id) if store is not None else None
+    session = session or {"python": "", "contextUrls": [], "history": []}
+    return (
+        data['contextUrls'] if 'contextUrls' in data else session["contextUrls"],
+        data['currentCode'] if 'currentCode' in data else session["python"],
+        data.get('message', ''),
+        data['messagesHistory'] if 'messagesHistory' in data else session["history"],
+    )
+
+
+def remember_turn(data: dict, response_json: dict):
+    """Store a completed chat turn in the agent's session."""
+    agent_id = session_id(data)
+    store = get_session_store() if agent_id is not None else None
+    if store is None:
+        return
+    fields = {"context_urls": data.get('contextUrls'), "python": data.get('currentCode')}
+    python = response_json.get("python") or ""
+    if response_json.get("Request_type") == "Code_change" and python.strip() not in ("", "NULL"):
+        fields.update(python=python, cli=response_json.get("CLI", ""), name=response_json.get("Name", ""))
+    store.save_turn(agent_id, data.get('message', ''), response_json.get("Response", ""), fields, data.get('messagesHistory'))
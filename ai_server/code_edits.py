@@ -0,0 +1,98 @@
+"""Apply model-proposed edit operations to the stored agent script.
+
+In edit mode the chat agent answers a ``Code_change`` request with a list
+of search/replace operations instead of regenerating the whole script.
+They are applied here, and the result must still parse as Python; any
+failure raises ``EditError`` so the caller can fall back to a full rewrite.
+"""
+import ast
+
+
+class EditError(ValueError):
+    """The proposed edits could not be applied cleanly."""
+
+
+def _find_unique(source: str, search: str) -> int:
+    index = source.find(search)
+    if index == -1:
+        return -1
+    if source.find(search, index + 1) != -1:
+        raise EditError(f"Edit target is ambiguous: {search[:80]!r}")
+    return index
+
+
+def _find_ignoring_trailing_whitespace(source: str, search: str):
+    """Locate ``search`` line by line, ignoring trailing whitespace; return (start, end) offsets."""
+    source_lines = source.splitlines(keepends=True)
+    search_lines = [line.rstrip() for line in search.strip("\n").splitlines()]
+    if not search_lines:
+        return None
+    matches = []
+    for i in range(len(source_lines) - len(search_lines) + 1):
+        window = source_lines[i:i + len(search_lines)]
+        if [line.rstrip() for line in window] == search_lines:
+            matches.append(i)
+    if len(matches) > 1:
+        raise EditError(f"Edit target is ambiguous: {search[:80]!r}")
+    if not matches:
+        return None
+    start = sum(len(line) for line in source_lines[:matches[0]])
+    end = start + sum(len(line) for line in source_lines[matches[0]:matches[0] + len(search_lines)])
+    return start, end
+
+
+def apply_edit(source: str, search: str, replace: str) -> str:
+    if not search:
+        # An empty search string appends to the end of the script
+        return source.rstrip("\n") + "\n" + replace
+    index = _find_unique(source, search)
+    if index != -1:
+        return source[:index] + replace + source[index + len(search):]
+    stripped = search.strip()
+    index = _find_unique(source, stripped) if stripped else -1
+    if index != -1:
+        return source[:index] + replace.strip() + source[index + len(stripped):]
+    span = _find_ignoring_trailing_whitespace(source, search)
+    if span is None:
+        raise EditError(f"Edit target not found: {search[:80]!r}")
+    start, end = span
+    if not replace.endswith("\n") and source[start:end].endswith("\n"):
+        replace += "\n"
+    return source[:start] + replace + source[end:]
+
+
+def apply_edits(source: str, edits: list, lines: tuple = None) -> str:
+    """Apply ``[{"search": ..., "replace": ...}, ...]`` in order and validate the result.
+
+    With ``lines=(first, last)`` (1-based, inclusive) the edits only see that
+    span of the script, and the edited span is spliced back in.
+    """
+    if not edits:
+        raise EditError("No edits were returned for a code change")
+    before, after = "", ""
+    if lines is not None:
+        source_lines = source.splitlines(keepends=True)
+        first, last = lines
+        before, after = "".join(source_lines[:first - 1]), "".join(source_lines[last:])
+        source = "".join(source_lines[first - 1:last])
+    ends_line = source.endswith("\n")
+    for edit in edits:
+        if not isinstance(edit, dict) or "replace" not in edit:
+            raise EditError(f"Malformed edit operation: {edit!r}")
+        source = apply_edit(source, edit.get("search", ""), edit["replace"])
+    if after and ends_line and not source.endswith("\n"):
+        source += "\n"
+    source = before + source + after
+    try:
+        ast.parse(source)
+    except SyntaxError as e:
+        raise EditError(f"Edited script does not parse: {e}") from e
+    return source
+
+
+def resolve_code_change(response_json: dict, current_code: str) -> dict:
+    """Turn an edit-mode chat response into the full-script shape the routes return."""
+    if response_json.get("Request_type") != "Code_change":
+        return {**response_json, "python": response_json.get("python", "NULL")}
+    python = apply_edits(current_code, response_json.get("edits") or [])
+    return {**response_json, "python": python}
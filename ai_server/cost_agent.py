@@ -1,16 +1,27 @@
+import json
 import os
-import requests
 
+from pydantic import BaseModel
 
+import perplexity_client
+import metrics
+import cost_estimator
+from structured_output import validator
 
-def run_cost_analysis(code: str) -> str:
-    
-    class AnswerFormat(BaseModel):
-        Analysis: str
-        CostEstimation: str
-        Conclusion: str
-    
-    AGENT_COST_PROMPT = """
+# "static" prices the script locally from model_pricing.json (see cost_estimator) and only the
+# Conclusion may come from a model; "web" has the model run the whole analysis with web search
+COST_ANALYSIS_MODE = os.getenv("AI_COST_ANALYSIS_MODE", "static")
+# Have a model write the static estimate's Conclusion instead of the local template
+COST_CONCLUSION_LLM = os.getenv("AI_COST_CONCLUSION_LLM", "0") == "1"
+
+
+class AnswerFormat(BaseModel):
+    Analysis: str
+    CostEstimation: str
+    Conclusion: str
+
+
+AGENT_COST_PROMPT = """
         You are a world-class AI engineer and have been analysing LLM-powered systems for the last decade.
         You have deep knowledge of token-based pricing models across OpenAI, Anthropic, Google, Cohere,
         and other providers, plus hands-on experience benchmarking real usage patterns.
@@ -62,22 +73,114 @@ def run_cost_analysis(code: str) -> str:
             YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON , ABSOLUTELY NOTHING ELSE
         """
 
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {"Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"}
-    payload = {
-        "model": "sonar-pro",
+# Everything but the script under review, built once at import; shared by every request, so never mutate it
+PAYLOAD_TEMPLATE = {
+    "model": "sonar-pro",
+    "web_search_options": {
+        "search_context_size": "medium"
+    },
+    "search_domain_filter": ["https://ai.google.dev/gemini-api/docs/pricing" ,"https://groq.com/pricing/","https://openai.com/api/pricing/" , "https://api-docs.deepseek.com/quick_start/pricing" , "https://docs.perplexity.ai/guides/pricing" ,"https://www.anthropic.com/pricing"],
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": AnswerFormat.model_json_schema()},
+    },
+}
+SYSTEM_MESSAGE = {"role": "system", "content": AGENT_COST_PROMPT}
+
+COST_CONCLUSION_PROMPT = """
+        You are a world-class AI engineer helping a user understand what their
+        LLM-powered agent will cost to run. You are given the cost analysis and
+        the monthly cost table for their script; the numbers are final, so do not
+        recompute, question or restate them in full.
+
+        Write a short, user-friendly conclusion (3-5 sentences) explaining the
+        findings, the key cost levers and how to optimise, in plain English.
+        End with *one* follow-up question: ask either whether the user wants
+        deeper optimisation advice **or** whether any assumptions need tweaking.
+
+        Reply with the conclusion text only, no headings and no JSON.
+        """
+
+CONCLUSION_PAYLOAD_TEMPLATE = {
+    "model": "sonar",
+    "web_search_options": {
+        "search_context_size": "low"
+    },
+}
+CONCLUSION_SYSTEM_MESSAGE = {"role": "system", "content": COST_CONCLUSION_PROMPT}
+
+
+@metrics.prompt_stage("cost_analysis")
+def build_cost_analysis_payload(code: str) -> dict:
+    return {
+        **PAYLOAD_TEMPLATE,
         "messages": [
-            {"role": "system", "content": AGENT_COST_PROMPT},
+            SYSTEM_MESSAGE,
             {"role": "user", "content": "I want you to run a thorough cost analysis for the following agent's script : \n\n " + code}
         ],
-        "web_search_options": {
-            "search_context_size": "medium"
-        },
-        "search_domain_filter": ["https://ai.google.dev/gemini-api/docs/pricing" ,"https://groq.com/pricing/","https://openai.com/api/pricing/" , "https://api-docs.deepseek.com/quick_start/pricing" , "https://docs.perplexity.ai/guides/pricing" ,"https://www.anthropic.com/pricing"],
-        "response_format": {
-                "type": "json_schema",
-            "json_schema": {"schema": AnswerFormat.model_json_schema()},
-        }
     }
-    response = requests.post(url, headers=headers, json=payload).json()
-    return response["choices"][0]["message"]["content"]
\ No newline at end of file
+
+
+@metrics.prompt_stage("cost_conclusion")
+def build_cost_conclusion_payload(sections: dict) -> dict:
+    return {
+        **CONCLUSION_PAYLOAD_TEMPLATE,
+        "messages": [
+            CONCLUSION_SYSTEM_MESSAGE,
+            {"role": "user", "content":
+                "Analysis:\n" + sections["Analysis"] + "\n\nCost estimation:\n" + sections["CostEstimation"]
+            }
+        ],
+    }
+
+
+def _static_estimate(code: str):
+    """``(estimate, Analysis and CostEstimation sections)``, or None if the script is to be analysed upstream."""
+    if COST_ANALYSIS_MODE != "static":
+        return None
+    with metrics.stage("cost_estimate"):
+        try:
+            result = cost_estimator.estimate(code)
+        except (SyntaxError, ValueError):
+            # Not Python (JS/TS, a notebook, a fragment): leave it to the model
+            return None
+        return result, cost_estimator.render(result)
+
+
+def _static_answer(result: dict, sections: dict, conclusion: str) -> str:
+    return json.dumps({**sections, "Conclusion": (conclusion or "").strip() or cost_estimator.conclusion(result)})
+
+
+def run_cost_analysis(code: str) -> str:
+    """Return the raw ``AnswerFormat`` answer for ``code``.
+
+    In static mode (see ``COST_ANALYSIS_MODE``) the models, token counts and
+    monthly tiers come from ``cost_estimator`` in a few milliseconds; a model
+    is asked for the narrative Conclusion only if ``COST_CONCLUSION_LLM`` is
+    set, and the local conclusion is used if that call fails.
+    """
+    static = _static_estimate(code)
+    if static is None:
+        return perplexity_client.complete(build_cost_analysis_payload(code), cache=True, validate=validator(AnswerFormat))
+    result, sections = static
+    conclusion = None
+    if COST_CONCLUSION_LLM and result["components"]:
+        try:
+            conclusion = perplexity_client.complete(build_cost_conclusion_payload(sections), cache=True)
+        except Exception as e:
+            print("Cost conclusion call failed, using the local conclusion:", e)
+    return _static_answer(result, sections, conclusion)
+
+
+async def arun_cost_analysis(code: str) -> str:
+    static = _static_estimate(code)
+    if static is None:
+        return await perplexity_client.acomplete(build_cost_analysis_payload(code), cache=True, validate=validator(AnswerFormat))
+    result, sections = static
+    conclusion = None
+    if COST_CONCLUSION_LLM and result["components"]:
+        try:
+            conclusion = await perplexity_client.acomplete(build_cost_conclusion_payload(sections), cache=True)
+        except Exception as e:
+            print("Cost conclusion call failed, using the local conclusion:", e)
+    return _static_answer(result, sections, conclusion)
\ No newline at end of file
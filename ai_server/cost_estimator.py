@@ -0,0 +1,507 @@
+"""Static cost estimate of an agent script, without an upstream call.
+
+The script's AST is walked for the calls that cost money:
+
+* LLM and embedding calls through a provider SDK or framework
+  (``client.chat.completions.create``, ``client.messages.create``,
+  ``model.generate_content``, ``llm.invoke``, ``embeddings.embed_query``, ...)
+  and HTTP posts to a known provider API host,
+* the model each call uses: a model name inside the call itself, else the
+  one the receiving object was constructed with, else the first one named in
+  the enclosing function or module, else the provider's default,
+* the prompt text in the call and in the names it references, and any
+  ``max_tokens`` setting, which give the tokens per call.
+
+Calls inside a loop, or in a function that is called from a loop, are
+counted ``COST_LOOP_ITERATIONS`` times per session and flagged, and a model
+that is named but never reached through a recognised call is counted once
+per session. Prices come from the versioned table in
+``model_pricing.json``; update it (and bump its ``version``) when providers
+change their prices. Every assumption made is listed in the ``Analysis``.
+"""
+import ast
+import functools
+import json
+import os
+from collections import deque
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PRICING_PATH = os.getenv("AI_MODEL_PRICING_PATH", os.path.join(MODULE_DIR, "model_pricing.json"))
+
+TRAFFIC_TIERS = (("Low", 100), ("Moderate", 1000), ("High", 10000))
+DAYS_PER_MONTH = 30
+# User input, history and retrieved context sent with every chat call on top of the prompt text in the script
+COST_PROMPT_TOKENS = int(os.getenv("AI_COST_PROMPT_TOKENS", "800"))
+COST_COMPLETION_TOKENS = int(os.getenv("AI_COST_COMPLETION_TOKENS", "400"))
+COST_EMBEDDING_TOKENS = int(os.getenv("AI_COST_EMBEDDING_TOKENS", "500"))
+COST_LOOP_ITERATIONS = int(os.getenv("AI_COST_LOOP_ITERATIONS", "5"))
+CHARS_PER_TOKEN = 4
+
+CHAT = "chat"
+EMBEDDING = "embedding"
+
+IMPORT_PROVIDERS = {
+    "openai": "OpenAI", "langchain_openai": "OpenAI", "llama_index.llms.openai": "OpenAI",
+    "llama_index.embeddings.openai": "OpenAI",
+    "anthropic": "Anthropic", "langchain_anthropic": "Anthropic", "llama_index.llms.anthropic": "Anthropic",
+    "google.generativeai": "Google", "google.genai": "Google", "langchain_google_genai": "Google",
+    "vertexai": "Google", "llama_index.llms.gemini": "Google",
+    "groq": "Groq", "langchain_groq": "Groq", "llama_index.llms.groq": "Groq",
+    "langchain_deepseek": "DeepSeek",
+    "langchain_perplexity": "Perplexity", "llama_index.llms.perplexity": "Perplexity",
+    "sentence_transformers": "Hugging Face", "langchain_huggingface": "Hugging Face",
+    "llama_index.embeddings.huggingface": "Hugging Face",
+}
+API_HOSTS = {
+    "api.openai.com": "OpenAI",
+    "api.anthropic.com": "Anthropic",
+    "generativelanguage.googleapis.com": "Google",
+    "api.groq.com": "Groq",
+    "api.deepseek.com": "DeepSeek",
+    "api.perplexity.ai": "Perplexity",
+}
+# Trailing attribute chains of billed calls; a single method name only counts on a receiver named like a model,
+# unless the name itself says it embeds (``emb.embed_query``)
+CHAT_CALLS = (
+    ("chat", "completions", "create"), ("completions", "create"), ("messages", "create"), ("messages", "stream"),
+    ("responses", "create"), ("generate_content",), ("generate_content_async",), ("send_message",),
+    ("invoke",), ("ainvoke",), ("stream",), ("astream",), ("batch",), ("complete",), ("acomplete",),
+    ("chat",), ("achat",), ("query",), ("aquery",), ("run",), ("arun",), ("kickoff",),
+)
+EMBEDDING_CALLS = (
+    ("embeddings", "create"), ("embed_content",), ("embed_documents",), ("aembed_documents",), ("embed_query",),
+    ("aembed_query",), ("get_text_embedding",), ("get_query_embedding",), ("encode",),
+)
+LLM_RECEIVER_HINTS = ("llm", "model", "chain", "agent", "chat", "client", "engine", "crew", "graph", "executor",
+                      "gpt", "claude", "gemini", "groq", "openai", "anthropic", "embed", "encoder")
+COMPLETION_LIMITS = ("max_tokens", "max_output_tokens", "max_completion_tokens", "max_tokens_to_sample", "max_new_tokens")
+# Prefixes some SDKs and routers put in front of a model name
+MODEL_PREFIXES = ("models/", "openai/", "anthropic/", "gemini/", "google/", "groq/", "deepseek/", "perplexity/",
+                  "sentence-transformers/")
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+_LOOPS = (ast.For, ast.AsyncFor, ast.While) + _COMPREHENSIONS
+_SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+
+@functools.lru_cache(maxsize=None)
+def load_pricing(path: str = MODEL_PRICING_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        pricing = json.load(f)
+    # A frozenset caches its hash, so it is cheap as part of the _match_name cache key
+    pricing["names"] = frozenset((name.lower(), name) for name in pricing["models"])
+    return pricing
+
+
+def match_model(text: str, pricing: dict):
+    """The priced model a string literal names, or None.
+
+    Dated or tagged variants (``gpt-4o-2024-08-06``, ``claude-3-5-sonnet-latest``)
+    match their base model.
+    """
+    name = text.strip().lower()
+    if not name or len(name) > 80 or any(char.isspace() for char in name):
+        return None
+    return _match_name(name, pricing["names"])
+
+
+# Scripts repeat the same model names and other strings
+@functools.lru_cache(maxsize=4096)
+def _match_name(name: str, names: frozenset):
+    by_name = dict(names)
+    for prefix in MODEL_PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    if name in by_name:
+        return by_name[name]
+    best = None
+    for known in by_name:
+        if name.startswith(known) and name[len(known)] in "-@:" and (best is None or len(known) > len(best)):
+            best = known
+    return by_name[best] if best else None
+
+
+def _dotted(node) -> list:
+    """``["client", "chat", "completions", "create"]`` for ``client.chat.completions.create``."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        parts.append(node.id)
+    elif isinstance(node, ast.Call):
+        return _dotted(node.func) + parts[::-1]
+    return parts[::-1]
+
+
+def _target_name(node):
+    """``"llm"`` for ``llm`` and ``"self.llm"`` for ``self.llm``."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return ".".join(_dotted(node)) or None
+    return None
+
+
+def _string(node) -> bool:
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+
+def _count(node) -> bool:
+    return isinstance(node, ast.Constant) and type(node.value) is int
+
+
+class _Script:
+    """What the estimator needs to know about one parsed script."""
+
+    def __init__(self, tree: ast.Module, pricing: dict):
+        self.pricing = pricing
+        self.providers = []
+        self.parents = {}
+        # Name -> value nodes assigned to it anywhere in the script
+        self.assignments = {}
+        # Model literals in order of appearance: (line, model, enclosing function)
+        self.model_literals = []
+        self.calls = []
+        candidates = []
+        # Breadth-first, so a node's ancestors all have their parents recorded by the time it is visited
+        queue = deque([tree])
+        while queue:
+            node = queue.popleft()
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+                queue.append(child)
+            if isinstance(node, ast.Call):
+                candidates.append(node)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                modules = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or ""]
+                for module in modules:
+                    self._add_provider(self._import_provider(module))
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+                for target in node.targets if isinstance(node, ast.Assign) else [node.target]:
+                    name = _target_name(target)
+                    if name:
+                        self.assignments.setdefault(name, []).append(node.value)
+            elif _string(node):
+                model = match_model(node.value, pricing)
+                if model:
+                    self.model_literals.append((node.lineno, model, self.scope_of(node)))
+                self._add_provider(self._host_provider(node.value))
+        # Classified once every assignment is known, since a posted URL may be a name defined further down
+        for node in candidates:
+            kind = self._call_kind(node)
+            if kind:
+                self.calls.append((node, kind))
+        self.model_literals.sort(key=lambda literal: literal[0])
+        self.calls.sort(key=lambda call: (call[0].lineno, call[0].col_offset))
+        self.looped_functions = self._looped_functions()
+
+    def _add_provider(self, provider):
+        if provider and provider not in self.providers:
+            self.providers.append(provider)
+
+    @staticmethod
+    def _import_provider(module: str):
+        owners = [prefix for prefix in IMPORT_PROVIDERS if module == prefix or module.startswith(prefix + ".")]
+        return IMPORT_PROVIDERS[max(owners, key=len)] if owners else None
+
+    @staticmethod
+    def _host_provider(text: str):
+        return next((provider for host, provider in API_HOSTS.items() if host in text), None)
+
+    def scope_of(self, node):
+        while node in self.parents:
+            node = self.parents[node]
+            if isinstance(node, _SCOPES):
+                return node
+        return None
+
+    def _loop_or_scope(self, node):
+        """The innermost loop that repeats ``node``, else its function, else None for module level."""
+        while node in self.parents:
+            child, node = node, self.parents[node]
+            if isinstance(node, (ast.For, ast.AsyncFor)) and child is node.iter:
+                continue
+            if isinstance(node, _COMPREHENSIONS) and child is node.generators[0].iter:
+                continue
+            if isinstance(node, _LOOPS + _SCOPES):
+                return node
+        return None
+
+    def _looped_functions(self) -> set:
+        """Names of the functions called, directly or through other functions, from inside a loop."""
+        defined = {node.name for node in self.parents if isinstance(node, _SCOPES)}
+        # Function name -> (names of the functions calling it, whether a call to it sits in a loop)
+        callers = {}
+        for node in self.parents:
+            if not isinstance(node, ast.Call):
+                continue
+            chain = _dotted(node.func)
+            if not chain or chain[-1] not in defined:
+                continue
+            where = self._loop_or_scope(node)
+            caller_names, looped = callers.get(chain[-1], (set(), False))
+            if isinstance(where, _SCOPES):
+                caller_names.add(where.name)
+            callers[chain[-1]] = (caller_names, looped or isinstance(where, _LOOPS))
+        looped = {name for name, (_callers, in_loop) in callers.items() if in_loop}
+        grew = True
+        while grew:
+            grew = False
+            for name, (caller_names, _in_loop) in callers.items():
+                if name not in looped and caller_names & looped:
+                    looped.add(name)
+                    grew = True
+        return looped
+
+    def in_loop(self, node) -> bool:
+        """True if ``node`` runs in a loop, or in a function that is reached from a loop."""
+        while True:
+            where = self._loop_or_scope(node)
+            if where is None:
+                return False
+            if isinstance(where, _LOOPS) or where.name in self.looped_functions:
+                return True
+            node = where
+
+    def nodes(self, node, depth: int = 3, seen: frozenset = frozenset()):
+        """``node``'s subtree, then the values assigned to the names it uses, ``depth`` assignments deep."""
+        names = []
+        for child in ast.walk(node):
+            yield child
+            name = _target_name(child)
+            if name and name not in seen and name not in names:
+                names.append(name)
+        if depth:
+            seen = seen | set(names)
+            for name in names:
+                for value in self.assignments.get(name, ()):
+                    yield from self.nodes(value, depth - 1, seen)
+
+    def models_in(self, node, depth: int = 3) -> list:
+        return [model for child in self.nodes(node, depth) if _string(child)
+                for model in [match_model(child.value, self.pricing)] if model]
+
+    def text_chars(self, node) -> int:
+        """Characters of the string literals ``node`` uses, directly or through names."""
+        return sum(len(child.value) for child in self.nodes(node) if _string(child))
+
+    def completion_limit(self, node):
+        """The ``max_tokens``-style setting ``node`` uses, directly or through names, or None."""
+        for child in self.nodes(node):
+            if isinstance(child, ast.keyword) and child.arg in COMPLETION_LIMITS and _count(child.value):
+                return child.value.value
+            if isinstance(child, ast.Dict):
+                for key, value in zip(child.keys, child.values):
+                    if _string(key) and key.value in COMPLETION_LIMITS and _count(value):
+                        return value.value
+        return None
+
+    def _call_kind(self, node: ast.Call):
+        chain = _dotted(node.func)
+        if len(chain) < 2:
+            return None
+        if chain[-1] in ("post", "apost"):
+            posts_to_api = any(_string(child) and self._host_provider(child.value) for child in self.nodes(node, 1))
+            return CHAT if posts_to_api else None
+        receiver = chain[-2].lower()
+        for kind, patterns in ((EMBEDDING, EMBEDDING_CALLS), (CHAT, CHAT_CALLS)):
+            for pattern in patterns:
+                if len(chain) <= len(pattern) or tuple(chain[-len(pattern):]) != pattern:
+                    continue
+                if len(pattern) > 1 or "embed" in pattern[0] or any(hint in receiver for hint in LLM_RECEIVER_HINTS):
+                    return kind
+        return None
+
+    def call_model(self, call: ast.Call, kind: str) -> tuple:
+        """``(model, how it was found)`` for a billed call; the model is None if nothing points to one."""
+        models = self.models_in(call, depth=0)
+        if models:
+            return models[0], "named in the call"
+        models = self.models_in(call)
+        if models:
+            return models[0], "set where its client or arguments are built"
+        scope = self.scope_of(call)
+        literals = [(model, literal_scope) for _line, model, literal_scope in self.model_literals
+                    if self.pricing["models"][model]["kind"] == kind]
+        for model, literal_scope in literals:
+            if scope is not None and literal_scope is scope:
+                return model, "named in the enclosing function"
+        if literals:
+            return literals[0][0], "taken from the first one named in the script"
+        for provider in self.providers:
+            default = self.pricing["providerDefaults"].get(provider, {}).get(kind)
+            if default:
+                return default, f"assumed {provider} default, the script names none"
+        return None, None
+
+
+def _session_cost(component: dict, price: dict) -> float:
+    """USD per session for a component's tokens and calls at ``price``."""
+    tokens = component["promptTokens"] * price["input"] + component["completionTokens"] * price["output"]
+    return tokens / 1e6 + component["callsPerSession"] * price.get("perThousandRequests", 0.0) / 1000
+
+
+def estimate(code: str, pricing: dict = None) -> dict:
+    """Priced components of ``code`` per session and per month for each traffic tier.
+
+    Raises ``SyntaxError`` if the script is not Python.
+    """
+    pricing = pricing or load_pricing()
+    script = _Script(ast.parse(code), pricing)
+    components = {}
+    unpriced = []
+    for call, kind in script.calls:
+        model, source = script.call_model(call, kind)
+        if model is None:
+            unpriced.append(call.lineno)
+            continue
+        price = pricing["models"][model]
+        kind = price["kind"]
+        repeats = COST_LOOP_ITERATIONS if script.in_loop(call) else 1
+        if kind == EMBEDDING:
+            prompt_tokens, completion_tokens, limit = COST_EMBEDDING_TOKENS, 0, None
+        else:
+            prompt_tokens = COST_PROMPT_TOKENS + script.text_chars(call) // CHARS_PER_TOKEN
+            limit = script.completion_limit(call)
+            completion_tokens = limit or COST_COMPLETION_TOKENS
+        component = components.setdefault(model, {
+            "model": model, "provider": price["provider"], "kind": kind, "lines": [], "callsPerSession": 0,
+            "promptTokens": 0, "completionTokens": 0, "sources": [], "maxTokens": None, "inLoop": False,
+        })
+        component["lines"].append(call.lineno)
+        component["callsPerSession"] += repeats
+        component["promptTokens"] += prompt_tokens * repeats
+        component["completionTokens"] += completion_tokens * repeats
+        component["inLoop"] = component["inLoop"] or repeats > 1
+        component["maxTokens"] = limit or component["maxTokens"]
+        if source not in component["sources"]:
+            component["sources"].append(source)
+    for line, model, _scope in script.model_literals:
+        if model in components:
+            continue
+        # Named but never reached through a call we recognise (agent frameworks, wrappers): one call per session
+        price = pricing["models"][model]
+        components[model] = {
+            "model": model, "provider": price["provider"], "kind": price["kind"], "lines": [line], "callsPerSession": 1,
+            "promptTokens": COST_EMBEDDING_TOKENS if price["kind"] == EMBEDDING else COST_PROMPT_TOKENS,
+            "completionTokens": 0 if price["kind"] == EMBEDDING else COST_COMPLETION_TOKENS,
+            "sources": ["named but no call site found, assumed one call per session"], "maxTokens": None, "inLoop": False,
+        }
+    for component in components.values():
+        component["costPerSession"] = _session_cost(component, pricing["models"][component["model"]])
+        component["monthly"] = {tier: component["costPerSession"] * sessions * DAYS_PER_MONTH for tier, sessions in TRAFFIC_TIERS}
+    ordered = sorted(components.values(), key=lambda component: -component["costPerSession"])
+    return {
+        "components": ordered,
+        "unpricedCalls": unpriced,
+        "providers": script.providers,
+        "costPerSession": sum(component["costPerSession"] for component in ordered),
+        "monthly": {tier: sum(component["monthly"][tier] for component in ordered) for tier, _sessions in TRAFFIC_TIERS},
+        "pricingVersion": pricing["version"],
+        "pricesAsOf": pricing["pricesAsOf"],
+    }
+
+
+def _dollars(amount: float) -> str:
+    if amount == 0:
+        return "$0"
+    if amount < 0.0001:
+        return "<$0.0001"
+    if amount < 0.01:
+        return f"${amount:.4f}"
+    return f"${amount:,.2f}"
+
+
+def _alternative(component: dict, pricing: dict):
+    """``(model, moderate monthly cost)`` of the cheaper drop-in named in the pricing table, or None."""
+    alternative = pricing["models"][component["model"]].get("cheaperAlternative")
+    if not alternative:
+        return None
+    per_session = _session_cost(component, pricing["models"][alternative])
+    return alternative, per_session * dict(TRAFFIC_TIERS)["Moderate"] * DAYS_PER_MONTH
+
+
+def render(result: dict, pricing: dict = None) -> dict:
+    """The ``Analysis`` and ``CostEstimation`` sections for an ``estimate`` result."""
+    pricing = pricing or load_pricing()
+    analysis = []
+    for component in result["components"]:
+        lines = ", ".join(map(str, component["lines"]))
+        if component["kind"] == EMBEDDING:
+            tokens = f"~{component['promptTokens'] // component['callsPerSession']:,} input tokens per call"
+        else:
+            completion = component["completionTokens"] // component["callsPerSession"]
+            tokens = (f"~{component['promptTokens'] // component['callsPerSession']:,} prompt + "
+                      + (f"up to {completion:,} completion tokens per call (max_tokens={component['maxTokens']})"
+                         if component["maxTokens"] else f"~{completion:,} completion tokens per call"))
+        analysis.append(
+            f"• {component['model']} ({component['provider']}, {component['kind']}) – line {lines}; "
+            f"{component['callsPerSession']} call{'s' if component['callsPerSession'] > 1 else ''} per session"
+            f"{' (inside a loop)' if component['inLoop'] else ''}; {tokens}; model {', '.join(component['sources'])}"
+        )
+    if result["unpricedCalls"]:
+        analysis.append("• LLM-style calls with no recognisable model or provider on line "
+                        + ", ".join(map(str, result["unpricedCalls"])) + " are not priced")
+    if not result["components"]:
+        analysis.append("• No paid LLM or embedding calls were detected in this script")
+    analysis.append(
+        "• Assumptions (flagged): one session is one run of the script's main flow; calls inside a loop (or in a "
+        "function called from one) run "
+        f"{COST_LOOP_ITERATIONS} times per session; each chat call sends ~{COST_PROMPT_TOKENS:,} tokens of user input "
+        f"and context on top of the prompt text in the script; replies are ~{COST_COMPLETION_TOKENS:,} tokens unless "
+        f"max_tokens is set; embedding calls embed ~{COST_EMBEDDING_TOKENS:,} tokens"
+    )
+
+    tiers = " | ".join(f"{tier} ({sessions:,}/day)" for tier, sessions in TRAFFIC_TIERS)
+    table = [f"| Component | Per session | {tiers} |", "|---|---|" + "---|" * len(TRAFFIC_TIERS)]
+    for component in result["components"]:
+        monthly = " | ".join(_dollars(component["monthly"][tier]) for tier, _sessions in TRAFFIC_TIERS)
+        table.append(f"| {component['model']} ({component['provider']}) | {_dollars(component['costPerSession'])} | {monthly} |")
+    totals = " | ".join(f"**{_dollars(result['monthly'][tier])}**" for tier, _sessions in TRAFFIC_TIERS)
+    table.append(f"| **Total** | **{_dollars(result['costPerSession'])}** | {totals} |")
+    notes = [f"Monthly costs over {DAYS_PER_MONTH} days. Prices in USD per 1M tokens from the local pricing table "
+             f"(version {result['pricingVersion']}, prices as of {result['pricesAsOf']})" + (":" if result["components"] else ".")]
+    for component in result["components"]:
+        price = pricing["models"][component["model"]]
+        fee = f" + ${price['perThousandRequests']:g} per 1K requests" if price.get("perThousandRequests") else ""
+        if price.get("local"):
+            billing = "runs locally, no API charge"
+        elif component["kind"] == EMBEDDING:
+            billing = f"${price['input']:g} input"
+        else:
+            billing = f"${price['input']:g} input / ${price['output']:g} output{fee}"
+        notes.append(f"• {component['model']}: {billing} – {pricing['sources'].get(component['provider'], 'no source')}")
+    costly = [component for component in result["components"] if component["costPerSession"] > 0]
+    if costly:
+        top = costly[0]
+        share = top["costPerSession"] / result["costPerSession"]
+        notes.append(f"Most expensive component: {top['model']} ({share:.0%} of the total).")
+        alternative = _alternative(top, pricing)
+        if alternative:
+            notes.append(f"Cheaper drop-in alternative: {alternative[0]}, about {_dollars(alternative[1])}/month "
+                         f"instead of {_dollars(top['monthly']['Moderate'])} at Moderate traffic.")
+    return {"Analysis": "\n".join(analysis), "CostEstimation": "\n".join(table) + "\n\n" + "\n".join(notes)}
+
+
+def conclusion(result: dict, pricing: dict = None) -> str:
+    """A plain-English conclusion for an ``estimate`` result, written without a model."""
+    pricing = pricing or load_pricing()
+    costly = [component for component in result["components"] if component["costPerSession"] > 0]
+    if not costly:
+        return ("No paid model calls were detected, so this agent should not run up per-token API costs; hosting "
+                "and any local models are the only costs. Are there model calls this analysis missed, for example "
+                "through a wrapper library, that should be included?")
+    top = costly[0]
+    sentences = [f"At moderate traffic (1,000 sessions a day) this agent costs about {_dollars(result['monthly']['Moderate'])} "
+                 f"a month, mostly from {top['model']} ({top['provider']})."]
+    alternative = _alternative(top, pricing)
+    if alternative:
+        sentences.append(f"Switching it to {alternative[0]} would bring that part down to about "
+                         f"{_dollars(alternative[1])} a month, if its quality is good enough for the task.")
+    if top["inLoop"]:
+        sentences.append("It is called inside a loop, so batching those calls or caching their results is the biggest lever.")
+    elif top["kind"] == CHAT and not top["maxTokens"]:
+        sentences.append("Setting max_tokens and trimming the prompt are the cheapest levers to pull first.")
+    sentences.append("Would you like deeper optimisation advice, or should any of the usage assumptions be tweaked?")
+    return " ".join(sentences)
@@ -1,7 +1,7 @@
 
 
-import os
-import requests
+import perplexity_client
+import metrics
 from typing import List
 from pydantic import BaseModel
 
@@ -10,15 +10,14 @@ from pydantic import BaseModel
 
 
 
-def call_custom_code_agent( search_filter_custom: List[str], user_prompt: str) -> str:
-    
-    class AnswerFormat(BaseModel):
-        Name: str
-        CLI : str
-        python: str
-        conclusion: str
-    
-    AGENT_SCRIPT_BUILDER_PROMPT = """
+class AnswerFormat(BaseModel):
+    Name: str
+    CLI : str
+    python: str
+    conclusion: str
+
+
+AGENT_SCRIPT_BUILDER_PROMPT = """
     You are a world-class AI engineer with deep expertise in LLM agents,
     information-retrieval and Python tooling. You have unrestricted access to
     Perplexity’s Sonar API, which lets you perform domain-restricted searches
@@ -78,28 +77,51 @@ def call_custom_code_agent( search_filter_custom: List[str], user_prompt: str) -
     YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE json, ABSOLUTELY NOTHING ELSE
     
     """
-    
 
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {"Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"}
-    payload = {
-        "model": "sonar-reasoning-pro",
+# Everything but the per-request fields, built once at import; shared by every request, so never mutate it
+PAYLOAD_TEMPLATE = {
+    "model": "sonar-reasoning-pro",
+    "web_search_options": {
+        "search_context_size": "high"
+    },
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": AnswerFormat.model_json_schema()},
+    },
+}
+SYSTEM_MESSAGE = {"role": "system", "content": AGENT_SCRIPT_BUILDER_PROMPT}
+
+
+@metrics.prompt_stage("custom_code")
+def build_custom_code_payload( search_filter_custom: List[str], user_prompt: str) -> dict:
+    return {
+        **PAYLOAD_TEMPLATE,
         "messages": [
-            {"role": "system", "content": AGENT_SCRIPT_BUILDER_PROMPT},
+            SYSTEM_MESSAGE,
             {"role": "user", "content": user_prompt}
         ],
-        "web_search_options": {
-            "search_context_size": "high"
-        },
         "search_domain_filter": search_filter_custom,
-        "response_format": {
-                "type": "json_schema",
-            "json_schema": {"schema": AnswerFormat.model_json_schema()},
-        }
-        
     }
-    response = requests.post(url, headers=headers, json=payload).json()
-    return response["choices"][0]["message"]["content"]
+
+
+def call_custom_code_agent( search_filter_custom: List[str], user_prompt: str) -> str:
+    return perplexity_client.complete(build_custom_code_payload(search_filter_custom, user_prompt))
+
+
+def stream_custom_code_agent(search_filter_custom: List[str], user_prompt: str):
+    """Yield the raw content deltas of the agent's response as they stream in."""
+    chunks = perplexity_client.stream_chat_completion(build_custom_code_payload(search_filter_custom, user_prompt))
+    yield from perplexity_client.iter_content(chunks)
+
+
+async def acall_custom_code_agent(search_filter_custom: List[str], user_prompt: str) -> str:
+    return await perplexity_client.acomplete(build_custom_code_payload(search_filter_custom, user_prompt))
+
+
+async def astream_custom_code_agent(search_filter_custom: List[str], user_prompt: str):
+    chunks = perplexity_client.astream_chat_completion(build_custom_code_payload(search_filter_custom, user_prompt))
+    async for content in perplexity_client.aiter_content(chunks):
+        yield content
 
 #a=call_custom_code_agent(["https://docs.llamaindex.ai/en/stable/api_reference/"] , "create a chat agent using llamaindex and gemini that allows me to chat with any given webpage given the URL")
 
@@ -0,0 +1,87 @@
+"""Documentation sources used to ground code generation for each stack choice.
+
+``DOC_SOURCES`` maps a configuration tag and value (as produced by the
+recommendations agent or chosen in the wizard) to the documentation URLs
+passed to Perplexity as ``search_domain_filter``. The lookup table is built
+once at import, so resolving a configuration is one dict lookup per tag.
+"""
+import re
+
+DOC_SOURCES = {
+    "framework": {
+        "Langchain": [
+            "https://python.langchain.com/docs/introduction/",
+            "https://python.langchain.com/api_reference/",
+            "https://github.com/langchain-ai/langchain/tree/master/cookbook",
+        ],
+        "LlamaIndex": [
+            "https://docs.llamaindex.ai/en/stable/",
+            "https://docs.llamaindex.ai/en/stable/api_reference/",
+            "https://docs.llamaindex.ai/en/stable/examples/",
+        ],
+        "CrewAI": [
+            "https://docs.crewai.com/api-reference/introduction",
+            "https://docs.crewai.com/introduction",
+            "https://github.com/crewAIInc/crewAI-examples",
+        ],
+        "Langgraph": [
+            "https://langchain-ai.github.io/langgraph/",
+            "https://langchain-ai.github.io/langgraph/reference/",
+            "https://github.com/langchain-ai/langgraph/tree/main/docs/docs/tutorials",
+        ],
+    },
+    "LLM_provider": {
+        "Gemini": ["https://firebase.google.com/docs/ai-logic/models"],
+        "Groq": ["https://console.groq.com/docs"],
+        "Deepseek": ["https://api-docs.deepseek.com/api/deepseek-api"],
+        "Perplexity": ["https://docs.perplexity.ai/home"],
+        "OpenAI": ["https://platform.openai.com/docs/api-reference/introduction"],
+        "Claude": ["https://docs.anthropic.com/en/api/overview"],
+    },
+    "Database_used": {
+        "Pinecone": ["https://docs.pinecone.io/reference/api/introduction"],
+        "Weaviate": ["https://weaviate.io/developers/weaviate/api"],
+    },
+}
+
+# Wizard spellings of the recommendation tags and values
+TAG_ALIASES = {
+    "vectorDb": "Database_used",
+}
+VALUE_ALIASES = {
+    "Anthropic": "Claude",
+    "Google": "Gemini",
+    "Pinecone DB": "Pinecone",
+    "Weaviate DB": "Weaviate",
+}
+
+
+def _normalize(name: str) -> str:
+    """Case- and punctuation-insensitive form, so LLM_provider matches llmProvider and Llamaindex matches LlamaIndex."""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def _build_lookup() -> dict:
+    tags = {_normalize(tag): tag for tag in DOC_SOURCES}
+    tags.update({_normalize(alias): tag for alias, tag in TAG_ALIASES.items()})
+    lookup = {}
+    for tag_name, tag in tags.items():
+        values = DOC_SOURCES[tag]
+        for value, urls in values.items():
+            lookup[tag_name, _normalize(value)] = tuple(urls)
+        for alias, value in VALUE_ALIASES.items():
+            if value in values:
+                lookup[tag_name, _normalize(alias)] = tuple(values[value])
+    return lookup
+
+
+_LOOKUP = _build_lookup()
+
+
+def resolve_search_filters(options: dict) -> list:
+    """Return the deduplicated documentation URLs for a ``{tag: value}`` configuration."""
+    urls = {}
+    for tag, value in (options or {}).items():
+        if isinstance(value, str):
+            urls.update(dict.fromkeys(_LOOKUP.get((_normalize(tag), _normalize(value)), ())))
+    return list(urls)
@@ -0,0 +1,82 @@
+"""Concurrent fan-out of the review agents that run once a chat session ends.
+
+The tech review and cost analysis calls are independent of each other, so
+they are started together and reported as soon as each one finishes. New
+review agents only need an entry in ``REVIEW_AGENTS`` holding their sync
+and async callables.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from tech_review_agent import run_tech_review, arun_tech_review
+from cost_agent import run_cost_analysis, arun_cost_analysis
+
+REVIEW_AGENTS = {
+    "techReview": (
+        lambda python_script, search_context: run_tech_review(search_context, python_script),
+        lambda python_script, search_context: arun_tech_review(search_context, python_script),
+    ),
+    "costAnalysis": (
+        lambda python_script, search_context: run_cost_analysis(python_script),
+        lambda python_script, search_context: arun_cost_analysis(python_script),
+    ),
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FINALIZE_MAX_WORKERS", "8")),
+    thread_name_prefix="finalize",
+)
+
+
+def check_sections(sections) -> list:
+    sections = list(sections or REVIEW_AGENTS)
+    unknown = [name for name in sections if name not in REVIEW_AGENTS]
+    if unknown:
+        raise ValueError(f"Unknown review sections: {', '.join(unknown)}")
+    return sections
+
+
+def run_reviews(python_script: str, search_context: list, sections=None):
+    """Run the selected review agents concurrently.
+
+    Yields ``(section, output, error)`` tuples in completion order, where
+    ``output`` is the raw agent response and ``error`` is the exception
+    raised by a failed agent (``None`` on success).
+    """
+    # Each review runs in a copy of the caller's context so its metrics are attributed to the request
+    futures = {
+        _executor.submit(contextvars.copy_context().run, REVIEW_AGENTS[name][0], python_script, search_context): name
+        for name in check_sections(sections)
+    }
+    return _iter_completed(futures)
+
+
+def _iter_completed(futures: dict):
+    for future in as_completed(futures):
+        error = future.exception()
+        yield futures[future], (None if error else future.result()), error
+
+
+def arun_reviews(python_script: str, search_context: list, sections=None):
+    """Event-loop counterpart of ``run_reviews``, returning an async iterator."""
+    tasks = {
+        asyncio.ensure_future(REVIEW_AGENTS[name][1](python_script, search_context)): name
+        for name in check_sections(sections)
+    }
+    return _aiter_completed(tasks)
+
+
+async def _aiter_completed(tasks: dict):
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                error = task.exception()
+                yield tasks[task], (None if error else task.result()), error
+    finally:
+        # The client went away before every section finished
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,153 @@
+"""Token-budgeted compaction of the chat history sent to the chat agent.
+
+Every chat turn carries a full copy of the agent script (in the user
+message, and again in the assistant's JSON reply), so an unbounded history
+grows as turns x script size. ``compact_history`` keeps the request small:
+
+* ``<think>`` blocks are dropped from past assistant replies,
+* older copies of the script are replaced by a hash reference, or by a
+  unified diff against the current script when that diff is small,
+* the oldest turns are dropped until the history fits the token budget,
+  and replaced by a one-line-per-turn recap of what the user asked.
+"""
+import ast
+import difflib
+import hashlib
+import json
+import os
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "6000"))
+
+# Rough chars-per-token ratio for English prose and Python source
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+# Scripts shorter than this are cheap enough to keep verbatim
+MIN_SCRIPT_CHARS = 200
+RECAP_LINE_CHARS = 120
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def estimate_message_tokens(message: dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def script_reference(script: str, current_code: str) -> str:
+    """Describe an older copy of the script without repeating it."""
+    digest = hashlib.sha256(script.encode("utf-8")).hexdigest()[:12]
+    if script.strip() == current_code.strip():
+        return f"[script sha256:{digest} omitted; identical to the current script]"
+    if current_code:
+        diff = "".join(difflib.unified_diff(
+            current_code.strip().splitlines(keepends=True),
+            script.strip().splitlines(keepends=True),
+            "current", "this_version",
+        ))
+        if len(diff) < len(script) // 4:
+            return f"[script sha256:{digest} shown as a diff from the current script]\n{diff}"
+    return f"[earlier script sha256:{digest} omitted, {script.count(chr(10)) + 1} lines]"
+
+
+def _looks_like_script(text: str) -> bool:
+    if len(text) < MIN_SCRIPT_CHARS:
+        return False
+    try:
+        ast.parse(text)
+    except (SyntaxError, ValueError):
+        return False
+    return True
+
+
+def _split_user_message(content: str, current_code: str):
+    """Split a past user message into (query, embedded script or None)."""
+    if current_code and len(current_code) >= MIN_SCRIPT_CHARS:
+        index = content.find(current_code)
+        if index != -1:
+            return content[:index].rstrip(), current_code
+    query, separator, rest = content.partition("\n\n")
+    if separator and _looks_like_script(rest.strip("\n")):
+        return query.rstrip(), rest.strip("\n")
+    return content, None
+
+
+def _compact_user_message(content: str, current_code: str) -> str:
+    query, script = _split_user_message(content, current_code)
+    if script is None:
+        return content
+    return query + "\n\n" + script_reference(script, current_code)
+
+
+def _compact_assistant_message(content: str, current_code: str) -> str:
+    think_end = content.find("</think>")
+    if think_end != -1:
+        content = content[think_end + len("</think>"):].strip()
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        return content
+    try:
+        reply = json.loads(content[start:end + 1])
+    except json.JSONDecodeError:
+        return content
+    script = reply.get("python") if isinstance(reply, dict) else None
+    if isinstance(script, str) and len(script) >= MIN_SCRIPT_CHARS:
+        reply["python"] = script_reference(script, current_code)
+    return json.dumps(reply, ensure_ascii=False)
+
+
+def _normalize(messages: list) -> list:
+    """Keep role/content only, merge consecutive same-role messages, start on a user turn."""
+    normalized = []
+    for message in messages:
+        role, content = message.get("role"), message.get("content")
+        if role not in ("user", "assistant") or not isinstance(content, str):
+            continue
+        if normalized and normalized[-1]["role"] == role:
+            normalized[-1]["content"] += "\n\n" + content
+        else:
+            normalized.append({"role": role, "content": content})
+    while normalized and normalized[0]["role"] != "user":
+        normalized.pop(0)
+    # The caller appends the current user message, so end on an assistant reply
+    if normalized and normalized[-1]["role"] == "user":
+        normalized.pop()
+    return normalized
+
+
+def _recap(turns: list) -> str:
+    lines = []
+    for user_message, _ in turns:
+        first_line = user_message["content"].strip().split("\n", 1)[0]
+        lines.append("- " + first_line[:RECAP_LINE_CHARS])
+    return "Earlier in this conversation (summarised) the user asked:\n" + "\n".join(lines)
+
+
+def compact_history(messages: list, current_code: str = "", budget: int = None) -> list:
+    """Return a copy of ``messages`` deduplicated and trimmed to ``budget`` tokens."""
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+    normalized = _normalize(messages)
+    for message in normalized:
+        if message["role"] == "user":
+            message["content"] = _compact_user_message(message["content"], current_code)
+        else:
+            message["content"] = _compact_assistant_message(message["content"], current_code)
+
+    turns = [(normalized[i], normalized[i + 1]) for i in range(0, len(normalized), 2)]
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        cost = sum(estimate_message_tokens(message) for message in turn)
+        if kept and used + cost > budget:
+            break
+        kept.insert(0, turn)
+        used += cost
+
+    dropped = turns[:len(turns) - len(kept)]
+    history = [message for turn in kept for message in turn]
+    if dropped:
+        history[0] = {
+            "role": "user",
+            "content": _recap(dropped) + "\n\n" + history[0]["content"],
+        }
+    return history
@@ -0,0 +1,162 @@
+"""Local classifier for the intent of a chat message.
+
+The chat agent has to decide whether the user wants a ``Code_change`` or is
+``Cross_questioning`` (asking how or why the agent works). Sending every
+turn to the reasoning model with the full code-rewrite schema just to make
+that decision is slow and expensive, so it is made here first, in-process:
+
+* a handful of regex rules (an imperative edit verb up front, an error
+  message or traceback, a question word or question mark, ...) become
+  features alongside the message's word unigrams and bigrams,
+* a logistic regression over those features, trained on
+  ``intent_examples.jsonl`` and shipped as weights in ``intent_model.json``,
+  gives the probability that the message asks for a code change.
+
+Only a confident ``Cross_questioning`` is acted on (see ``chat_agent``);
+anything that might be a code change still goes to the reasoning model, and
+so does any message that names an edit or a wish anywhere in it ("Does it
+stream? If not, add it.", "How about adding memory?"), whatever it scores.
+Retrain after editing the examples with ``python intent_classifier.py``.
+"""
+import functools
+import json
+import math
+import os
+import random
+import re
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+INTENT_MODEL_PATH = os.getenv("AI_INTENT_MODEL_PATH", os.path.join(MODULE_DIR, "intent_model.json"))
+INTENT_EXAMPLES_PATH = os.path.join(MODULE_DIR, "intent_examples.jsonl")
+# Lowest probability of Cross_questioning that skips the reasoning model
+INTENT_THRESHOLD = float(os.getenv("AI_INTENT_THRESHOLD", "0.95"))
+
+CODE_CHANGE = "Code_change"
+CROSS_QUESTIONING = "Cross_questioning"
+
+_WORD = re.compile(r"[a-z0-9_']+")
+_LEAD_IN = r"^\s*(?:(?:ok(?:ay)?|now|also|and|then|please|pls|hey|so)[\s,]+)*(?:(?:can|could|would|will) you\s+|let'?s\s+)?"
+RULES = {
+    "edit_verb": re.compile(
+        _LEAD_IN + r"(?:please\s+)?(?:add|change|fix|replace|remove|delete|rename|refactor|implement|update|upgrade|"
+        r"use|switch|swap|make|convert|port|turn|modify|rewrite|write|set|increase|decrease|lower|raise|"
+        r"extend|integrate|include|handle|support|optimi[sz]e|clean|parallelize|wrap|build|save|install|"
+        r"store|let|give|drop|move|split|merge|enable|disable)\b",
+        re.IGNORECASE,
+    ),
+    "error_report": re.compile(
+        r"traceback|\b\w+(?:error|exception)\b|\berror:|\bcrash|\bbug\b|doesn'?t work|does not work|not working|\bhangs?\b|\bbroken\b|\b[45]\d\d\b",
+        re.IGNORECASE,
+    ),
+    "wish": re.compile(r"\b(?:i want|i need|i'd like|it should|should also|instead of|so that)\b", re.IGNORECASE),
+    "question_start": re.compile(
+        r"^\s*(?:what|what's|why|how|which|where|when|who|is|are|does|do|did|will|would|should|can it|could it|"
+        r"is there|are there|in which)\b",
+        re.IGNORECASE,
+    ),
+    "explain": re.compile(
+        r"\b(?:explain|walk me through|tell me|describe|summari[sz]e|overview|understand|what is|meaning)\b",
+        re.IGNORECASE,
+    ),
+    "question_mark": re.compile(r"\?\s*$"),
+    "code_block": re.compile(r"```|^\s*(?:def|class|import|from)\s", re.MULTILINE),
+}
+# A change request phrased as a question; never answered from the question path
+_EDIT_ANYWHERE = re.compile(
+    r"\b(?:add|adding|change|changing|replace|remove|delete|rename|refactor|implement|switch|swap|modify|rewrite|"
+    r"convert|integrate|how about|what about|why not|can you make|could you make|if not)\b",
+    re.IGNORECASE,
+)
+
+
+def features(message: str) -> list:
+    """The sparse binary features of a message."""
+    words = _WORD.findall(message.lower())
+    found = {f"w:{word}" for word in words}
+    found.update(f"b:{first} {second}" for first, second in zip(words, words[1:]))
+    if words:
+        found.add(f"first:{words[0]}")
+    found.update(f"rule:{name}" for name, pattern in RULES.items() if pattern.search(message))
+    return sorted(found)
+
+
+@functools.lru_cache(maxsize=None)
+def load_model(path: str = INTENT_MODEL_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def code_change_probability(message: str, model: dict = None) -> float:
+    model = model or load_model()
+    weights = model["weights"]
+    score = model["bias"] + sum(weights.get(feature, 0.0) for feature in features(message))
+    return 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, score))))
+
+
+def classify(message: str, model: dict = None) -> tuple:
+    """``(intent, confidence)`` for a chat message."""
+    probability = code_change_probability(message, model)
+    if probability >= 0.5:
+        return CODE_CHANGE, probability
+    return CROSS_QUESTIONING, 1.0 - probability
+
+
+def confident_question(message: str, threshold: float = INTENT_THRESHOLD) -> bool:
+    """True if ``message`` is a question about the agent and not, however it is phrased, a request or a failure report."""
+    if not message.strip() or any(
+        pattern.search(message)
+        for pattern in (_EDIT_ANYWHERE, RULES["wish"], RULES["edit_verb"], RULES["error_report"], RULES["code_block"])
+    ):
+        return False
+    intent, confidence = classify(message)
+    return intent == CROSS_QUESTIONING and confidence >= threshold
+
+
+def train(examples: list, epochs: int = 300, learning_rate: float = 0.5, l2: float = 0.01, seed: int = 0) -> dict:
+    """Fit the logistic regression on ``(message, intent)`` pairs with SGD."""
+    rows = [(features(message), 1.0 if intent == CODE_CHANGE else 0.0) for message, intent in examples]
+    weights, bias = {}, 0.0
+    rng = random.Random(seed)
+    for epoch in range(epochs):
+        rng.shuffle(rows)
+        rate = learning_rate / (1 + epoch * 0.05)
+        for row_features, label in rows:
+            score = bias + sum(weights.get(feature, 0.0) for feature in row_features)
+            error = 1.0 / (1.0 + math.exp(-max(-30.0, min(30.0, score)))) - label
+            bias -= rate * error
+            for feature in row_features:
+                weight = weights.get(feature, 0.0)
+                weights[feature] = weight - rate * (error + l2 * weight)
+    return {
+        "version": 1,
+        "bias": round(bias, 4),
+        "weights": {feature: round(weight, 4) for feature, weight in sorted(weights.items()) if abs(weight) >= 0.001},
+    }
+
+
+def load_examples(path: str = INTENT_EXAMPLES_PATH) -> list:
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row["message"], row["intent"]) for row in rows]
+
+
+def cross_validate(examples: list, folds: int = 5) -> float:
+    """Accuracy of models trained on ``folds - 1`` folds and scored on the remaining one."""
+    shuffled = list(examples)
+    random.Random(1).shuffle(shuffled)
+    correct = 0
+    for fold in range(folds):
+        held_out = shuffled[fold::folds]
+        model = train([example for index, example in enumerate(shuffled) if index % folds != fold])
+        correct += sum(classify(message, model)[0] == intent for message, intent in held_out)
+    return correct / len(shuffled)
+
+
+if __name__ == "__main__":
+    examples = load_examples()
+    print(f"{len(examples)} examples, cross-validated accuracy {cross_validate(examples):.3f}")
+    model = train(examples)
+    with open(INTENT_MODEL_PATH, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=0, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {len(model['weights'])} weights to {INTENT_MODEL_PATH}")
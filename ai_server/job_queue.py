@@ -0,0 +1,326 @@
+"""Background jobs for the long-running generation routes.
+
+``POST /api/ai/jobs`` stores the request in SQLite and returns a job ID at
+once; a bounded pool of worker threads runs the agent call and records its
+progress and result, which clients poll at ``/api/ai/jobs/<id>`` or follow
+as SSE at ``/api/ai/jobs/<id>/events``. The result has the same shape as
+the matching synchronous route.
+
+Every server process runs its own workers against the shared database, so
+throughput scales with ``AI_JOB_WORKERS`` x processes rather than with the
+web tier. Each user (``X-User-Id`` header or ``userId`` field) has at most
+``AI_JOB_MAX_RUNNING_PER_USER`` jobs running at once; further jobs wait in
+the queue. Jobs left running by a process that died are re-queued when the
+next process starts.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from chat_agent import chat_turn, CHAT_EDIT_MODE
+from chat_sessions import chat_inputs, remember_turn
+from custom_code_agent import stream_custom_code_agent, AnswerFormat as CustomCodeAnswer
+from walk_me_through_code_agent import stream_walk_me_through_code_agent, AnswerFormat as WalkthroughAnswer
+from doc_registry import resolve_search_filters
+from responses import format_code_output, format_chat_response
+from sse import format_event
+from stream_parser import IncrementalFieldParser
+from structured_output import parse_agent_output
+from script_validation import validate_code_answer
+
+JOB_DB_PATH = os.getenv("AI_JOB_DB_PATH", "ai_jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("AI_JOB_WORKERS", "8"))
+JOB_MAX_RUNNING_PER_USER = int(os.getenv("AI_JOB_MAX_RUNNING_PER_USER", "2"))
+JOB_MAX_QUEUED_PER_USER = int(os.getenv("AI_JOB_MAX_QUEUED_PER_USER", "20"))
+# Finished jobs are deleted after this many seconds
+JOB_RETENTION = float(os.getenv("AI_JOB_RETENTION", "86400"))
+POLL_INTERVAL = float(os.getenv("AI_JOB_POLL_INTERVAL", "1"))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobQueueFull(Exception):
+    """The user already has the maximum number of queued jobs."""
+
+
+def _generate_code(deltas, answer_format, report) -> dict:
+    """Consume a code-generation stream, reporting each JSON field as it completes."""
+    parser = IncrementalFieldParser()
+    content = []
+    for delta in deltas:
+        content.append(delta)
+        if parser.feed(delta):
+            report({"fields": list(parser.fields), "chars": sum(len(part) for part in content)})
+    return format_code_output(validate_code_answer(parse_agent_output("".join(content), answer_format)))
+
+
+def _run_custom(data: dict, report) -> dict:
+    deltas = stream_custom_code_agent(data.get('searchFilters', []), data.get('prompt', ''))
+    return _generate_code(deltas, CustomCodeAnswer, report)
+
+
+def _run_walkthrough(data: dict, report) -> dict:
+    options = data.get('options', {})
+    tech_stack = data.get('techStack', '') or json.dumps(options, indent=2)
+    deltas = stream_walk_me_through_code_agent(resolve_search_filters(options), tech_stack, data.get('prompt', ''))
+    return _generate_code(deltas, WalkthroughAnswer, report)
+
+
+def _run_chat(data: dict, report) -> dict:
+    context_urls, current_code, message, messages_history = chat_inputs(data)
+    response_json = chat_turn(
+        context_urls, current_code, message, messages_history, data.get('editMode', CHAT_EDIT_MODE) == 'edits'
+    )
+    remember_turn(data, response_json)
+    return format_chat_response(response_json)
+
+
+# Job kind -> handler taking the route's request body and a progress callback
+JOB_KINDS = {
+    "custom": _run_custom,
+    "walkthrough": _run_walkthrough,
+    "chat": _run_chat,
+}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """SQLite-backed job store with a pool of worker threads in this process."""
+
+    def __init__(self, path: str = JOB_DB_PATH, workers: int = JOB_WORKERS,
+                 max_running_per_user: int = JOB_MAX_RUNNING_PER_USER,
+                 max_queued_per_user: int = JOB_MAX_QUEUED_PER_USER):
+        self.path = path
+        self.workers = workers
+        self.max_running_per_user = max_running_per_user
+        self.max_queued_per_user = max_queued_per_user
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " user_id TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " request TEXT NOT NULL,"
+                " progress TEXT,"
+                " result TEXT,"
+                " error TEXT,"
+                " owner_pid INTEGER,"
+                " created_at REAL NOT NULL,"
+                " started_at REAL,"
+                " finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._requeue_orphans()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _requeue_orphans(self):
+        conn = self._connect()
+        rows = conn.execute("SELECT id, owner_pid FROM jobs WHERE status = 'running'").fetchall()
+        for row in rows:
+            # Our own pid here belongs to an earlier process, e.g. PID 1 of a restarted container
+            pid = row["owner_pid"]
+            if pid is None or pid == os.getpid() or not _pid_alive(pid):
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner_pid = NULL, started_at = NULL WHERE id = ? AND status = 'running'",
+                    (row["id"],),
+                )
+
+    def start(self):
+        """Start the worker threads; safe to call more than once."""
+        with self._wakeup:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, kind: str, data: dict, user_id: str) -> str:
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        conn = self._connect()
+        queued = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status = 'queued'", (user_id,)
+        ).fetchone()[0]
+        if queued >= self.max_queued_per_user:
+            raise JobQueueFull(f"User {user_id} already has {queued} queued jobs")
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (id, kind, user_id, status, request, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+            (job_id, kind, user_id, json.dumps(data), time.time()),
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "createdAt": row["created_at"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"],
+        }
+
+    def _claim(self):
+        """Atomically move the oldest runnable job to running; return its row or None."""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM jobs WHERE status = 'queued' LIMIT 1").fetchone() is None:
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM jobs AS j WHERE status = 'queued' AND"
+                " (SELECT COUNT(*) FROM jobs WHERE user_id = j.user_id AND status = 'running') < ?"
+                " ORDER BY created_at LIMIT 1",
+                (self.max_running_per_user,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner_pid = ?, started_at = ? WHERE id = ?",
+                    (os.getpid(), time.time(), row["id"]),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row
+
+    def _finish(self, job_id: str, result=None, error: str = None):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            ("failed" if error is not None else "succeeded", json.dumps(result) if error is None else None, error, now, job_id),
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (now - JOB_RETENTION,)
+        )
+        # A finished job may unblock a queued job of the same user
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _work(self):
+        while True:
+            try:
+                row = self._claim()
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                with self._wakeup:
+                    self._wakeup.wait(POLL_INTERVAL)
+                continue
+            job_id = row["id"]
+
+            def report(progress: dict):
+                self._connect().execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+            try:
+                result = JOB_KINDS[row["kind"]](json.loads(row["request"]), report)
+            except Exception as e:
+                self._finish(job_id, error=str(e))
+            else:
+                self._finish(job_id, result=result)
+
+    def stats(self) -> dict:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"workers": self.workers, **{status: count for status, count in rows}}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue, starting its workers on first use.
+
+    Both servers call this at startup so that jobs re-queued from a dead
+    process are picked up without waiting for the next job request.
+    """
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+                _queue.start()
+    return _queue
+
+
+def _events_since(job: dict, last: dict) -> list:
+    events = []
+    if job["status"] != last.get("status"):
+        events.append(format_event("status", {"id": job["id"], "status": job["status"]}))
+    if job["progress"] is not None and job["progress"] != last.get("progress"):
+        events.append(format_event("progress", job["progress"]))
+    if job["status"] == "succeeded":
+        events.append(format_event("done", {"success": True, **job["result"]}))
+    elif job["status"] == "failed":
+        events.append(format_event("error", {"success": False, "error": job["error"]}))
+    return events
+
+
+def job_events(queue: JobQueue, job_id: str, interval: float = 0.5):
+    """Yield SSE status and progress events for a job until it finishes."""
+    last = {}
+    while True:
+        job = queue.get(job_id)
+        if job is None:
+            yield format_event("error", {"success": False, "error": f"Unknown job: {job_id}"})
+            return
+        yield from _events_since(job, last)
+        if job["status"] in TERMINAL_STATUSES:
+            return
+        last = job
+        time.sleep(interval)
+
+
+async def ajob_events(queue: JobQueue, job_id: str, interval: float = 0.5):
+    last = {}
+    while True:
+        job = await asyncio.to_thread(queue.get, job_id)
+        if job is None:
+            yield format_event("error", {"success": False, "error": f"Unknown job: {job_id}"})
+            return
+        for event in _events_since(job, last):
+            yield event
+        if job["status"] in TERMINAL_STATUSES:
+            return
+        last = job
+        await asyncio.sleep(interval)
+
+
+def job_user(data: dict, headers) -> str:
+    return str(headers.get('X-User-Id') or data.get('userId') or 'anonymous')
@@ -4,39 +4,16 @@ import sseclient
 import json
 from chat_agent import query_perplexity
 from recommendations_agent import get_recommendations
-from tech_review_agent import run_tech_review
 from walk_me_through_code_agent import walk_me_through_code_agent
-from cost_agent import run_cost_analysis
 from custom_code_agent import call_custom_code_agent
 from personality_agent import stream_personality_response
-import xml.etree.ElementTree as ET
-import html
-import re
+from finalize import run_reviews
+from doc_registry import resolve_search_filters
+from structured_output import parse_agent_output
 
 user_prompt = "I want to build an agent that can chat with me about my documents"
 
 search_contxt=[]
-def xml_to_json(xml_string: str) -> dict:
-    def escape_text_content(xml_str: str) -> str:
-        return re.sub(
-            r'>([^<]+)<',
-            lambda m: f">{html.escape(m.group(1))}<",
-            xml_str
-        )
-
-    safe_xml = escape_text_content(xml_string)
-    try:
-        root = ET.fromstring(safe_xml)
-    except ET.ParseError as e:
-        raise ValueError(f"Invalid XML: {e}")
-    def element_to_dict(elem):
-        return {
-            child.tag: html.unescape((child.text or "").strip())
-            for child in elem
-        }
-
-    return element_to_dict(root)
-
 path=1
 
 name={}
@@ -50,7 +27,7 @@ if (path==1):
     options_json = {}
     justifications_json ={}
 
-    main_json = xml_to_json(recommendations)
+    main_json = parse_agent_output(recommendations)
 
     def split_json_by_justification(data: dict) -> tuple[dict, dict]:
         justification_json = {}
@@ -68,114 +45,11 @@ if (path==1):
     #### Justifications streamed to the frontend 
     options_json_string = json.dumps(options_json, indent=2)
 
-    search_filter_context =[]
-    def handle_agent_config(tag: str, value: str):
-        match tag:
-            case "approach":
-                match value:
-                    case "Single_Agent":
-                        print("You selected a single-agent setup.")
-                    case "Multi_Agent":
-                        print("You selected a multi-agent setup.")
-                    case _:
-                        print("Unknown approach selected.")
-
-            case "framework":
-                match value:
-                    case "Langchain":
-                        print("Langchain selected.")
-                        search_filter_context.append("https://python.langchain.com/docs/introduction/")
-                        search_filter_context.append("https://python.langchain.com/api_reference/")
-                        search_filter_context.append("https://github.com/langchain-ai/langchain/tree/master/cookbook")
-                    case "LlamaIndex":
-                        print("LlamaIndex selected.")
-                        search_filter_context.append("https://docs.llamaindex.ai/en/stable/")
-                        search_filter_context.append("https://docs.llamaindex.ai/en/stable/api_reference/")
-                        search_filter_context.append("https://docs.llamaindex.ai/en/stable/examples/")
-                    case "CrewAI":
-                        print("CrewAI selected.")
-                        search_filter_context.append("https://docs.crewai.com/api-reference/introduction")
-                        search_filter_context.append("https://docs.crewai.com/introduction")
-                        search_filter_context.append("https://github.com/crewAIInc/crewAI-examples")
-                    case "Langgraph":
-                        print("Langgraph selected.")
-                        search_filter_context.append("https://langchain-ai.github.io/langgraph/")
-                        search_filter_context.append("https://langchain-ai.github.io/langgraph/reference/")
-                        search_filter_context.append("https://github.com/langchain-ai/langgraph/tree/main/docs/docs/tutorials")
-                        
-                    case _:
-                        print("Unknown framework.")
-
-            case "LLM_provider":
-                match value:
-                    case "Gemini":
-                        print("Using Gemini as LLM provider.")
-                        search_filter_context.append("https://firebase.google.com/docs/ai-logic/models")
-                    case "Groq":
-                        print("Using Groq as LLM provider.")
-                        search_filter_context.append("https://console.groq.com/docs")
-
-                    case "Deepseek":
-                        print("Using Deepseek as LLM provider.")
-                        search_filter_context.append("https://api-docs.deepseek.com/api/deepseek-api")
-                    case "Perplexity":
-                        print("Using Perplexity as LLM provider.")
-                        search_filter_context.append("https://docs.perplexity.ai/home")
-                    case "OpenAI":
-                        print("Using OpenAI as LLM provider.")
-                        search_filter_context.append("https://platform.openai.com/docs/api-reference/introduction")
-                    case "Claude":
-                        print("Using Claude as LLM provider.")
-                        search_filter_context.append("https://docs.anthropic.com/en/api/overview")
-                    case _:
-                        print("Unknown LLM provider.")
-
-            case "Tool_use":
-                match value:
-                    case "RAG":
-                        print("Tool usage is RAG.")
-                    case "Websurf":
-                        print("Tool usage is Websurf.")
-                    case "Both":
-                        print("Using both RAG and Websurf.")
-                    case _:
-                        print("Unknown tool usage.")
-
-            case "Embedder":
-                match value:
-                    case "Huggingface":
-                        print("Using Huggingface for embeddings.")
-                    case "Gemini":
-                        print("Using Gemini for embeddings.")
-                    case "OpenAI":
-                        print("Using OpenAI for embeddings.")
-                    case _:
-                        print("Unknown embedder.")
-
-            case "Database_used":
-                match value:
-                    case "Chroma":
-                        print("Using Chroma as the vector database.")
-                    case "Pinecone":
-                        print("Using Pinecone as the vector database.")
-                        search_filter_context.append("https://docs.pinecone.io/reference/api/introduction")
-                    case "Weaviate":
-                        print("Using Weaviate as the vector database.")
-                        search_filter_context.append("https://weaviate.io/developers/weaviate/api")
-                    case _:
-                        print("Unknown vector DB selected.")
-
-            case _:
-                print(f"Tag '{tag}' is not handled.")
-
-    for tag, value in options_json.items():
-        handle_agent_config(tag, value)
-        
-    print(search_filter_context)
+    search_filter_context = resolve_search_filters(options_json)
 
     walk_me_through_output = walk_me_through_code_agent(search_filter_context,options_json_string,user_prompt)
 
-    walk_me_through_output_json = xml_to_json(walk_me_through_output)
+    walk_me_through_output_json = parse_agent_output(walk_me_through_output)
     
     name = walk_me_through_output_json["Name"]
     cli = walk_me_through_output_json["CLI"]
@@ -193,7 +67,7 @@ else :
         i+=1
     
     custom_code_output = call_custom_code_agent(search_filter_custom,user_prompt)
-    custom_code_output_json = xml_to_json(custom_code_output)
+    custom_code_output_json = parse_agent_output(custom_code_output)
     name = custom_code_output_json["Name"]
     cli = custom_code_output_json["CLI"]
     python = custom_code_output_json["python"]
@@ -219,7 +93,7 @@ while (stop==0):
         search_filter_custom_chat.pop(0)
     query = input("Enter user query")
     query_perplexity_output =query_perplexity(search_filter_custom_chat , python["python"] , query, messages_incoming)
-    query_perplexity_output_json= xml_to_json(query_perplexity_output)
+    query_perplexity_output_json= parse_agent_output(query_perplexity_output)
     if (query_perplexity_output_json["Request_type"]!="Cross_questioning"):
         if (cli["CLI"]!=query_perplexity_output_json["CLI"]):
             ## matlab change hua h
@@ -230,8 +104,10 @@ while (stop==0):
             cli["python"] = query_perplexity_output_json["python"] 
             #### add trigger to re-send new code to frontend 
     
-    stream_personality_response(query_perplexity_output_json["Response"])
     #### stream to frontend 
+    for personality_chunk in stream_personality_response(query_perplexity_output_json["Response"]):
+        print(personality_chunk, end="", flush=True)
+    print()
     temp_stop= input(int("Stop chat session?: yes->1 , no->0"))
     messages_incoming.append({"role": "user" , "content" : query + "\n\n\n" + python["python"]  } ,{"role":"assistant" , "content": query_perplexity_output})
     
@@ -243,11 +119,16 @@ while (stop==0):
 
 #################call the cost cutters and rest 
 
-tech_review_output = run_tech_review(search_contxt , python["python"])
-tech_review_output_json = xml_to_json(tech_review_output)
-#### stream ScriptSummary , TechnicalImprovements , FeatureSuggestions , Conclusion on frontend 
-
-
-cost_review_output = run_cost_analysis(python["python"])
-cost_review_output_json = xml_to_json(cost_review_output)
-#### stream Analysis , CostEstimation , Conclusion on frontend
+#### tech review and cost analysis are independent, so run them concurrently
+review_outputs_json = {}
+for section, review_output, error in run_reviews(python["python"], search_contxt):
+    if error is not None:
+        print(f"{section} failed: {error}")
+        continue
+    review_outputs_json[section] = parse_agent_output(review_output)
+    #### stream each section on frontend as soon as it finishes
+
+tech_review_output_json = review_outputs_json.get("techReview", {})
+#### ScriptSummary , TechnicalImprovements , FeatureSuggestions , Conclusion
+cost_review_output_json = review_outputs_json.get("costAnalysis", {})
+#### Analysis , CostEstimation , Conclusion
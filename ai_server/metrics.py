@@ -0,0 +1,252 @@
+"""Per-stage latency and token metrics in Prometheus text format.
+
+Each request's stages (request parse, prompt assembly, upstream connect,
+time to first token, upstream total, ``<think>`` stripping, JSON parse and
+response serialization) are observed into ``ai_stage_duration_seconds``,
+and the prompt and completion tokens Perplexity reports are counted per
+agent and model, as are the model router's choices. ``render()`` produces the exposition served at
+``/api/ai/metrics``; with ``AI_SERVER_TIMING=1`` (or an ``X-Server-Timing: 1``
+request header) the stage durations of a request are also returned in its
+``Server-Timing`` header.
+
+The current request and agent are tracked in context variables, so work
+that a request fans out to a thread pool must run in a copy of its context.
+Metrics are per process.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SERVER_TIMING = os.getenv("AI_SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_text(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = ['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _label_text(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _label_text(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {count}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, labels)} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("ai_stage_duration_seconds", "Time spent in each stage of a request.", ("route", "stage"))
+REQUEST_SECONDS = Histogram("ai_request_duration_seconds", "Time to produce the response of a route.", ("route", "status"))
+UPSTREAM_REQUESTS = Counter("ai_upstream_requests_total", "Upstream chat completion calls.", ("agent", "model", "outcome"))
+UPSTREAM_TOKENS = Counter("ai_upstream_tokens_total", "Tokens reported by the upstream API.", ("agent", "model", "type"))
+MODEL_ROUTES = Counter("ai_model_routes_total", "Models chosen by the model router, and why.", ("agent", "model", "reason"))
+REGISTRY = (STAGE_SECONDS, REQUEST_SECONDS, UPSTREAM_REQUESTS, UPSTREAM_TOKENS, MODEL_ROUTES)
+
+
+class RequestTimings:
+    def __init__(self, route: str, server_timing: bool = False):
+        self.route = route
+        self.server_timing = server_timing
+        self.started = time.perf_counter()
+        self.stages = {}
+        # Upstream models called by the request, in order; a dict is used as an ordered set
+        self.models = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def header(self) -> str:
+        with self._lock:
+            stages = dict(self.stages)
+        total = time.perf_counter() - self.started
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_request = contextvars.ContextVar("ai_request_timings", default=None)
+current_agent = contextvars.ContextVar("ai_agent", default="unknown")
+
+
+def begin_request(route: str, server_timing: bool = False) -> RequestTimings:
+    timings = RequestTimings(route, server_timing or SERVER_TIMING)
+    _request.set(timings)
+    return timings
+
+
+def end_request(status: int):
+    """Observe the request duration and return its timings, or None outside a request."""
+    timings = _request.get()
+    if timings is None:
+        return None
+    REQUEST_SECONDS.observe(time.perf_counter() - timings.started, timings.route, str(status))
+    return timings
+
+
+def record(stage: str, seconds: float):
+    timings = _request.get()
+    STAGE_SECONDS.observe(seconds, timings.route if timings is not None else "background", stage)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+class AgentPayload(dict):
+    """An upstream payload labelled with the agent whose builder made it."""
+
+    def __init__(self, payload: dict, agent: str):
+        super().__init__(payload)
+        self.agent = agent
+
+
+@contextmanager
+def agent_scope(payload: dict):
+    """Label the upstream calls made inside the block with the agent that built ``payload``.
+
+    Payloads that no ``prompt_stage`` builder made keep the current label.
+    """
+    token = current_agent.set(getattr(payload, "agent", current_agent.get()))
+    try:
+        yield
+    finally:
+        current_agent.reset(token)
+
+
+def prompt_stage(agent: str):
+    """Decorate an agent's payload builder: time it as prompt assembly and label its payload with ``agent``.
+
+    The label is only current while the builder runs; ``perplexity_client``
+    applies it again, with ``agent_scope``, to the calls made with the payload.
+    """
+    def decorator(build):
+        @functools.wraps(build)
+        def wrapper(*args, **kwargs):
+            token = current_agent.set(agent)
+            try:
+                with stage("prompt_assembly"):
+                    return AgentPayload(build(*args, **kwargs), agent)
+            finally:
+                current_agent.reset(token)
+        return wrapper
+    return decorator
+
+
+def record_upstream(model: str, outcome: str):
+    UPSTREAM_REQUESTS.inc(1, current_agent.get(), model, outcome)
+    timings = _request.get()
+    if timings is not None:
+        timings.models[model] = None
+
+
+def record_route(model: str, reason: str):
+    MODEL_ROUTES.inc(1, current_agent.get(), model, reason)
+
+
+def request_models() -> str:
+    """The upstream models the current request has called so far, comma-separated."""
+    timings = _request.get()
+    return ", ".join(timings.models) if timings is not None else ""
+
+
+def record_usage(model: str, usage: dict):
+    agent = current_agent.get()
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            UPSTREAM_TOKENS.inc(tokens, agent, model, kind)
+
+
+class ConnectTrace:
+    """httpx ``trace`` extension recording the time spent opening a new upstream connection."""
+
+    def __init__(self):
+        self.started = None
+        self.ended = None
+
+    def __call__(self, event: str, info: dict):
+        if event == "connection.connect_tcp.started":
+            self.started = time.perf_counter()
+        elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.ended = time.perf_counter()
+        elif event.endswith("send_request_headers.started") and self.started is not None:
+            record("upstream_connect", (self.ended or time.perf_counter()) - self.started)
+            self.started = self.ended = None
+
+    async def atrace(self, event: str, info: dict):
+        self(event, info)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
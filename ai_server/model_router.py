@@ -0,0 +1,194 @@
+"""Latency- and error-aware choice of the Perplexity model for each agent.
+
+Every routed agent has a policy: the model it prefers, a faster and cheaper
+fallback, and an SLO for the p95 latency of its calls in seconds. The
+router keeps a rolling window of the completed upstream calls of each agent
+and model, and sends an agent's calls to its fallback while the preferred
+model
+
+* has a p95 latency above the SLO,
+* fails more than ``ROUTER_MAX_ERROR_RATE`` of its calls, or
+* is rate limited: its circuit is open, or the call would queue for longer
+  than the policy's ``maxQueueWait`` before the rate limiter admits it.
+
+Latency depends on the prompt as much as on the model, so it is tracked per
+agent: slow code generations on ``sonar-reasoning-pro`` do not downgrade
+chat. While an agent is downgraded for latency or errors, one call per
+``ROUTER_PROBE_INTERVAL`` still goes to the preferred model so the router
+notices when it recovers; the fallback is only used while it is healthier.
+
+Policies default to ``DEFAULT_POLICIES`` and can be overridden per agent
+with a JSON object in ``AI_MODEL_ROUTES``, e.g.
+``{"chat": {"preferred": "sonar-pro", "fallback": "sonar", "slo": 15}}``.
+Agents without a policy keep the model of their payload. The models a
+request called are reported in its ``X-AI-Model`` header.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+import rate_limit
+
+DEFAULT_POLICIES = {
+    # Interactive: keep answers coming during upstream slowdowns
+    "chat": {"preferred": "sonar-reasoning-pro", "fallback": "sonar-pro", "slo": 30, "maxQueueWait": 2},
+    "chat_question": {"preferred": "sonar-pro", "fallback": "sonar", "slo": 15, "maxQueueWait": 2},
+    "custom_code": {"preferred": "sonar-reasoning-pro", "fallback": "sonar-pro", "slo": 90, "maxQueueWait": 10},
+    "walkthrough": {"preferred": "sonar-reasoning-pro", "fallback": "sonar-pro", "slo": 90, "maxQueueWait": 10},
+    "recommendations": {"preferred": "sonar-pro", "fallback": "sonar", "slo": 30, "maxQueueWait": 5},
+    "tech_review": {"preferred": "sonar-pro", "fallback": "sonar", "slo": 45, "maxQueueWait": 10},
+    "tech_review_chunk": {"preferred": "sonar-pro", "fallback": "sonar", "slo": 20, "maxQueueWait": 10},
+    "tech_review_reduce": {"preferred": "sonar-pro", "fallback": "sonar", "slo": 30, "maxQueueWait": 10},
+    "cost_analysis": {"preferred": "sonar-pro", "fallback": "sonar", "slo": 45, "maxQueueWait": 10},
+    "cost_conclusion": {"preferred": "sonar", "slo": 15, "maxQueueWait": 5},
+}
+ROUTE_POLICIES = {
+    agent: {**DEFAULT_POLICIES.get(agent, {}), **policy}
+    for agent, policy in {**DEFAULT_POLICIES, **json.loads(os.getenv("AI_MODEL_ROUTES", "{}"))}.items()
+}
+
+MODEL_ROUTING = os.getenv("AI_MODEL_ROUTING", "1") == "1"
+# Calls older than this many seconds leave the rolling window
+ROUTER_WINDOW = float(os.getenv("AI_ROUTER_WINDOW", "300"))
+ROUTER_WINDOW_SIZE = int(os.getenv("AI_ROUTER_WINDOW_SIZE", "100"))
+# Fewer calls than this in the window say nothing about a model
+ROUTER_MIN_SAMPLES = int(os.getenv("AI_ROUTER_MIN_SAMPLES", "5"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("AI_ROUTER_MAX_ERROR_RATE", "0.25"))
+ROUTER_PROBE_INTERVAL = float(os.getenv("AI_ROUTER_PROBE_INTERVAL", "30"))
+
+
+class CallWindow:
+    """Completed calls of one agent and model over the last ``ROUTER_WINDOW`` seconds."""
+
+    def __init__(self):
+        self.calls = deque(maxlen=ROUTER_WINDOW_SIZE)
+        self.last_sent = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds, now: float):
+        """Record a call; ``seconds`` is None for a failed one."""
+        with self.lock:
+            self.calls.append((now, seconds))
+
+    def snapshot(self, now: float) -> dict:
+        with self.lock:
+            while self.calls and self.calls[0][0] < now - ROUTER_WINDOW:
+                self.calls.popleft()
+            latencies = sorted(seconds for _at, seconds in self.calls if seconds is not None)
+            count = len(self.calls)
+        return {
+            "calls": count,
+            "errorRate": (count - len(latencies)) / count if count else 0.0,
+            "p95": latencies[math.ceil(0.95 * len(latencies)) - 1] if latencies else None,
+        }
+
+    def sent(self, now: float):
+        with self.lock:
+            self.last_sent = now
+
+    def claim_probe(self, now: float) -> bool:
+        """True for one caller per ``ROUTER_PROBE_INTERVAL``."""
+        with self.lock:
+            if now - self.last_sent < ROUTER_PROBE_INTERVAL:
+                return False
+            self.last_sent = now
+            return True
+
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+def _window(agent: str, model: str) -> CallWindow:
+    window = _windows.get((agent, model))
+    if window is None:
+        with _windows_lock:
+            window = _windows.setdefault((agent, model), CallWindow())
+    return window
+
+
+def _rate_limited(model: str, policy: dict, tokens: int) -> bool:
+    limiter = rate_limit.get_limiter(model)
+    return limiter.breaker.state == "open" or limiter.expected_wait(tokens) > policy.get("maxQueueWait", 5)
+
+
+def health(agent: str, model: str, policy: dict, tokens: int, now: float):
+    """Why ``model`` should not serve ``agent`` right now, or None if it is healthy."""
+    if _rate_limited(model, policy, tokens):
+        return "rate_limited"
+    snapshot = _window(agent, model).snapshot(now)
+    if snapshot["calls"] < ROUTER_MIN_SAMPLES:
+        return None
+    if snapshot["errorRate"] > ROUTER_MAX_ERROR_RATE:
+        return "errors"
+    if snapshot["p95"] is not None and snapshot["p95"] > policy["slo"]:
+        return "slo"
+    return None
+
+
+def choose(agent: str, policy: dict, tokens: int) -> tuple:
+    """``(model, reason)`` for the next call of ``agent``."""
+    preferred, fallback = policy["preferred"], policy.get("fallback")
+    now = time.monotonic()
+    problem = health(agent, preferred, policy, tokens, now)
+    if problem is None or not fallback or fallback == preferred:
+        return preferred, "preferred"
+    if health(agent, fallback, policy, tokens, now) is not None:
+        # Downgrading would not help, so keep the better model
+        return preferred, "preferred"
+    if problem != "rate_limited" and _window(agent, preferred).claim_probe(now):
+        return preferred, "probe"
+    return fallback, problem
+
+
+def route(payload: dict) -> dict:
+    """Return ``payload`` for the model the current agent's policy picks.
+
+    Payloads are built from shared templates, so a different model is set on
+    a copy and ``payload`` itself is never changed.
+    """
+    agent = metrics.current_agent.get()
+    policy = ROUTE_POLICIES.get(agent) if MODEL_ROUTING else None
+    if policy is None:
+        return payload
+    model, reason = choose(agent, policy, rate_limit.estimate_tokens(payload))
+    _window(agent, model).sent(time.monotonic())
+    metrics.record_route(model, reason)
+    return payload if payload.get("model") == model else {**payload, "model": model}
+
+
+@contextmanager
+def observe(payload: dict):
+    """Record the latency or failure of the upstream call made inside the block.
+
+    A call abandoned by its caller (a closed stream) is not recorded.
+    """
+    agent = metrics.current_agent.get()
+    if not MODEL_ROUTING or agent not in ROUTE_POLICIES:
+        yield
+        return
+    window = _window(agent, payload.get("model", "default"))
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        window.add(None, time.monotonic())
+        raise
+    else:
+        now = time.monotonic()
+        window.add(now - started, now)
+
+
+def stats() -> dict:
+    now = time.monotonic()
+    with _windows_lock:
+        windows = dict(_windows)
+    routes = {}
+    for (agent, model), window in sorted(windows.items()):
+        routes.setdefault(agent, {})[model] = window.snapshot(now)
+    return routes
@@ -0,0 +1,472 @@
+"""Shared HTTP client for the Perplexity chat completions API.
+
+All agent modules send their requests through this module so that
+connections are pooled and kept alive between calls, HTTP/2 is negotiated
+when the upstream supports it, and every call has a connect and read
+timeout instead of hanging a worker forever.
+
+Each call goes to the model ``model_router`` picks for its agent and is
+admitted by the per-model rate limiter and circuit breaker in
+``rate_limit``. 429s, 5xx responses and transport errors are retried with
+jittered exponential backoff that honours ``Retry-After``; anything that
+still fails is raised as an ``UpstreamError`` subclass.
+"""
+import asyncio
+import email.utils
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+
+import sseclient
+
+import metrics
+import model_router
+import rate_limit
+import response_cache
+import single_flight
+
+PERPLEXITY_API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
+
+CONNECT_TIMEOUT = float(os.getenv("PERPLEXITY_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("PERPLEXITY_READ_TIMEOUT", "180"))
+MAX_CONNECTIONS = int(os.getenv("PERPLEXITY_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("PERPLEXITY_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("PERPLEXITY_KEEPALIVE_EXPIRY", "60"))
+HTTP2 = os.getenv("PERPLEXITY_HTTP2", "1") != "0"
+MAX_RETRIES = int(os.getenv("PERPLEXITY_MAX_RETRIES", "3"))
+# Longest a call may queue for rate-limit capacity before it is rejected locally
+MAX_QUEUE_WAIT = float(os.getenv("PERPLEXITY_MAX_QUEUE_WAIT", "30"))
+
+
+
+class UpstreamError(Exception):
+    """The Perplexity API returned an error or an unusable response."""
+
+    retryable = False
+
+    def __init__(self, message: str, status: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RateLimitedError(UpstreamError):
+    """Rejected with a 429, or the local rate limiter's queue is full."""
+
+    retryable = True
+
+
+class QueueFullError(RateLimitedError):
+    """The local rate limiter could not admit the call within ``MAX_QUEUE_WAIT``."""
+
+    retryable = False
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """A 5xx response, a timeout or a connection failure."""
+
+    retryable = True
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Calls to the model are suspended after repeated upstream failures."""
+
+
+def _lazy_import(name: str):
+    """Return ``name`` as a module that is only executed on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# httpx (with anyio, h11 and certifi) is the slowest import of the server, so it is
+# loaded when the first client is created; that always happens under _client_lock,
+# so only one thread ever executes the module
+httpx = _lazy_import("httpx")
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _timeout() -> "httpx.Timeout":
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def _limits() -> "httpx.Limits":
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def _headers() -> dict:
+    return {"Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"}
+
+
+def get_client() -> "httpx.Client":
+    """Return the process-wide pooled sync client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(http2=HTTP2, timeout=_timeout(), limits=_limits())
+    return _client
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """Return the pooled async client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _client_lock:
+            client = httpx.AsyncClient(http2=HTTP2, timeout=_timeout(), limits=_limits())
+        _async_clients[loop] = client
+    return client
+
+
+def close():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def aclose():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _retry_after(response: "httpx.Response"):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_message(response: "httpx.Response") -> str:
+    try:
+        error = response.json().get("error")
+    except ValueError:
+        return response.text[:200]
+    if isinstance(error, dict):
+        return str(error.get("message", error))
+    return str(error)[:200]
+
+
+def _status_error(response: "httpx.Response") -> UpstreamError:
+    status = response.status_code
+    message = _error_message(response)
+    if status == 429:
+        return RateLimitedError(f"Perplexity rate limit exceeded: {message}", status, _retry_after(response))
+    if status >= 500:
+        return UpstreamUnavailableError(f"Perplexity server error {status}: {message}", status, _retry_after(response))
+    return UpstreamError(f"Perplexity request failed with status {status}: {message}", status)
+
+
+def _admission_wait(limiter: rate_limit.ModelLimiter, model: str, tokens: int) -> float:
+    if limiter.breaker.state == "open":
+        raise CircuitOpenError(f"Perplexity calls to {model} are suspended", retry_after=limiter.retry_after())
+    wait = limiter.reserve(tokens, MAX_QUEUE_WAIT)
+    if wait is None:
+        raise QueueFullError(f"Rate limit for {model} is saturated", retry_after=MAX_QUEUE_WAIT)
+    return wait
+
+
+def _claim(limiter: rate_limit.ModelLimiter, model: str):
+    """Pass the circuit breaker; return the probe token if this call is the half-open probe."""
+    allowed, probe = limiter.claim()
+    if not allowed:
+        raise CircuitOpenError(f"Perplexity calls to {model} are suspended", retry_after=limiter.retry_after())
+    return probe
+
+
+def _failure(limiter: rate_limit.ModelLimiter, e: Exception) -> UpstreamError:
+    """Record a failed attempt with the limiter and return it as an UpstreamError."""
+    if isinstance(e, httpx.TransportError):
+        e = UpstreamUnavailableError(f"Perplexity request failed: {type(e).__name__}: {e}")
+    if isinstance(e, (CircuitOpenError, QueueFullError)):
+        return e
+    if isinstance(e, RateLimitedError):
+        limiter.pause(e.retry_after or rate_limit.backoff_delay(0))
+    elif e.retryable:
+        limiter.record_failure()
+    else:
+        limiter.record_success()
+    return e
+
+
+def _send(payload: dict, send) -> "httpx.Response":
+    """Call ``send()`` under the model's rate limit, retrying transient failures."""
+    model = payload.get("model", "default")
+    limiter = rate_limit.get_limiter(model)
+    tokens = rate_limit.estimate_tokens(payload)
+    for attempt in range(MAX_RETRIES + 1):
+        probe = None
+        try:
+            time.sleep(_admission_wait(limiter, model, tokens))
+            probe = _claim(limiter, model)
+            response = send()
+            if response.status_code >= 400:
+                try:
+                    response.read()
+                finally:
+                    response.close()
+                raise _status_error(response)
+        except (UpstreamError, httpx.TransportError) as e:
+            error = _failure(limiter, e)
+            # A rate limit leaves the breaker as it was, so a probe that hit one gives its slot back
+            limiter.release_probe(probe)
+            metrics.record_upstream(model, str(error.status or type(error).__name__))
+            if not error.retryable or isinstance(error, CircuitOpenError) or attempt == MAX_RETRIES:
+                if error is e:
+                    raise
+                raise error from e
+            time.sleep(rate_limit.backoff_delay(attempt, error.retry_after))
+            continue
+        except BaseException:
+            # Cancelled (client gone, timeout) or failed in a way that says nothing about the upstream
+            limiter.release_probe(probe)
+            raise
+        limiter.record_success()
+        metrics.record_upstream(model, "ok")
+        return response
+
+
+async def _asend(payload: dict, send) -> "httpx.Response":
+    model = payload.get("model", "default")
+    limiter = rate_limit.get_limiter(model)
+    tokens = rate_limit.estimate_tokens(payload)
+    for attempt in range(MAX_RETRIES + 1):
+        probe = None
+        try:
+            await asyncio.sleep(_admission_wait(limiter, model, tokens))
+            probe = _claim(limiter, model)
+            response = await send()
+            if response.status_code >= 400:
+                try:
+                    await response.aread()
+                finally:
+                    await response.aclose()
+                raise _status_error(response)
+        except (UpstreamError, httpx.TransportError) as e:
+            error = _failure(limiter, e)
+            # A rate limit leaves the breaker as it was, so a probe that hit one gives its slot back
+            limiter.release_probe(probe)
+            metrics.record_upstream(model, str(error.status or type(error).__name__))
+            if not error.retryable or isinstance(error, CircuitOpenError) or attempt == MAX_RETRIES:
+                if error is e:
+                    raise
+                raise error from e
+            await asyncio.sleep(rate_limit.backoff_delay(attempt, error.retry_after))
+            continue
+        except BaseException:
+            # Cancelled (client gone, timeout) or failed in a way that says nothing about the upstream
+            limiter.release_probe(probe)
+            raise
+        limiter.record_success()
+        metrics.record_upstream(model, "ok")
+        return response
+
+
+def _settle(payload: dict, usage):
+    """Replace the estimated token reservation with the usage the API reported, and count it."""
+    if usage:
+        metrics.record_usage(payload.get("model", "default"), usage)
+    if usage and usage.get("total_tokens") is not None:
+        rate_limit.get_limiter(payload.get("model", "default")).settle(
+            rate_limit.estimate_tokens(payload), usage["total_tokens"]
+        )
+
+
+def _decode(payload: dict, response: "httpx.Response") -> dict:
+    try:
+        body = response.json()
+    except ValueError as e:
+        raise UpstreamError(f"Perplexity returned a non-JSON response: {response.text[:200]}") from e
+    _settle(payload, body.get("usage"))
+    return body
+
+
+def _message_content(body: dict) -> str:
+    try:
+        return body["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise UpstreamError(f"Unexpected Perplexity response: {str(body)[:200]}") from e
+
+
+def chat_completion(payload: dict) -> dict:
+    """POST a chat completion request and return the decoded JSON body."""
+    trace = metrics.ConnectTrace()
+    with metrics.stage("upstream_total"):
+        response = _send(payload, lambda: get_client().post(
+            PERPLEXITY_API_URL, headers=_headers(), json=payload, extensions={"trace": trace}
+        ))
+        return _decode(payload, response)
+
+
+async def achat_completion(payload: dict) -> dict:
+    trace = metrics.ConnectTrace()
+    with metrics.stage("upstream_total"):
+        response = await _asend(payload, lambda: get_async_client().post(
+            PERPLEXITY_API_URL, headers=_headers(), json=payload, extensions={"trace": trace.atrace}
+        ))
+        return _decode(payload, response)
+
+
+def complete(payload: dict, cache: bool = False, validate=None) -> str:
+    """Run a chat completion and return the assistant message content.
+
+    With ``cache=True`` the content is served from the response cache when
+    an identical request has been answered before; new content is only
+    cached if ``validate(content)`` does not raise. Identical requests that
+    are still in flight share one upstream call (see ``single_flight``).
+    """
+    with metrics.agent_scope(payload):
+        payload = model_router.route(payload)
+
+        def upstream():
+            with model_router.observe(payload):
+                return _message_content(chat_completion(payload))
+
+        key = response_cache.cache_key(payload)
+        flight = single_flight.get_single_flight()
+        compute = upstream if flight is None else lambda: flight.do(key, upstream)
+
+        store = response_cache.get_cache() if cache else None
+        if store is None:
+            return compute()
+        return store.get_or_compute(key, compute, validate)
+
+
+async def acomplete(payload: dict, cache: bool = False, validate=None) -> str:
+    with metrics.agent_scope(payload):
+        payload = model_router.route(payload)
+
+        async def upstream():
+            with model_router.observe(payload):
+                return _message_content(await achat_completion(payload))
+
+        key = response_cache.cache_key(payload)
+        flight = single_flight.get_single_flight()
+
+        async def compute():
+            if flight is None:
+                return await upstream()
+            return await flight.ado(key, upstream)
+
+        store = response_cache.get_cache() if cache else None
+        if store is None:
+            return await compute()
+        return await store.aget_or_compute(key, compute, validate)
+
+
+def _stream_request(client, payload: dict, trace) -> "httpx.Request":
+    return client.build_request(
+        "POST", PERPLEXITY_API_URL, headers=_headers(), json={**payload, "stream": True}, extensions={"trace": trace}
+    )
+
+
+def _first_content(chunk: dict) -> bool:
+    return bool(chunk.get("choices") and chunk["choices"][0].get("delta", {}).get("content"))
+
+
+def stream_chat_completion(payload: dict):
+    """Yield the decoded SSE chunks of a streaming chat completion.
+
+    Only opening the stream is retried; once chunks have been yielded a
+    failure is raised to the caller.
+    """
+    with metrics.agent_scope(payload):
+        payload = model_router.route(payload)
+        with model_router.observe(payload):
+            client = get_client()
+            trace = metrics.ConnectTrace()
+            started = time.perf_counter()
+            first_token = False
+            response = _send(payload, lambda: client.send(_stream_request(client, payload, trace), stream=True))
+            usage = None
+            try:
+                events = sseclient.SSEClient(response.iter_bytes())
+                for event in events.events():
+                    if event.data == "[DONE]":
+                        break
+                    chunk = json.loads(event.data)
+                    usage = chunk.get("usage") or usage
+                    if not first_token and _first_content(chunk):
+                        first_token = True
+                        metrics.record("upstream_ttft", time.perf_counter() - started)
+                    yield chunk
+            finally:
+                response.close()
+                metrics.record("upstream_total", time.perf_counter() - started)
+            _settle(payload, usage)
+
+
+async def astream_chat_completion(payload: dict):
+    with metrics.agent_scope(payload):
+        payload = model_router.route(payload)
+        with model_router.observe(payload):
+            client = get_async_client()
+            trace = metrics.ConnectTrace()
+            started = time.perf_counter()
+            first_token = False
+            response = await _asend(payload, lambda: client.send(_stream_request(client, payload, trace.atrace), stream=True))
+            usage = None
+            try:
+                data_lines = []
+                async for line in response.aiter_lines():
+                    if line.startswith("data:"):
+                        data_lines.append(line[5:].lstrip())
+                        continue
+                    if line or not data_lines:
+                        continue
+                    data = "\n".join(data_lines)
+                    data_lines = []
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get("usage") or usage
+                    if not first_token and _first_content(chunk):
+                        first_token = True
+                        metrics.record("upstream_ttft", time.perf_counter() - started)
+                    yield chunk
+            finally:
+                await response.aclose()
+                metrics.record("upstream_total", time.perf_counter() - started)
+            _settle(payload, usage)
+
+
+def iter_content(chunks):
+    """Reduce streamed chunks to their non-empty delta content strings."""
+    for chunk in chunks:
+        content = chunk["choices"][0]["delta"].get("content", "") if chunk.get("choices") else ""
+        if content:
+            yield content
+
+
+async def aiter_content(chunks):
+    async for chunk in chunks:
+        content = chunk["choices"][0]["delta"].get("content", "") if chunk.get("choices") else ""
+        if content:
+            yield content
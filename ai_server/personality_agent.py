@@ -1,27 +1,26 @@
-import os
-import requests
-import json
-import sseclient
+import perplexity_client
+import metrics
 
-def stream_personality_response(text):
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}",
-    }
-    payload = {
+SYSTEM_MESSAGE = {"role": "system", "content": "You are an AI teacher who has borderline given up on teaching, is rude and standoffish."}
+
+
+@metrics.prompt_stage("personality")
+def build_personality_payload(text) -> dict:
+    return {
         "model": "sonar",
         "messages": [
-            {"role": "system", "content": "You are an AI teacher who has borderline given up on teaching, is rude and standoffish."},
+            SYSTEM_MESSAGE,
             {"role": "user", "content": "You need to convert the following text into something you would say if you were an AI instructor without changing any context or information \n\n " + text}
-        ],
-        "stream": True
+        ]
     }
 
-    response = requests.post(url, headers=headers, json=payload, stream=True)
-    client = sseclient.SSEClient(response)
-    for event in client.events():
-        if event.data != "[DONE]":
-            data = json.loads(event.data)
-            content = data['choices'][0]['delta'].get('content', '')
-            if content:
-                yield content
+
+def stream_personality_response(text):
+    chunks = perplexity_client.stream_chat_completion(build_personality_payload(text))
+    yield from perplexity_client.iter_content(chunks)
+
+
+async def astream_personality_response(text):
+    chunks = perplexity_client.astream_chat_completion(build_personality_payload(text))
+    async for content in perplexity_client.aiter_content(chunks):
+        yield content
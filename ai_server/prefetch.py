@@ -0,0 +1,214 @@
+"""Speculative walkthrough generation started as soon as recommendations return.
+
+Most users accept the recommended stack unchanged, so with speculation on
+(``AI_SPECULATIVE_WALKTHROUGH=1``, or ``"speculate": true`` in the
+recommendations request) the walkthrough code generation is started in the
+background with the recommended options. A later ``/api/ai/walkthrough``
+request with the same prompt and options attaches to that job, whether it
+is still running or already finished; one with a changed configuration
+cancels it and generates from scratch.
+
+Jobs are grouped by the request's ``sessionId``, or by the prompt when no
+session is given, so each session has at most one speculative job. On the
+ASGI app a cancelled job aborts its upstream call; on the threaded Flask app
+a call that has already started runs to completion and its result is
+discarded.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from doc_registry import resolve_search_filters
+from walk_me_through_code_agent import walk_me_through_code_agent, awalk_me_through_code_agent
+
+SPECULATIVE_WALKTHROUGH = os.getenv("AI_SPECULATIVE_WALKTHROUGH", "0") == "1"
+PREFETCH_TTL = float(os.getenv("AI_PREFETCH_TTL", "900"))
+PREFETCH_MAX_JOBS = int(os.getenv("AI_PREFETCH_MAX_JOBS", "64"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("AI_PREFETCH_MAX_WORKERS", "4")),
+    thread_name_prefix="prefetch",
+)
+
+
+class _Job:
+    def __init__(self, key: str, handle):
+        self.key = key
+        self.handle = handle
+        self.created = time.monotonic()
+
+
+class SpeculativeJobs:
+    """At most one speculative job per group, claimed only by a request with the same key.
+
+    ``handle`` is a ``concurrent.futures.Future`` or an ``asyncio.Task``;
+    both support ``cancel``, ``cancelled`` and ``done``.
+    """
+
+    def __init__(self, ttl: float = PREFETCH_TTL, max_jobs: int = PREFETCH_MAX_JOBS):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.attached = 0
+        self.cancelled = 0
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [group for group, job in self._jobs.items() if now - job.created > self.ttl]
+        overflow = len(self._jobs) - len(expired) - self.max_jobs + 1
+        if overflow > 0:
+            live = sorted((job.created, group) for group, job in self._jobs.items() if group not in expired)
+            expired.extend(group for _created, group in live[:overflow])
+        for group in expired:
+            self._jobs.pop(group).handle.cancel()
+
+    def add(self, group: str, key: str, handle):
+        with self._lock:
+            self._evict()
+            previous = self._jobs.get(group)
+            if previous is not None and previous.key != key:
+                previous.handle.cancel()
+                self.cancelled += 1
+            self._jobs[group] = _Job(key, handle)
+
+    def has(self, group: str, key: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(group)
+            return job is not None and job.key == key
+
+    def claim(self, group: str, key: str):
+        """Return the handle of a usable job for ``key``; cancel the group's job if its key differs."""
+        with self._lock:
+            job = self._jobs.get(group)
+            if job is None:
+                return None
+            if job.key != key:
+                del self._jobs[group]
+                job.handle.cancel()
+                self.cancelled += 1
+                return None
+            if job.handle.cancelled() or (job.handle.done() and job.handle.exception() is not None):
+                del self._jobs[group]
+                return None
+            self.attached += 1
+            return job.handle
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"jobs": len(self._jobs), "attached": self.attached, "cancelled": self.cancelled}
+
+
+jobs = SpeculativeJobs()
+
+
+def walkthrough_options(recommendations_json: dict) -> dict:
+    """The stack choices of a recommendations answer, without the justifications."""
+    return {tag: value for tag, value in recommendations_json.items() if "justification" not in tag.lower()}
+
+
+def walkthrough_tech_stack(options: dict, tech_stack: str = "") -> str:
+    """The tech stack a walkthrough is generated for; without one the options stand in."""
+    return tech_stack or json.dumps(options, indent=2)
+
+
+def speculation_group(data: dict) -> str:
+    return str(data.get("sessionId") or data.get("prompt", ""))
+
+
+def speculation_key(user_prompt: str, options: dict, tech_stack: str) -> str:
+    # A tech stack that only restates the options asks for the same walkthrough as none
+    if tech_stack == walkthrough_tech_stack(options):
+        tech_stack = ""
+    canonical = json.dumps([user_prompt, options, tech_stack], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def wants_speculation(data: dict) -> bool:
+    return bool(data.get("speculate", SPECULATIVE_WALKTHROUGH))
+
+
+def _walkthrough_args(user_prompt: str, options: dict, tech_stack: str):
+    return resolve_search_filters(options), tech_stack, user_prompt
+
+
+def speculate_walkthrough(data: dict, recommendations_json: dict):
+    """Start the walkthrough for the recommended stack in the background."""
+    user_prompt = data.get("prompt", "")
+    options = walkthrough_options(recommendations_json)
+    tech_stack = walkthrough_tech_stack(options)
+    group, key = speculation_group(data), speculation_key(user_prompt, options, tech_stack)
+    if not jobs.has(group, key):
+        jobs.add(group, key, _executor.submit(walk_me_through_code_agent, *_walkthrough_args(user_prompt, options, tech_stack)))
+
+
+def aspeculate_walkthrough(data: dict, recommendations_json: dict):
+    user_prompt = data.get("prompt", "")
+    options = walkthrough_options(recommendations_json)
+    tech_stack = walkthrough_tech_stack(options)
+    group, key = speculation_group(data), speculation_key(user_prompt, options, tech_stack)
+    if not jobs.has(group, key):
+        task = asyncio.get_running_loop().create_task(awalk_me_through_code_agent(*_walkthrough_args(user_prompt, options, tech_stack)))
+        # Retrieve the outcome so an unclaimed failure is not logged as never retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        jobs.add(group, key, task)
+
+
+def claim_walkthrough(data: dict):
+    """Return the speculative job matching a walkthrough request, or None."""
+    user_prompt = data.get("prompt", "")
+    options = data.get("options", {})
+    # Keyed on the same inputs the speculative call was made with, so a walkthrough
+    # for a different tech stack never gets the prefetched answer
+    key = speculation_key(user_prompt, options, walkthrough_tech_stack(options, data.get("techStack", "")))
+    return jobs.claim(speculation_group(data), key)
+
+
+def job_result(job, fallback):
+    """Wait for a claimed job; regenerate with ``fallback()`` if it failed or was cancelled."""
+    try:
+        return job.result()
+    except Exception:
+        return fallback()
+
+
+async def ajob_result(job, fallback):
+    # Shield the shared task so a disconnecting client does not cancel it for everyone
+    try:
+        return await asyncio.shield(job)
+    except asyncio.CancelledError:
+        if not job.cancelled():
+            raise
+    except Exception:
+        pass
+    return await fallback()
+
+
+def job_deltas(job, fallback):
+    """Stream a claimed job's output as one delta, or stream ``fallback()`` if the job failed."""
+    try:
+        output = job.result()
+    except Exception:
+        yield from fallback()
+        return
+    yield output
+
+
+async def ajob_deltas(job, fallback):
+    try:
+        output = await asyncio.shield(job)
+    except asyncio.CancelledError:
+        if not job.cancelled():
+            raise
+        output = None
+    except Exception:
+        output = None
+    if output is None:
+        async for delta in fallback():
+            yield delta
+        return
+    yield output
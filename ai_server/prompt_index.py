@@ -0,0 +1,226 @@
+"""Near-duplicate index over past prompts and their validated answers.
+
+Recommendation prompts repeat with small variations ("chat with my PDFs",
+"an agent to chat with my pdfs", ...) that the exact-match response cache
+never sees as equal. Each prompt is turned into a vector of hashed
+character 3- and 4-grams of its content words, after dropping filler words
+("a", "agent", "build", ...) and folding a few synonyms ("pdfs", "docs" ->
+"document"). The vector is L2-normalised, so one matrix-vector product
+against the index gives the cosine similarity to every stored prompt. A
+prompt whose best match reaches ``PROMPT_INDEX_THRESHOLD`` reuses that
+answer, which takes milliseconds instead of a multi-second upstream call.
+
+The index holds at most ``PROMPT_INDEX_MAX_ENTRIES`` prompts in a fixed
+NumPy matrix and evicts the least recently used one when it is full. It is
+saved to ``PROMPT_INDEX_PATH`` at most every ``PROMPT_INDEX_SAVE_INTERVAL``
+seconds, on a background thread so the caller (possibly the ASGI event loop)
+never waits on the file, and on exit. It is loaded again on start; every
+worker process keeps its own copy. A saved index built with other settings or for another
+answer schema is ignored.
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+PROMPT_INDEX = os.getenv("AI_PROMPT_INDEX", "1") == "1"
+PROMPT_INDEX_PATH = os.getenv("AI_PROMPT_INDEX_PATH", "ai_prompt_index.npz")
+PROMPT_INDEX_MAX_ENTRIES = int(os.getenv("AI_PROMPT_INDEX_MAX_ENTRIES", "2000"))
+# Lowest cosine similarity at which a stored answer is reused
+PROMPT_INDEX_THRESHOLD = float(os.getenv("AI_PROMPT_INDEX_THRESHOLD", "0.85"))
+PROMPT_INDEX_DIMENSIONS = int(os.getenv("AI_PROMPT_INDEX_DIMENSIONS", "1024"))
+PROMPT_INDEX_SAVE_INTERVAL = float(os.getenv("AI_PROMPT_INDEX_SAVE_INTERVAL", "30"))
+
+# Bump when prompt_vector changes, so vectors saved by an older version are not compared with new ones
+VECTOR_VERSION = 1
+NGRAM_SIZES = (3, 4)
+# Shorter prompts (after filler words are dropped) say too little to match on
+MIN_PROMPT_CHARS = 6
+
+FILLER_WORDS = frozenset("""
+    a an the and or of to for in on at by with from into about as that which who whose it its this these those
+    i me my we our us you your he she they their them can could would will should shall may might must
+    please want need like help let lets build create make develop design write code implement using use uses
+    agent agents bot ai app application tool system assistant something simple basic
+""".split())
+SYNONYMS = {
+    "pdf": "document", "pdfs": "document", "doc": "document", "docs": "document", "documents": "document",
+    "file": "document", "files": "document", "papers": "paper",
+    "internet": "web", "online": "web", "website": "web", "websites": "web", "browse": "web", "browsing": "web",
+    "chatbot": "chat", "chatting": "chat", "talk": "chat", "converse": "chat",
+    "emails": "email", "mail": "email", "videos": "video", "summarizes": "summarize", "summarise": "summarize",
+    "summarises": "summarize", "summarizing": "summarize", "summary": "summarize", "searches": "search",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def prompt_terms(prompt: str) -> list:
+    """The content words of a prompt, with synonyms folded."""
+    words = (SYNONYMS.get(word, word) for word in _WORD.findall(prompt.lower()))
+    return [word for word in words if word not in FILLER_WORDS]
+
+
+def prompt_vector(prompt: str, dimensions: int = PROMPT_INDEX_DIMENSIONS):
+    """The L2-normalised hashed character n-gram vector of a prompt, or None if it is too short."""
+    terms = prompt_terms(prompt)
+    if sum(map(len, terms)) < MIN_PROMPT_CHARS:
+        return None
+    buckets = []
+    for term in terms:
+        padded = f" {term} "
+        for size in NGRAM_SIZES:
+            buckets.extend(zlib.crc32(padded[i:i + size].encode("utf-8")) % dimensions
+                           for i in range(len(padded) - size + 1))
+    vector = np.bincount(buckets, minlength=dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class PromptIndex:
+    """Fixed-size cosine-similarity index of prompts and their answers, evicting the least recently used."""
+
+    def __init__(self, fingerprint: str, path: str = PROMPT_INDEX_PATH, max_entries: int = PROMPT_INDEX_MAX_ENTRIES,
+                 threshold: float = PROMPT_INDEX_THRESHOLD, dimensions: int = PROMPT_INDEX_DIMENSIONS):
+        self.fingerprint = fingerprint
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.dimensions = dimensions
+        self.vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        # -inf marks a free slot, so argmin picks free slots before evicting
+        self.last_used = np.full(max_entries, -np.inf)
+        self.entries = [None] * max_entries
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self._saver = None
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    def lookup(self, prompt: str):
+        """Return ``{"prompt", "result", "similarity"}`` for the closest stored prompt above the threshold, or None."""
+        vector = prompt_vector(prompt, self.dimensions)
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            similarities = self.vectors @ vector
+            slot = int(np.argmax(similarities))
+            similarity = float(similarities[slot])
+            if self.entries[slot] is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.last_used[slot] = time.time()
+            entry = self.entries[slot]
+        return {"prompt": entry["prompt"], "result": entry["result"], "similarity": round(similarity, 4)}
+
+    def add(self, prompt: str, result: dict):
+        """Store ``result`` for ``prompt``, replacing a near-identical prompt or the least recently used one."""
+        vector = prompt_vector(prompt, self.dimensions)
+        if vector is None:
+            return
+        with self._lock:
+            similarities = self.vectors @ vector
+            closest = int(np.argmax(similarities))
+            if self.entries[closest] is not None and similarities[closest] >= 0.999:
+                slot = closest
+            else:
+                slot = int(np.argmin(self.last_used))
+            self.vectors[slot] = vector
+            self.entries[slot] = {"prompt": prompt, "result": result}
+            self.last_used[slot] = time.time()
+            self.dirty = True
+            if not self.path or time.monotonic() - self.saved_at < PROMPT_INDEX_SAVE_INTERVAL:
+                return
+            if self._saver is not None and self._saver.is_alive():
+                return
+            self._saver = threading.Thread(target=self.save, name="prompt-index-save", daemon=True)
+            self._saver.start()
+
+    def flush(self):
+        """Wait for a background save, then write anything added since."""
+        saver = self._saver
+        if saver is not None:
+            saver.join()
+        self.save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": sum(entry is not None for entry in self.entries),
+                "maxEntries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _settings(self) -> dict:
+        return {"fingerprint": self.fingerprint, "dimensions": self.dimensions, "version": VECTOR_VERSION}
+
+    def save(self):
+        """Write the occupied slots to ``path`` atomically."""
+        with self._lock:
+            if not self.dirty:
+                return
+            slots = [slot for slot, entry in enumerate(self.entries) if entry is not None]
+            vectors = self.vectors[slots]
+            last_used = self.last_used[slots]
+            meta = json.dumps({**self._settings(), "entries": [self.entries[slot] for slot in slots]})
+            self.dirty = False
+            self.saved_at = time.monotonic()
+        temporary = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                np.savez(f, vectors=vectors, last_used=last_used, meta=np.array(meta))
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print("Prompt index could not be saved:", e)
+            with self._lock:
+                self.dirty = True
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                vectors, last_used = data["vectors"], data["last_used"]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            print("Prompt index could not be loaded:", e)
+            return
+        if {key: meta.get(key) for key in self._settings()} != self._settings():
+            return
+        # Keep the most recently used entries if the saved index is larger than this one
+        keep = np.argsort(last_used)[::-1][:self.max_entries]
+        for slot, saved in enumerate(keep):
+            self.vectors[slot] = vectors[saved]
+            self.last_used[slot] = last_used[saved]
+            self.entries[slot] = meta["entries"][saved]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prompt_index(fingerprint: str):
+    """Return the process-wide index, or None if the prompt index is disabled."""
+    global _index
+    if _index is None and PROMPT_INDEX:
+        with _index_lock:
+            if _index is None:
+                _index = PromptIndex(fingerprint)
+    return _index
+
+
+@atexit.register
+def _save_on_exit():
+    if _index is not None:
+        _index.flush()
@@ -0,0 +1,240 @@
+"""Client-side rate limiting and circuit breaking for upstream model calls.
+
+Every Perplexity call reserves capacity from two token buckets for its
+model, one for requests per minute and one for tokens per minute, and
+waits until the reservation is covered instead of tripping a 429. A 429's
+``Retry-After`` pauses the model's buckets for every caller, and a circuit
+breaker stops sending to a model after repeated server failures so a
+struggling upstream is not hammered by retries.
+
+Limits default to ``DEFAULT_LIMITS`` and can be overridden with a JSON
+object in ``PERPLEXITY_RATE_LIMITS``, e.g.
+``{"sonar-pro": {"rpm": 150, "tpm": 400000}}``.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+DEFAULT_LIMITS = {
+    "sonar": {"rpm": 50, "tpm": 150000},
+    "sonar-pro": {"rpm": 50, "tpm": 150000},
+    "sonar-reasoning-pro": {"rpm": 50, "tpm": 150000},
+    "default": {"rpm": 50, "tpm": 150000},
+}
+RATE_LIMITS = {**DEFAULT_LIMITS, **json.loads(os.getenv("PERPLEXITY_RATE_LIMITS", "{}"))}
+
+# Completion tokens reserved for a call until its real usage is known
+DEFAULT_COMPLETION_TOKENS = int(os.getenv("PERPLEXITY_EXPECTED_COMPLETION_TOKENS", "2000"))
+
+BACKOFF_BASE = float(os.getenv("PERPLEXITY_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("PERPLEXITY_BACKOFF_MAX", "20"))
+BREAKER_THRESHOLD = int(os.getenv("PERPLEXITY_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("PERPLEXITY_BREAKER_COOLDOWN", "30"))
+
+
+def estimate_tokens(payload: dict) -> int:
+    """Rough token count of a request: prompt characters / 4 plus the expected completion."""
+    prompt_chars = sum(len(message.get("content") or "") for message in payload.get("messages", []))
+    return prompt_chars // 4 + (payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's ``Retry-After``."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking.
+
+    ``reserve`` takes ``amount`` immediately, letting the balance go
+    negative, and returns how long the caller must wait before that debt is
+    refilled. Callers queue fairly in reservation order whether they sleep
+    on a thread or in an event loop.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = max(now, self.updated)
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A single request larger than the bucket only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        self.tokens -= amount
+        return max(0.0, self.paused_until - now) + max(0.0, -self.tokens) / self.rate
+
+    def wait(self, amount: float, now: float) -> float:
+        """How long a reservation of ``amount`` would wait, without making it."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, self.paused_until - now) + max(0.0, amount - self.tokens) / self.rate
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def pause(self, seconds: float, now: float):
+        self._refill(now)
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class CircuitBreaker:
+    """Open after ``threshold`` consecutive failures; let one probe through after ``cooldown``.
+
+    A probe that neither succeeds nor fails (it was cancelled, or rate
+    limited) gives its slot back with ``release_probe``; one that has not
+    reported back within another ``cooldown`` is presumed lost and replaced.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        # Identifies the probe in flight, so only that call can give its slot back
+        self.probe = None
+        self.probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    @property
+    def probing(self) -> bool:
+        return self.probe is not None
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half-open" and (self.probe is None or now - self.probe_started >= self.cooldown):
+            self.probe = object()
+            self.probe_started = now
+            return True
+        return False
+
+    def release_probe(self, probe):
+        """Free the probe slot without a verdict on the upstream."""
+        if probe is not None and probe is self.probe:
+            self.probe = None
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probe is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self.probe = None
+
+
+class ModelLimiter:
+    """Request and token buckets plus a circuit breaker for one model."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.breaker = CircuitBreaker()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: int, max_wait: float):
+        """Reserve one request and ``tokens`` tokens; return the wait, or None if it exceeds ``max_wait``."""
+        now = time.monotonic()
+        with self.lock:
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            if wait > max_wait:
+                self.requests.refund(1)
+                self.tokens.refund(min(tokens, self.tokens.capacity))
+                return None
+            return wait
+
+    def expected_wait(self, tokens: int) -> float:
+        now = time.monotonic()
+        with self.lock:
+            return max(self.requests.wait(1, now), self.tokens.wait(tokens, now))
+
+    def settle(self, reserved: int, used: int):
+        """Correct the token bucket once the real usage of a call is known."""
+        with self.lock:
+            self.tokens.refund(reserved - used)
+
+    def pause(self, seconds: float):
+        now = time.monotonic()
+        with self.lock:
+            self.requests.pause(seconds, now)
+            self.tokens.pause(seconds, now)
+
+    def claim(self) -> tuple:
+        """``(allowed, probe)``; ``probe`` is the token to release if this call is the half-open probe."""
+        with self.lock:
+            if not self.breaker.allow():
+                return False, None
+            return True, self.breaker.probe
+
+    def release_probe(self, probe):
+        with self.lock:
+            self.breaker.release_probe(probe)
+
+    def record_success(self):
+        with self.lock:
+            self.breaker.record_success()
+
+    def record_failure(self):
+        with self.lock:
+            self.breaker.record_failure()
+
+    def retry_after(self) -> float:
+        with self.lock:
+            return self.breaker.retry_after()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(model: str) -> ModelLimiter:
+    """Return the process-wide limiter for ``model``, creating it on first use."""
+    limiter = _limiters.get(model)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(model)
+            if limiter is None:
+                limits = RATE_LIMITS.get(model, RATE_LIMITS["default"])
+                limiter = _limiters[model] = ModelLimiter(limits["rpm"], limits["tpm"])
+    return limiter
+
+
+def stats() -> dict:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {
+        model: {
+            "requestsAvailable": round(limiter.requests.tokens, 1),
+            "tokensAvailable": round(limiter.tokens.tokens),
+            "circuit": limiter.breaker.state,
+        }
+        for model, limiter in limiters.items()
+    }
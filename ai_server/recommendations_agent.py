@@ -1,23 +1,31 @@
-import os
-import requests
+import asyncio
+import hashlib
+import json
 
-def get_recommendations(recommendations_prompt: str, user_prompt: str) -> str:
-    
-    class AnswerFormat(BaseModel):
-        core_concept: str
-        approach: str
-        approach_justification: str
-        framework: str
-        framework_justification: str
-        LLM_provider: str
-        LLM_provider_justification: str
-        Tool_use: str
-        Tool_use_justification: str
-        Embedder: str
-        Embedder_justification: str
-        Database_used: str
-        Database_used_justification: str
-    RECOMMENDATIONS_PROMPT  = """ 
+from pydantic import BaseModel
+
+import perplexity_client
+import metrics
+from prompt_index import get_prompt_index
+from structured_output import parse_agent_output, validator
+
+class AnswerFormat(BaseModel):
+    core_concept: str
+    approach: str
+    approach_justification: str
+    framework: str
+    framework_justification: str
+    LLM_provider: str
+    LLM_provider_justification: str
+    Tool_use: str
+    Tool_use_justification: str
+    Embedder: str
+    Embedder_justification: str
+    Database_used: str
+    Database_used_justification: str
+
+
+RECOMMENDATIONS_PROMPT  = """ 
         You are a world class AI agent researcher and know your way around all the frameworks in existance . You are tasked with recommending the appropriate
         approach , framework , LLMs , Primary Tools , Embedders , database providers for a usecase for building an agent, and providing with one line reasons as to why 
         you recommend what you recommend.
@@ -56,18 +64,79 @@ def get_recommendations(recommendations_prompt: str, user_prompt: str) -> str:
         }
             YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON , ABSOLUTELY NOTHING ELSE
         """
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {"Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"}
-    payload = {
-        "model": "sonar-pro",
+
+# Everything but the user prompt, built once at import; shared by every request, so never mutate it
+PAYLOAD_TEMPLATE = {
+    "model": "sonar-pro",
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": AnswerFormat.model_json_schema()},
+    },
+}
+SYSTEM_MESSAGE = {"role": "system", "content": RECOMMENDATIONS_PROMPT}
+# Identifies the answer schema, so answers indexed under an older schema are not reused
+SCHEMA_FINGERPRINT = hashlib.sha256(json.dumps(PAYLOAD_TEMPLATE["response_format"], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+@metrics.prompt_stage("recommendations")
+def build_recommendations_payload(recommendations_prompt: str, user_prompt: str) -> dict:
+    return {
+        **PAYLOAD_TEMPLATE,
         "messages": [
-            {"role": "system", "content": RECOMMENDATIONS_PROMPT},
+            SYSTEM_MESSAGE,
             {"role": "user", "content": user_prompt}
         ],
-        "response_format": {
-                "type": "json_schema",
-            "json_schema": {"schema": AnswerFormat.model_json_schema()},
-        }
     }
-    response = requests.post(url, headers=headers, json=payload).json()
-    return response["choices"][0]["message"]["content"]
\ No newline at end of file
+
+
+def get_recommendations(recommendations_prompt: str, user_prompt: str) -> str:
+    return perplexity_client.complete(build_recommendations_payload(recommendations_prompt, user_prompt), cache=True,
+                                      validate=validator(AnswerFormat))
+
+
+async def aget_recommendations(recommendations_prompt: str, user_prompt: str) -> str:
+    return await perplexity_client.acomplete(build_recommendations_payload(recommendations_prompt, user_prompt), cache=True,
+                                             validate=validator(AnswerFormat))
+
+
+def get_recommendation_index():
+    return get_prompt_index(SCHEMA_FINGERPRINT)
+
+
+def _reuse(index, user_prompt: str):
+    if index is None:
+        return None
+    with metrics.stage("prompt_index"):
+        return index.lookup(user_prompt)
+
+
+def _remember(index, user_prompt: str, recommendations_json: dict):
+    if index is not None:
+        with metrics.stage("prompt_index"):
+            index.add(user_prompt, recommendations_json)
+
+
+def recommend(recommendations_prompt: str, user_prompt: str) -> tuple:
+    """Return ``(recommendations, similar)``: the validated answer, and the earlier prompt it was reused from or None.
+
+    A prompt close enough to one answered before (see ``prompt_index``)
+    reuses that answer without an upstream call.
+    """
+    index = get_recommendation_index()
+    match = _reuse(index, user_prompt)
+    if match is not None:
+        return match["result"], {"prompt": match["prompt"], "similarity": match["similarity"]}
+    recommendations_json = parse_agent_output(get_recommendations(recommendations_prompt, user_prompt), AnswerFormat)
+    _remember(index, user_prompt, recommendations_json)
+    return recommendations_json, None
+
+
+async def arecommend(recommendations_prompt: str, user_prompt: str) -> tuple:
+    # The first call loads the saved index from disk
+    index = await asyncio.to_thread(get_recommendation_index)
+    match = _reuse(index, user_prompt)
+    if match is not None:
+        return match["result"], {"prompt": match["prompt"], "similarity": match["similarity"]}
+    recommendations_json = parse_agent_output(await aget_recommendations(recommendations_prompt, user_prompt), AnswerFormat)
+    _remember(index, user_prompt, recommendations_json)
+    return recommendations_json, None
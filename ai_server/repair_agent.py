@@ -0,0 +1,65 @@
+from typing import List
+from pydantic import BaseModel
+
+import perplexity_client
+import metrics
+
+
+class CodeEdit(BaseModel):
+    search: str
+    replace: str
+
+
+class AnswerFormat(BaseModel):
+    edits: List[CodeEdit]
+
+
+AGENT_REPAIR_PROMPT = """
+    You are a senior Python engineer fixing a generated AI-agent script that
+    fails to compile. You are given the compiler error and only the region of
+    the script around it, not the whole file.
+
+    Fix the error with the smallest possible change and do not alter the
+    behaviour of the code. Return a list of edits, each {"search": ..., "replace": ...}:
+        • "search" is copied verbatim from the region and occurs in it exactly once.
+        • "replace" is the corrected text that takes its place.
+
+    {
+    "edits": list of search/replace operations
+    }
+        YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON , ABSOLUTELY NOTHING ELSE
+    """
+
+# Everything but the error report, built once at import; shared by every request, so never mutate it
+PAYLOAD_TEMPLATE = {
+    "model": "sonar",
+    "web_search_options": {
+        "search_context_size": "low"
+    },
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": AnswerFormat.model_json_schema()},
+    },
+}
+SYSTEM_MESSAGE = {"role": "system", "content": AGENT_REPAIR_PROMPT}
+
+
+@metrics.prompt_stage("repair")
+def build_repair_payload(error: str, first_line: int, last_line: int, region: str) -> dict:
+    return {
+        **PAYLOAD_TEMPLATE,
+        "messages": [
+            SYSTEM_MESSAGE,
+            {"role": "user", "content":
+                f"Error: {error}\n\nLines {first_line}-{last_line} of the script:\n\n" + region
+            }
+        ],
+    }
+
+
+def run_repair(error: str, first_line: int, last_line: int, region: str) -> str:
+    return perplexity_client.complete(build_repair_payload(error, first_line, last_line, region))
+
+
+async def arun_repair(error: str, first_line: int, last_line: int, region: str) -> str:
+    return await perplexity_client.acomplete(build_repair_payload(error, first_line, last_line, region))
@@ -0,0 +1,231 @@
+"""Content-addressed cache for deterministic agent calls.
+
+Responses are keyed by a hash of everything that determines the model's
+answer (model, messages, search domain filter and response schema), so a
+repeat tech review of the same script is served locally instead of
+spending another paid upstream call.
+
+Two backends are available: an in-process LRU dict, and a SQLite file that
+is shared by every worker process on the host. Select one with the
+``AI_CACHE_BACKEND`` environment variable (``memory``, ``sqlite`` or
+``none``).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_BACKEND = os.getenv("AI_CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("AI_CACHE_PATH", "ai_cache.sqlite3")
+CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "86400"))
+CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1024"))
+
+
+def cache_key(payload: dict) -> str:
+    """Hash the parts of a chat completion payload that determine its output."""
+    response_format = payload.get("response_format") or {}
+    canonical = {
+        "model": payload.get("model"),
+        "messages": [[m.get("role"), m.get("content")] for m in payload.get("messages", [])],
+        "search_domain_filter": payload.get("search_domain_filter") or [],
+        "schema": response_format.get("json_schema", {}).get("schema"),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """Thread-safe in-process LRU store with per-entry expiry."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk LRU store shared by every process that opens the same file."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+            overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """Read-through cache in front of an upstream call, with hit/miss counters."""
+
+    def __init__(self, backend, ttl: float = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _storable(value, validate) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(value)
+        except Exception as e:
+            print("Not caching a response that failed validation:", e)
+            return False
+        return True
+
+    def get_or_compute(self, key: str, compute, validate=None):
+        """Return the cached value for ``key``, or ``compute()`` it.
+
+        A computed value is only stored if ``validate(value)`` does not raise,
+        so a malformed answer is retried on the next request instead of being
+        served for the whole TTL.
+        """
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = compute()
+            if self._storable(value, validate):
+                self.backend.set(key, value, self.ttl)
+        return value
+
+    async def aget_or_compute(self, key: str, compute, validate=None):
+        # The SQLite backend does file I/O, so keep it off the event loop
+        value = await asyncio.to_thread(self.backend.get, key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = await compute()
+            if self._storable(value, validate):
+                await asyncio.to_thread(self.backend.set, key, value, self.ttl)
+        return value
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl": self.ttl,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache configured from the environment, or None if disabled."""
+    global _cache
+    if _cache is None and CACHE_BACKEND != "none":
+        with _cache_lock:
+            if _cache is None:
+                if CACHE_BACKEND == "sqlite":
+                    backend = SQLiteBackend(CACHE_PATH, CACHE_MAX_ENTRIES)
+                else:
+                    backend = MemoryBackend(CACHE_MAX_ENTRIES)
+                _cache = ResponseCache(backend, CACHE_TTL)
+    return _cache
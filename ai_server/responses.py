@@ -0,0 +1,138 @@
+"""JSON shapes returned by the HTTP routes for each agent's parsed answer.
+
+Shared by the Flask app (``app.py``) and the ASGI app (``asgi_app.py``) so
+both deployment modes return identical responses.
+"""
+import math
+
+import metrics
+from perplexity_client import UpstreamError
+from stream_parser import IncrementalFieldParser
+from sse import format_event
+from structured_output import parse_agent_output
+from script_validation import validate_code_answer, avalidate_code_answer
+import tech_review_agent
+import cost_agent
+
+
+def _validation(answer_json: dict) -> dict:
+    """The script validation report, when the answer went through script_validation."""
+    return {"validation": answer_json["validation"]} if "validation" in answer_json else {}
+
+
+def format_code_output(code_json: dict) -> dict:
+    return {
+        "name": code_json.get("Name", ""),
+        "cli": code_json.get("CLI", ""),
+        "python": code_json.get("python", ""),
+        "conclusion": code_json.get("conclusion", ""),
+        **_validation(code_json)
+    }
+
+
+def format_chat_code(response_json: dict) -> dict:
+    return {
+        "requestType": response_json.get("Request_type", ""),
+        "updatedCode": {
+            "cli": response_json.get("CLI", ""),
+            "python": response_json.get("python", "")
+        },
+        "agentName": response_json.get("Name", ""),
+        **_validation(response_json)
+    }
+
+
+def format_chat_response(response_json: dict) -> dict:
+    return {
+        "response": response_json.get("Response", ""),
+        **format_chat_code(response_json)
+    }
+
+
+def format_tech_review(review_json: dict) -> dict:
+    return {
+        "scriptSummary": review_json.get("ScriptSummary", ""),
+        "technicalImprovements": review_json.get("TechnicalImprovements", ""),
+        "featureSuggestions": review_json.get("FeatureSuggestions", ""),
+        "conclusion": review_json.get("Conclusion", "")
+    }
+
+
+def format_cost_analysis(cost_json: dict) -> dict:
+    return {
+        "analysis": cost_json.get("Analysis", ""),
+        "costEstimation": cost_json.get("CostEstimation", ""),
+        "conclusion": cost_json.get("Conclusion", "")
+    }
+
+
+def error_status(e: Exception) -> tuple:
+    """HTTP status and headers for an exception raised by a route.
+
+    Transient upstream failures are reported as 503 with ``Retry-After`` so
+    clients back off instead of retrying straight into the rate limit.
+    """
+    if isinstance(e, UpstreamError) and (e.retryable or e.retry_after is not None):
+        return 503, {"Retry-After": str(math.ceil(e.retry_after or 1))}
+    return 500, {}
+
+
+# Answer schema and response shape for each section produced by finalize.run_reviews
+REVIEW_FORMATTERS = {
+    "techReview": (tech_review_agent.AnswerFormat, format_tech_review),
+    "costAnalysis": (cost_agent.AnswerFormat, format_cost_analysis),
+}
+
+
+def review_section_result(section: str, output: str, error: Exception) -> dict:
+    if error is not None:
+        return {"section": section, "success": False, "error": str(error)}
+    try:
+        answer_format, formatter = REVIEW_FORMATTERS[section]
+        return {"section": section, "success": True, **formatter(parse_agent_output(output, answer_format))}
+    except Exception as e:
+        return {"section": section, "success": False, "error": str(e)}
+
+
+# SSE comment sent first so the headers go out before the upstream call connects
+STREAM_OPENED = ": stream opened\n\n"
+
+
+class CodeStream:
+    """Turn streamed code-generation deltas into SSE events.
+
+    Every delta is relayed as a ``delta`` event, each JSON field as a
+    ``field`` event once its value is complete, and the parsed and validated
+    result as a final ``done`` event with the same shape as the non-streaming
+    routes. The headers are sent before the upstream call starts, so the
+    ``done`` event also carries the ``model`` that generated the code.
+    """
+
+    def __init__(self, answer_format):
+        self.answer_format = answer_format
+        self.parser = IncrementalFieldParser()
+        self.content = []
+
+    def feed(self, delta: str) -> list:
+        self.content.append(delta)
+        events = [format_event("delta", {"content": delta})]
+        for field, value in self.parser.feed(delta):
+            events.append(format_event("field", {"name": field, "value": value}))
+        return events
+
+    def result(self) -> dict:
+        return parse_agent_output("".join(self.content), self.answer_format)
+
+    def finish(self) -> str:
+        model = metrics.request_models()
+        code_json = validate_code_answer(self.result())
+        return format_event("done", {"success": True, **format_code_output(code_json), "model": model})
+
+    async def afinish(self) -> str:
+        model = metrics.request_models()
+        code_json = await avalidate_code_answer(self.result())
+        return format_event("done", {"success": True, **format_code_output(code_json), "model": model})
+
+    @staticmethod
+    def error(e: Exception) -> str:
+        return format_event("error", {"success": False, "error": str(e)})
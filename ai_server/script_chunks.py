@@ -0,0 +1,74 @@
+"""Split a generated agent script into top-level chunks for chunked review.
+
+Every top-level function and class is a chunk of its own, and each run of
+other top-level statements (imports, constants, the ``__main__`` block) is
+one chunk. Comments and blank lines belong to the chunk that follows them.
+Chunks shorter than ``MIN_CHUNK_CHARS`` are merged into the next one so a
+script of many small helpers does not turn into many tiny calls; only a
+short last chunk is left as it is.
+
+A chunk's ``hash`` covers only its own source, so editing one function
+changes the hash of that chunk (and of any small neighbours merged with it)
+and leaves the others as they were.
+"""
+import ast
+import hashlib
+import os
+
+MIN_CHUNK_CHARS = int(os.getenv("AI_REVIEW_MIN_CHUNK_CHARS", "600"))
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def _units(tree: ast.Module, line_count: int) -> list:
+    """``[name, first_line, last_line]`` for each definition and each run of other statements."""
+    units = []
+    for node in tree.body:
+        if isinstance(node, _DEFINITIONS):
+            units.append([node.name, node.end_lineno])
+        elif units and units[-1][0] is None:
+            units[-1][1] = node.end_lineno
+        else:
+            units.append([None, node.end_lineno])
+    first = 1
+    spans = []
+    for name, last in units:
+        spans.append([name or "module-level code", first, last])
+        first = last + 1
+    if spans:
+        # Trailing comments and blank lines go with the last chunk
+        spans[-1][2] = line_count
+    return spans
+
+
+def split_chunks(source: str, min_chars: int = MIN_CHUNK_CHARS) -> list:
+    """Return ``{"name", "firstLine", "lastLine", "source", "hash"}`` for each chunk of ``source``.
+
+    Raises ``SyntaxError`` if the script does not parse.
+    """
+    lines = source.splitlines(keepends=True)
+    chunks = []
+    pending = None
+    for name, first, last in _units(ast.parse(source), len(lines)):
+        if pending is not None:
+            name, first = f"{pending[0]}, {name}", pending[1]
+        text = "".join(lines[first - 1:last])
+        if len(text) < min_chars:
+            pending = (name, first)
+            continue
+        pending = None
+        chunks.append(_chunk(name, first, last, text))
+    if pending is not None:
+        # A short tail stays a chunk of its own so editing it leaves the chunk before it unchanged
+        chunks.append(_chunk(pending[0], pending[1], len(lines), "".join(lines[pending[1] - 1:])))
+    return chunks
+
+
+def _chunk(name: str, first: int, last: int, text: str) -> dict:
+    return {
+        "name": name,
+        "firstLine": first,
+        "lastLine": last,
+        "source": text,
+        "hash": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+    }
@@ -0,0 +1,287 @@
+"""Local checks for generated agent scripts, with one targeted repair call.
+
+Every script returned by the code-generation and chat agents goes through
+``validate_code_answer`` before it reaches the user:
+
+* ``ast.parse`` catches syntax errors in-process,
+* the script is compiled in a separate, resource-limited interpreter, which
+  also catches the errors only the compiler reports (``return`` outside a
+  function, ``await`` outside ``async def``, ...) without risking the server,
+* the third-party imports are checked against the ``pip install`` commands of
+  the ``CLI`` field, and missing packages are added to it locally.
+
+If the script does not compile, one repair call is made with just the error
+and the lines around it; the edits it returns are applied locally and the
+script is checked again. The answer gains a ``validation`` report either
+way, and a failed check or repair never fails the request.
+"""
+import ast
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+
+import metrics
+from code_edits import EditError, apply_edits
+from repair_agent import run_repair, arun_repair, AnswerFormat as RepairAnswer
+from structured_output import parse_agent_output
+
+SCRIPT_VALIDATION = os.getenv("AI_SCRIPT_VALIDATION", "1") == "1"
+SCRIPT_REPAIR = os.getenv("AI_SCRIPT_REPAIR", "1") == "1"
+CHECK_TIMEOUT = float(os.getenv("AI_SCRIPT_CHECK_TIMEOUT", "10"))
+CHECK_MEMORY_MB = int(os.getenv("AI_SCRIPT_CHECK_MEMORY_MB", "512"))
+# Lines of context sent on each side of the failing line
+REPAIR_CONTEXT_LINES = int(os.getenv("AI_SCRIPT_REPAIR_CONTEXT_LINES", "10"))
+
+# Import names whose pip distribution is named differently
+IMPORT_PACKAGES = {
+    "attr": "attrs",
+    "bs4": "beautifulsoup4",
+    "cv2": "opencv-python",
+    "Crypto": "pycryptodome",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "dotenv": "python-dotenv",
+    "faiss": "faiss-cpu",
+    "fitz": "pymupdf",
+    "google.genai": "google-genai",
+    "google.generativeai": "google-generativeai",
+    "googleapiclient": "google-api-python-client",
+    "jwt": "pyjwt",
+    "magic": "python-magic",
+    "PIL": "pillow",
+    "pptx": "python-pptx",
+    "serpapi": "google-search-results",
+    "sklearn": "scikit-learn",
+    "yaml": "pyyaml",
+}
+
+# Runs in the sandbox interpreter: limit its memory and CPU, then compile the script read from stdin
+_COMPILE_CHECK = """
+import json, sys
+try:
+    import resource
+    resource.setrlimit(resource.RLIMIT_AS, ({memory}, {memory}))
+    resource.setrlimit(resource.RLIMIT_CPU, ({cpu}, {cpu}))
+except (ImportError, ValueError, OSError):
+    pass
+try:
+    compile(sys.stdin.buffer.read(), "agent.py", "exec")
+except SyntaxError as e:
+    print(json.dumps({{"message": f"{{type(e).__name__}}: {{e.msg}}", "line": e.lineno}}))
+except ValueError as e:
+    print(json.dumps({{"message": f"ValueError: {{e}}", "line": None}}))
+"""
+
+
+def _problem(kind: str, message: str, line: int = None) -> dict:
+    return {"kind": kind, "message": message, "line": line}
+
+
+def check_syntax(source: str):
+    """Return a syntax problem, or None if the script parses."""
+    try:
+        ast.parse(source)
+    except SyntaxError as e:
+        return _problem("syntax", f"{type(e).__name__}: {e.msg}", e.lineno)
+    except ValueError as e:
+        return _problem("syntax", f"ValueError: {e}")
+    return None
+
+
+def check_compile(source: str):
+    """Compile the script in a separate interpreter; return a compile problem or None."""
+    script = _COMPILE_CHECK.format(memory=CHECK_MEMORY_MB * 1024 * 1024, cpu=max(1, int(CHECK_TIMEOUT)))
+    try:
+        result = subprocess.run(
+            [sys.executable, "-I", "-S", "-c", script],
+            input=source.encode("utf-8"), capture_output=True, timeout=CHECK_TIMEOUT, env={},
+        )
+    except (subprocess.TimeoutExpired, OSError):
+        # The sandbox itself failed; that says nothing about the script
+        return None
+    if result.returncode != 0:
+        return _problem("compile", "The script could not be compiled (the compiler ran out of resources)")
+    output = result.stdout.decode("utf-8", "replace").strip()
+    if not output:
+        return None
+    report = json.loads(output)
+    return _problem("compile", report["message"], report["line"])
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def declared_packages(cli: str):
+    """Distributions named in the ``pip install`` commands of ``cli``; None if they cannot be known."""
+    packages = set()
+    for command in re.split(r"[\n;&|]+", cli or ""):
+        words = command.split()
+        if "install" not in words or not any(word.endswith(("pip", "pip3")) for word in words):
+            continue
+        for word in words[words.index("install") + 1:]:
+            if word in ("-r", "--requirement") or word.startswith(("-r", "--requirement=")) or word.endswith(".txt"):
+                return None
+            word = word.strip("'\"")
+            if not word or word.startswith("-") or word.startswith(("git+", "http", ".", "/")):
+                continue
+            packages.add(_normalize(re.split(r"[\[<>=!~;@ ]", word, maxsplit=1)[0]))
+    return packages
+
+
+def _required_imports(tree: ast.AST) -> list:
+    """Dotted names of the absolute imports not guarded by a ``try``, in order."""
+    imports = {}
+
+    def visit(node, guarded: bool):
+        if isinstance(node, ast.Import) and not guarded:
+            for alias in node.names:
+                imports.setdefault(alias.name)
+        elif isinstance(node, ast.ImportFrom) and not guarded and not node.level and node.module:
+            imports.setdefault(node.module)
+        for child in ast.iter_child_nodes(node):
+            visit(child, guarded or isinstance(node, ast.Try))
+
+    visit(tree, False)
+    return list(imports)
+
+
+def _is_declared(module: str, packages: set) -> bool:
+    parts = module.split(".")
+    for length in range(len(parts), 0, -1):
+        name = ".".join(parts[:length])
+        candidate = _normalize(IMPORT_PACKAGES.get(name, name))
+        if any(package == candidate or package.startswith(candidate + "-") for package in packages):
+            return True
+    return False
+
+
+def _package_for(module: str) -> str:
+    parts = module.split(".")
+    for length in range(len(parts), 0, -1):
+        name = ".".join(parts[:length])
+        if name in IMPORT_PACKAGES:
+            return IMPORT_PACKAGES[name]
+    return parts[0].replace("_", "-")
+
+
+def missing_packages(source: str, cli: str) -> list:
+    """Distributions the script imports but the CLI does not install, in import order."""
+    packages = declared_packages(cli)
+    if packages is None:
+        # Installs a requirements file we cannot see
+        return []
+    missing = {}
+    for module in _required_imports(ast.parse(source)):
+        if module.split(".")[0] in sys.stdlib_module_names or _is_declared(module, packages):
+            continue
+        missing.setdefault(_package_for(module), None)
+    return list(missing)
+
+
+def add_packages(cli: str, packages: list) -> str:
+    """Append ``packages`` to the first ``pip install`` command of ``cli``, or add one if there is none."""
+    lines = cli.split("\n")
+    for index, line in enumerate(lines):
+        if re.search(r"\bpip3?\s+install\b", line):
+            lines[index] = line.rstrip() + " " + " ".join(packages)
+            return "\n".join(lines)
+    command = "pip install " + " ".join(packages)
+    return cli.rstrip("\n") + "\n" + command if cli.strip() else command
+
+
+def check_script(source: str):
+    """Return the first problem that stops the script from compiling, or None."""
+    return check_syntax(source) or check_compile(source)
+
+
+def repair_request(source: str, problem: dict) -> tuple:
+    """The error, line range and region of ``source`` sent to the repair agent."""
+    lines = source.splitlines(keepends=True)
+    line = min(max(problem["line"] or len(lines), 1), max(len(lines), 1))
+    first = max(1, line - REPAIR_CONTEXT_LINES)
+    last = min(len(lines), line + REPAIR_CONTEXT_LINES)
+    error = f"{problem['message']} (line {line})"
+    return error, first, last, "".join(lines[first - 1:last])
+
+
+def _apply_repair(source: str, request: tuple, repair_output: str):
+    """Apply the repair agent's edits to the region it was shown; None if they do not apply."""
+    _, first, last, _ = request
+    edits = parse_agent_output(repair_output, RepairAnswer)["edits"]
+    try:
+        # A search string that also occurs outside the region must not match there
+        return apply_edits(source, edits, lines=(first, last))
+    except EditError as e:
+        print("Script repair edits did not apply:", e)
+        return None
+
+
+def _report(problem, repaired: bool) -> dict:
+    problems = [problem] if problem is not None else []
+    return {"ok": not problems, "repaired": repaired, "problems": problems}
+
+
+def _needs_validation(code_json: dict) -> bool:
+    python = code_json.get("python") or ""
+    return SCRIPT_VALIDATION and bool(python.strip()) and python.strip() != "NULL"
+
+
+def _with_imports_checked(code_json: dict, report: dict) -> dict:
+    cli = code_json.get("CLI") or ""
+    added = [] if report["problems"] else missing_packages(code_json["python"], cli)
+    if added:
+        code_json = {**code_json, "CLI": add_packages("" if cli.strip() == "NULL" else cli, added)}
+    return {**code_json, "validation": {**report, "addedPackages": added}}
+
+
+def validate_code_answer(code_json: dict) -> dict:
+    """Check (and if needed repair) the ``python`` and ``CLI`` fields of a parsed agent answer."""
+    if not _needs_validation(code_json):
+        return code_json
+    source = code_json["python"]
+    with metrics.stage("script_validation"):
+        problem = check_script(source)
+    repaired = False
+    if problem is not None and SCRIPT_REPAIR:
+        try:
+            request = repair_request(source, problem)
+            fixed = _apply_repair(source, request, run_repair(*request))
+        except Exception as e:
+            print("Script repair call failed:", e)
+            fixed = None
+        if fixed is not None:
+            with metrics.stage("script_validation"):
+                remaining = check_script(fixed)
+            if remaining is None:
+                source, problem, repaired = fixed, None, True
+    report = _report(problem, repaired)
+    with metrics.stage("script_validation"):
+        return _with_imports_checked({**code_json, "python": source}, report)
+
+
+async def avalidate_code_answer(code_json: dict) -> dict:
+    if not _needs_validation(code_json):
+        return code_json
+    source = code_json["python"]
+    with metrics.stage("script_validation"):
+        problem = await asyncio.to_thread(check_script, source)
+    repaired = False
+    if problem is not None and SCRIPT_REPAIR:
+        try:
+            request = repair_request(source, problem)
+            fixed = _apply_repair(source, request, await arun_repair(*request))
+        except Exception as e:
+            print("Script repair call failed:", e)
+            fixed = None
+        if fixed is not None:
+            with metrics.stage("script_validation"):
+                remaining = await asyncio.to_thread(check_script, fixed)
+            if remaining is None:
+                source, problem, repaired = fixed, None, True
+    report = _report(problem, repaired)
+    with metrics.stage("script_validation"):
+        return _with_imports_checked({**code_json, "python": source}, report)
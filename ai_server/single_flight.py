@@ -0,0 +1,211 @@
+"""Request coalescing ("single-flight") for identical in-flight upstream calls.
+
+When the same request is already being answered, later callers wait for
+that call and share its result instead of paying for a second one. Only
+callers that arrive while the call is in flight share it; nothing is kept
+once it finishes (that is the response cache's job).
+
+``AI_SINGLE_FLIGHT`` selects the scope:
+
+* ``thread`` (default) coalesces callers inside one worker process,
+* ``process`` additionally coalesces across worker processes on the host:
+  the leader holds an ``flock`` on a per-key lock file, writes its result
+  into that file and unlinks it before unlocking. Processes blocked on the
+  lock then read the result from their open handle, while later callers
+  create a fresh lock file and lead a new call,
+* ``off`` disables coalescing.
+"""
+import asyncio
+import json
+import os
+import threading
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+SINGLE_FLIGHT_MODE = os.getenv("AI_SINGLE_FLIGHT", "thread")
+SINGLE_FLIGHT_DIR = os.getenv("AI_SINGLE_FLIGHT_DIR", ".single_flight")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key."""
+
+    def __init__(self, cross_process: bool = False, lock_dir: str = SINGLE_FLIGHT_DIR):
+        self.cross_process = cross_process and fcntl is not None
+        self.lock_dir = lock_dir
+        self.coalesced = 0
+        self._calls = {}
+        self._async_calls = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        if self.cross_process:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key: str, fn):
+        """Return ``fn()``, or the result of an identical call already in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = self._lead(key, fn)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: str, fn):
+        """Event-loop counterpart of ``do``; ``fn`` is a coroutine function.
+
+        The call runs as a task of its own that every caller awaits through
+        ``asyncio.shield``, so a cancelled caller never cancels the others.
+        It is cancelled only once no caller is left waiting for it.
+        """
+        loop = asyncio.get_running_loop()
+        calls = self._async_calls.setdefault(loop, {})
+        call = calls.get(key)
+        if call is None:
+            call = calls[key] = _AsyncCall(loop.create_task(self._alead(key, fn)))
+            call.task.add_done_callback(lambda _done: calls.pop(key) if calls.get(key) is call else None)
+            # Retrieve the outcome so a failure nobody waited for is not logged as never retrieved
+            call.task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                if calls.get(key) is call:
+                    del calls[key]
+                call.task.cancel()
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, key + ".lock")
+
+    def _acquire(self, key: str) -> tuple:
+        """``(handle, None)`` to lead the call, or ``(None, value)`` answered by the leader we waited for."""
+        path = self._lock_path(key)
+        while True:
+            handle = open(path, "a+", encoding="utf-8")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(path).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current == os.fstat(handle.fileno()).st_ino:
+                    # Still the live lock file: we lead (a crashed leader leaves it behind unanswered)
+                    return handle, None
+                # The leader unlinked the file when it finished; its answer, if any, is in it
+                handle.seek(0)
+                written = handle.read()
+            except BaseException:
+                handle.close()
+                raise
+            handle.close()
+            if written:
+                with self._lock:
+                    self.coalesced += 1
+                return None, json.loads(written)["value"]
+            # The leader failed without answering: try to lead ourselves
+
+    def _release(self, key: str, handle, value=None, answered: bool = False):
+        """Publish ``value`` to the processes waiting on ``handle``, then retire the lock file."""
+        try:
+            if answered:
+                handle.seek(0)
+                handle.truncate()
+                handle.write(json.dumps({"value": value}))
+                handle.flush()
+            try:
+                os.unlink(self._lock_path(key))
+            except FileNotFoundError:
+                pass
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+    def _lead(self, key: str, fn):
+        if not self.cross_process:
+            return fn()
+        handle, value = self._acquire(key)
+        if handle is None:
+            return value
+        try:
+            value = fn()
+        except BaseException:
+            self._release(key, handle)
+            raise
+        self._release(key, handle, value, answered=True)
+        return value
+
+    def _abandon(self, key: str, acquired: asyncio.Future):
+        """Release a lock whose ``_acquire`` finished after its caller was cancelled."""
+        if not acquired.cancelled() and acquired.exception() is None:
+            handle, _value = acquired.result()
+            if handle is not None:
+                self._release(key, handle)
+
+    async def _alead(self, key: str, fn):
+        if not self.cross_process:
+            return await fn()
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self._acquire, key))
+        try:
+            handle, value = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The flock may still be granted in the worker thread; release it when it is
+            acquiring.add_done_callback(lambda done: self._abandon(key, done))
+            raise
+        if handle is None:
+            return value
+        try:
+            value = await fn()
+        except BaseException:
+            await asyncio.shield(asyncio.to_thread(self._release, key, handle))
+            raise
+        await asyncio.shield(asyncio.to_thread(self._release, key, handle, value, True))
+        return value
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Return the process-wide coalescer configured from the environment, or None if disabled."""
+    global _single_flight
+    if _single_flight is None and SINGLE_FLIGHT_MODE != "off":
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(cross_process=SINGLE_FLIGHT_MODE == "process")
+    return _single_flight
@@ -0,0 +1,55 @@
+"""Helpers for writing Server-Sent Events responses."""
+import json
+import time
+
+# Disable proxy buffering so each event reaches the client as soon as it is yielded
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_event(event: str, data) -> str:
+    """Serialize one SSE event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def coalesce(chunks, min_chars: int = 32, max_delay: float = 0.05):
+    """Merge small text chunks so each SSE write carries a useful amount of text.
+
+    A batch is released once it holds ``min_chars`` characters or has been
+    waiting ``max_delay`` seconds. Nothing is read ahead of the consumer:
+    the next upstream chunk is only pulled after the previous batch has been
+    written, so a slow client naturally slows the upstream read.
+    """
+    batch = []
+    size = 0
+    started = None
+    for chunk in chunks:
+        if not batch:
+            started = time.monotonic()
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= min_chars or time.monotonic() - started >= max_delay:
+            yield "".join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield "".join(batch)
+
+
+async def acoalesce(chunks, min_chars: int = 32, max_delay: float = 0.05):
+    batch = []
+    size = 0
+    started = None
+    async for chunk in chunks:
+        if not batch:
+            started = time.monotonic()
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= min_chars or time.monotonic() - started >= max_delay:
+            yield "".join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield "".join(batch)
@@ -0,0 +1,148 @@
+"""Incremental parser for JSON agent responses that arrive as a token stream.
+
+Reasoning models stream a ``<think>...</think>`` block (and sometimes a
+markdown fence) before the JSON object itself. ``IncrementalFieldParser``
+skips that prelude and emits each top-level field of the object as soon as
+its value is complete, so the client can render ``Name`` and ``CLI`` long
+before ``python`` and ``conclusion`` have finished generating.
+"""
+import json
+
+_WHITESPACE = " \t\r\n"
+
+# Parser states
+_PRELUDE = "prelude"
+_KEY = "key"
+_KEY_STRING = "key_string"
+_COLON = "colon"
+_VALUE = "value"
+_DONE = "done"
+
+
+class IncrementalFieldParser:
+    """Feed streamed text in; get ``(field, value)`` pairs out as they complete."""
+
+    def __init__(self):
+        self.fields = {}
+        self._state = _PRELUDE
+        self._buffer = ""
+        self._in_think = False
+        self._key = []
+        self._value = []
+        self._escape = False
+        self._in_string = False
+        self._depth = 0
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def feed(self, text: str) -> list:
+        """Consume the next chunk and return the fields it completed."""
+        completed = []
+        if self._state == _PRELUDE:
+            self._buffer += text
+            text = self._skip_prelude()
+            if text is None:
+                return completed
+        for char in text:
+            if self._state == _DONE:
+                break
+            field = self._step(char)
+            if field is not None:
+                self.fields[field[0]] = field[1]
+                completed.append(field)
+        return completed
+
+    def _skip_prelude(self):
+        """Drop any <think> block and leading prose; return the text after the opening brace."""
+        while True:
+            buffer = self._buffer
+            if self._in_think:
+                think_end = buffer.find("</think>")
+                if think_end == -1:
+                    # Only a partial closing tag can matter for the next chunk
+                    self._buffer = buffer[-len("</think>"):]
+                    return None
+                self._buffer = buffer[think_end + len("</think>"):]
+                self._in_think = False
+                continue
+            think_start = buffer.find("<think>")
+            brace = buffer.find("{")
+            if think_start != -1 and (brace == -1 or think_start < brace):
+                self._buffer = buffer[think_start + len("<think>"):]
+                self._in_think = True
+                continue
+            if brace == -1:
+                self._buffer = buffer[-len("<think>"):]
+                return None
+            self._buffer = ""
+            self._state = _KEY
+            return buffer[brace + 1:]
+
+    def _step(self, char: str):
+        state = self._state
+        if state == _KEY:
+            if char == '"':
+                self._key = []
+                self._state = _KEY_STRING
+            elif char == "}":
+                self._state = _DONE
+        elif state == _KEY_STRING:
+            if self._escape:
+                self._escape = False
+                self._key.append(char)
+            elif char == "\\":
+                self._escape = True
+                self._key.append(char)
+            elif char == '"':
+                self._state = _COLON
+            else:
+                self._key.append(char)
+        elif state == _COLON:
+            if char == ":":
+                self._value = []
+                self._in_string = False
+                self._depth = 0
+                self._state = _VALUE
+        elif state == _VALUE:
+            return self._step_value(char)
+        return None
+
+    def _step_value(self, char: str):
+        if not self._value and char in _WHITESPACE:
+            return None
+        if self._in_string:
+            self._value.append(char)
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._depth == 0:
+                    return self._finish_value()
+            return None
+        if self._depth == 0 and char in ",}":
+            field = self._finish_value()
+            self._state = _DONE if char == "}" else _KEY
+            return field
+        self._value.append(char)
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                return self._finish_value()
+        return None
+
+    def _finish_value(self):
+        key = json.loads('"' + "".join(self._key) + '"')
+        raw = "".join(self._value).strip()
+        self._value = []
+        self._state = _KEY
+        if not raw:
+            return None
+        return key, json.loads(raw)
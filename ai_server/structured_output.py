@@ -0,0 +1,70 @@
+"""Fast parser for the structured JSON answers returned by the agents.
+
+Reasoning models prefix their answer with a ``<think>...</think>`` block
+that can run to hundreds of KB, and sometimes wrap the JSON in a markdown
+fence or a sentence of prose. ``parse_agent_output``:
+
+* locates the end of the think block with one ``str.find`` and never copies
+  the block itself,
+* decodes the first complete JSON object from that offset in place with
+  ``JSONDecoder.raw_decode``, so leading and trailing text are ignored,
+* validates the object against the agent's ``AnswerFormat`` model.
+"""
+import functools
+import json
+
+from pydantic import ValidationError
+
+import metrics
+
+THINK_CLOSE = "</think>"
+# Give up after this many '{' that do not start a valid JSON object
+MAX_OBJECT_STARTS = 32
+
+_decoder = json.JSONDecoder()
+
+
+class StructuredOutputError(ValueError):
+    """The agent output did not contain a valid structured answer."""
+
+
+def answer_offset(text: str) -> int:
+    """Index just past the ``</think>`` block, or 0 if there is none."""
+    end = text.find(THINK_CLOSE)
+    return 0 if end == -1 else end + len(THINK_CLOSE)
+
+
+def extract_json_object(text: str, start: int = 0) -> dict:
+    """Decode the first JSON object found at or after ``start``."""
+    index = text.find("{", start)
+    for _ in range(MAX_OBJECT_STARTS):
+        if index == -1:
+            break
+        try:
+            value, _end = _decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            index = text.find("{", index + 1)
+            continue
+        if isinstance(value, dict):
+            return value
+        index = text.find("{", index + 1)
+    raise StructuredOutputError("No JSON object found in the agent output.")
+
+
+def parse_agent_output(text: str, answer_format=None) -> dict:
+    """Parse an agent response, validating it against ``answer_format`` when given."""
+    with metrics.stage("think_strip"):
+        offset = answer_offset(text)
+    with metrics.stage("json_parse"):
+        data = extract_json_object(text, offset)
+        if answer_format is None:
+            return data
+        try:
+            return answer_format.model_validate(data).model_dump()
+        except ValidationError as e:
+            raise StructuredOutputError(f"Agent output does not match {answer_format.__name__}: {e}") from e
+
+
+def validator(answer_format):
+    """A ``validate`` callback for ``perplexity_client.complete`` that raises unless the output parses as ``answer_format``."""
+    return functools.partial(parse_agent_output, answer_format=answer_format)
@@ -1,15 +1,37 @@
+import asyncio
+import contextvars
+import hashlib
+import json
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor
 
-def run_tech_review(search_filter_context: list, code: str) -> str:
-    
+from pydantic import BaseModel
 
-    class AnswerFormat(BaseModel):
-        ScriptSummary: str
-        TechnicalImprovements : str
-        FeatureSuggestions: str
-        Conclusion: str
-    AGENT_TECH_REVIEW_PROMPT = """
+import perplexity_client
+import metrics
+import response_cache
+from script_chunks import split_chunks
+from structured_output import parse_agent_output, validator
+
+# "single" reviews the whole script in one call; "chunked" reviews its top-level
+# functions and classes separately, caching each, and merges the findings
+TECH_REVIEW_MODE = os.getenv("AI_TECH_REVIEW_MODE", "single")
+CHUNK_REVIEW_CONCURRENCY = int(os.getenv("AI_REVIEW_CHUNK_CONCURRENCY", "8"))
+
+class AnswerFormat(BaseModel):
+    ScriptSummary: str
+    TechnicalImprovements : str
+    FeatureSuggestions: str
+    Conclusion: str
+
+
+class ChunkFindings(BaseModel):
+    Summary: str
+    TechnicalImprovements: str
+    FeatureSuggestions: str
+
+
+AGENT_TECH_REVIEW_PROMPT = """
         You are a world-class AI engineer and solution architect who has spent the
         last decade optimising LLM-powered applications for reliability, depth, and
         extensibility.
@@ -62,24 +84,218 @@ def run_tech_review(search_filter_context: list, code: str) -> str:
             YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON , ABSOLUTELY NOTHING ELSE
         """
 
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {"Authorization": f"Bearer {os.getenv('PERPLEXITY_API_KEY')}"}
-    payload = {
-        "model": "sonar-pro",
+CHUNK_REVIEW_PROMPT = """
+        You are a world-class AI engineer reviewing ONE part of an existing
+        AI-agent script: a top-level function, class or block of module-level
+        code. The rest of the script is reviewed separately, so judge only the
+        code you are given and do not ask for the missing parts.
+
+        Step 1 : Summarise in one or two sentences what this part does.
+        Step 2 : List the technical problems or improvements specific to this
+                code (error handling, retries, prompt strategy, retrieval,
+                latency, security, observability), if any.
+        Step 3 : Note features or tools this part could integrate, if any.
+
+        Be specific and brief: name concrete libraries or config flags, and
+        write "None" for a step with nothing worth saying.
+
+        {
+            "Summary" : what this part does,
+            "TechnicalImprovements" : • bullet list, or None,
+            "FeatureSuggestions" : • bullet list, or None
+        }
+            YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON , ABSOLUTELY NOTHING ELSE
+        """
+
+REDUCE_REVIEW_PROMPT = """
+        You are a world-class AI engineer and solution architect. An AI-agent
+        script has been reviewed part by part; you are given the findings for
+        each part, in script order. Merge them into one review of the whole
+        script:
+
+        Step 1 : Summarise the script’s core purpose, workflow and architecture.
+        Step 2 : Pick the **three to four** most impactful technical
+                improvements across all parts, merging duplicates, each labelled
+                with its expected qualitative gain.
+        Step 3 : Pick the most valuable additional features or tools and
+                explain *why* each is valuable.
+        Step 4 : Write a concise conclusion that recaps the most impactful
+                upgrade and asks **one** follow-up question:
+                    → “Would you like deeper technical details or a quick prototype
+                        of one recommendation?”
+
+        {
+            "ScriptSummary" : 1–2 short paragraphs capturing purpose and stack
+            
+            "TechnicalImprovements" : • Bullet list with ≥3 and ≤4 technical suggestions ,
+
+            "FeatureSuggestions" : • Bullet list of new tools / integrations with rationale,
+
+            "Conclusion": Plain-English wrap-up and ONE follow-up question
+        }
+            YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON , ABSOLUTELY NOTHING ELSE
+        """
+
+# Everything but the per-request fields, built once at import; shared by every request, so never mutate it
+PAYLOAD_TEMPLATE = {
+    "model": "sonar-pro",
+    "web_search_options": {
+        "search_context_size": "medium"
+    },
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": AnswerFormat.model_json_schema()},
+    },
+}
+CHUNK_PAYLOAD_TEMPLATE = {
+    "model": "sonar-pro",
+    "web_search_options": {
+        "search_context_size": "low"
+    },
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": ChunkFindings.model_json_schema()},
+    },
+}
+REDUCE_PAYLOAD_TEMPLATE = {
+    **PAYLOAD_TEMPLATE,
+    "web_search_options": {
+        "search_context_size": "low"
+    },
+}
+SYSTEM_MESSAGE = {"role": "system", "content": AGENT_TECH_REVIEW_PROMPT}
+CHUNK_SYSTEM_MESSAGE = {"role": "system", "content": CHUNK_REVIEW_PROMPT}
+REDUCE_SYSTEM_MESSAGE = {"role": "system", "content": REDUCE_REVIEW_PROMPT}
+# Part of every chunk's cache key, so findings cached under an older prompt or schema are not reused
+CHUNK_CACHE_VERSION = hashlib.sha256(json.dumps([CHUNK_REVIEW_PROMPT, CHUNK_PAYLOAD_TEMPLATE], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+_chunk_executor = ThreadPoolExecutor(max_workers=CHUNK_REVIEW_CONCURRENCY, thread_name_prefix="review-chunk")
+
+
+@metrics.prompt_stage("tech_review")
+def build_tech_review_payload(search_filter_context: list, code: str) -> dict:
+    return {
+        **PAYLOAD_TEMPLATE,
         "messages": [
-            {"role": "system", "content": AGENT_TECH_REVIEW_PROMPT},
+            SYSTEM_MESSAGE,
             {"role": "user", "content":
                 "I want you to run a review of the following agent's script and tell me how I can improve it \n\n" + code
             }
         ],
-        "web_search_options": {
-            "search_context_size": "medium"
-        },
         "search_domain_filter": search_filter_context,
-        "response_format": {
-                "type": "json_schema",
-            "json_schema": {"schema": AnswerFormat.model_json_schema()},
-        }
     }
-    response = requests.post(url, headers=headers, json=payload).json()
-    return response["choices"][0]["message"]["content"]
\ No newline at end of file
+
+
+@metrics.prompt_stage("tech_review_chunk")
+def build_chunk_review_payload(search_filter_context: list, chunk: dict) -> dict:
+    return {
+        **CHUNK_PAYLOAD_TEMPLATE,
+        "messages": [
+            CHUNK_SYSTEM_MESSAGE,
+            {"role": "user", "content":
+                f"Review this part of the agent's script ({chunk['name']}, lines {chunk['firstLine']}-{chunk['lastLine']}):\n\n"
+                + chunk["source"]
+            }
+        ],
+        "search_domain_filter": search_filter_context,
+    }
+
+
+@metrics.prompt_stage("tech_review_reduce")
+def build_reduce_review_payload(search_filter_context: list, chunks: list, findings: list) -> dict:
+    parts = [
+        f"### {chunk['name']} (lines {chunk['firstLine']}-{chunk['lastLine']})\n"
+        f"Summary: {part['Summary']}\n"
+        f"Technical improvements: {part['TechnicalImprovements']}\n"
+        f"Feature suggestions: {part['FeatureSuggestions']}"
+        for chunk, part in zip(chunks, findings)
+    ]
+    return {
+        **REDUCE_PAYLOAD_TEMPLATE,
+        "messages": [
+            REDUCE_SYSTEM_MESSAGE,
+            {"role": "user", "content": "Findings for each part of the script:\n\n" + "\n\n".join(parts)}
+        ],
+        "search_domain_filter": search_filter_context,
+    }
+
+
+def _chunk_key(search_filter_context: list, chunk: dict) -> str:
+    canonical = json.dumps([CHUNK_CACHE_VERSION, search_filter_context, chunk["hash"]])
+    return "tech-review-chunk:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def review_chunk(search_filter_context: list, chunk: dict) -> dict:
+    """Findings for one chunk, cached by its content hash for as long as the response cache keeps them."""
+    def compute():
+        output = perplexity_client.complete(build_chunk_review_payload(search_filter_context, chunk))
+        return json.dumps(parse_agent_output(output, ChunkFindings))
+
+    store = response_cache.get_cache()
+    if store is None:
+        return json.loads(compute())
+    return json.loads(store.get_or_compute(_chunk_key(search_filter_context, chunk), compute))
+
+
+async def areview_chunk(search_filter_context: list, chunk: dict) -> dict:
+    async def compute():
+        output = await perplexity_client.acomplete(build_chunk_review_payload(search_filter_context, chunk))
+        return json.dumps(parse_agent_output(output, ChunkFindings))
+
+    store = response_cache.get_cache()
+    if store is None:
+        return json.loads(await compute())
+    return json.loads(await store.aget_or_compute(_chunk_key(search_filter_context, chunk), compute))
+
+
+def _review_chunks(code: str, mode: str):
+    """The chunks to review separately, or None if the script is reviewed in one call."""
+    if (mode or TECH_REVIEW_MODE) != "chunked":
+        return None
+    try:
+        chunks = split_chunks(code)
+    except (SyntaxError, ValueError):
+        return None
+    return chunks if len(chunks) > 1 else None
+
+
+def run_tech_review(search_filter_context: list, code: str, mode: str = None) -> str:
+    """Review ``code`` and return the raw ``AnswerFormat`` answer.
+
+    In chunked mode (see ``TECH_REVIEW_MODE``) the top-level chunks of the
+    script are reviewed concurrently and their findings merged by one short
+    reduce call. Unchanged chunks are served from the cache, so re-reviewing
+    an edited script only pays for the chunks that changed.
+    """
+    chunks = _review_chunks(code, mode)
+    if chunks is None:
+        return perplexity_client.complete(build_tech_review_payload(search_filter_context, code), cache=True,
+                                          validate=validator(AnswerFormat))
+    # Each chunk runs in a copy of the caller's context so its metrics are attributed to the request
+    futures = [
+        _chunk_executor.submit(contextvars.copy_context().run, review_chunk, search_filter_context, chunk)
+        for chunk in chunks
+    ]
+    try:
+        findings = [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+    return perplexity_client.complete(build_reduce_review_payload(search_filter_context, chunks, findings), cache=True,
+                                      validate=validator(AnswerFormat))
+
+
+async def arun_tech_review(search_filter_context: list, code: str, mode: str = None) -> str:
+    chunks = _review_chunks(code, mode)
+    if chunks is None:
+        return await perplexity_client.acomplete(build_tech_review_payload(search_filter_context, code), cache=True,
+                                                 validate=validator(AnswerFormat))
+    semaphore = asyncio.Semaphore(CHUNK_REVIEW_CONCURRENCY)
+
+    async def review(chunk):
+        async with semaphore:
+            return await areview_chunk(search_filter_context, chunk)
+
+    findings = await asyncio.gather(*(review(chunk) for chunk in chunks))
+    return await perplexity_client.acomplete(build_reduce_review_payload(search_filter_context, chunks, findings), cache=True,
+                                             validate=validator(AnswerFormat))
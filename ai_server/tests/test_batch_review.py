@@ -0,0 +1,86 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import batch_review
+from batch_review import arun_batch, plan_batch, run_batch
+
+REVIEW = json.dumps({"ScriptSummary": "s", "TechnicalImprovements": "t", "FeatureSuggestions": "f", "Conclusion": "c"})
+# Finish in the reverse of submission order
+DELAYS = {"slow": 0.15, "fast": 0.0, "broken": 0.05}
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    calls, running, peak = [], [0], [0]
+    lock = threading.Lock()
+
+    def review(python_script, search_context):
+        with lock:
+            calls.append(python_script)
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            time.sleep(DELAYS.get(python_script, 0.01))
+            if python_script == "broken":
+                raise RuntimeError("upstream down")
+            return REVIEW
+        finally:
+            with lock:
+                running[0] -= 1
+
+    async def areview(python_script, search_context):
+        calls.append(python_script)
+        await asyncio.sleep(DELAYS.get(python_script, 0.01))
+        if python_script == "broken":
+            raise RuntimeError("upstream down")
+        return REVIEW
+
+    monkeypatch.setattr(batch_review, "REVIEW_AGENTS", {"techReview": (review, areview)})
+    monkeypatch.setattr(batch_review, "check_sections", lambda sections: ["techReview"])
+    return calls, peak
+
+
+def parse(lines):
+    return [json.loads(line) for line in lines]
+
+
+def test_results_stream_in_completion_order_and_failures_stay_isolated(agents):
+    calls, _peak = agents
+    plan = plan_batch({"scripts": [{"id": "a", "pythonScript": "slow"}, {"id": "b", "pythonScript": "broken"},
+                                   {"id": "c", "pythonScript": "fast"}, {"id": "d", "pythonScript": "slow"}]})
+    lines = parse(run_batch(*plan))
+    assert [line.get("id") for line in lines[:-1]] == ["c", "b", "a", "d"]
+    assert lines[1] == {"id": "b", "section": "techReview", "success": False, "error": "upstream down"}
+    assert all(line["success"] for line in lines[:-1] if line["id"] != "b")
+    # The duplicate script was reviewed once and reported for both ids
+    assert sorted(calls) == ["broken", "fast", "slow"]
+    assert lines[-1] == {"done": True, "scripts": 4, "calls": 3, "failedCalls": 1}
+
+
+def test_async_batch_isolates_failures(agents):
+    plan = plan_batch({"scripts": ["slow", "broken", "fast"]})
+
+    async def collect():
+        return [line async for line in arun_batch(*plan)]
+
+    lines = parse(asyncio.run(collect()))
+    assert [line.get("id") for line in lines[:-1]] == [2, 1, 0]
+    assert lines[-1]["failedCalls"] == 1
+
+
+def test_at_most_the_configured_number_of_calls_run_at_once(agents, monkeypatch):
+    _calls, peak = agents
+    monkeypatch.setattr(batch_review, "BATCH_CONCURRENCY", 2)
+    lines = parse(run_batch(*plan_batch({"scripts": [f"script {index}" for index in range(6)]})))
+    assert len(lines) == 7 and peak[0] <= 2
+
+
+def test_invalid_batches_are_rejected():
+    with pytest.raises(ValueError, match="non-empty list"):
+        plan_batch({"scripts": []})
+    with pytest.raises(ValueError, match="Script 1"):
+        plan_batch({"scripts": ["ok", {"id": 2}]})
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+
+import chat_sessions
+from chat_sessions import ChatSessionStore, chat_inputs, remember_turn
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ChatSessionStore(str(tmp_path / "sessions.sqlite3"), max_messages=4)
+    monkeypatch.setattr(chat_sessions, "_store", store)
+    return store
+
+
+def test_turns_append_to_a_new_session(store):
+    assert store.get("a") is None
+    store.save_turn("a", "hi", "hello", {"python": "print(1)", "context_urls": ["https://docs"]})
+    store.save_turn("a", "again", "sure", {})
+    session = store.get("a")
+    assert session["python"] == "print(1)" and session["contextUrls"] == ["https://docs"]
+    assert [message["content"] for message in session["history"]] == ["hi", "hello", "again", "sure"]
+
+
+def test_history_is_truncated_to_the_newest_messages(store):
+    for turn in range(3):
+        store.save_turn("a", f"q{turn}", f"r{turn}", {})
+    assert [message["content"] for message in store.get("a")["history"]] == ["q1", "r1", "q2", "r2"]
+
+
+def test_sent_history_replaces_the_stored_one(store):
+    store.save_turn("a", "q0", "r0", {})
+    store.save_turn("a", "q1", "r1", {}, history=[{"role": "user", "content": "edited"}])
+    assert [message["content"] for message in store.get("a")["history"]] == ["edited", "q1", "r1"]
+
+
+def test_idle_sessions_expire(store):
+    store.save_turn("old", "q", "r", {})
+    store.ttl = 0.01
+    time.sleep(0.02)
+    store.save_turn("new", "q", "r", {})
+    assert store.get("old") is None and store.get("new") is not None
+    assert store.delete("new") and not store.delete("new")
+
+
+def test_chat_inputs_fall_back_to_the_session(store):
+    remember_turn({"agentId": "a", "message": "add memory", "currentCode": "v1"},
+                  {"Request_type": "Code_change", "python": "v2", "CLI": "pip install x", "Name": "Bot", "Response": "done"})
+    assert chat_inputs({"agentId": "a", "message": "next"}) == (
+        [], "v2", "next", [{"role": "user", "content": "add memory"}, {"role": "assistant", "content": "done"}]
+    )
+    # Fields the client sends win over the stored ones
+    assert chat_inputs({"agentId": "a", "currentCode": "mine", "messagesHistory": []})[1:] == ("mine", "", [])
+    assert chat_inputs({"message": "no session"}) == ([], "", "no session", [])
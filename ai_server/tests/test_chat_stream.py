@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+import app as flask_app
+import asgi_app
+
+BAD_BODIES = [
+    {"data": "{not json", "headers": {"Content-Type": "application/json"}},
+    {"json": ["not", "an", "object"]},
+]
+
+
+@pytest.mark.parametrize("body", BAD_BODIES)
+def test_flask_stream_rejects_a_bad_body_with_json(body):
+    response = flask_app.app.test_client().post("/api/ai/chat/stream", **body)
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+@pytest.mark.parametrize("body", BAD_BODIES)
+def test_asgi_stream_rejects_a_bad_body_with_json(body):
+    async def post():
+        response = await asgi_app.app.test_client().post("/api/ai/chat/stream", **body)
+        return response.status_code, await response.get_json()
+
+    status, payload = asyncio.run(post())
+    assert status == 400
+    assert payload["success"] is False
@@ -0,0 +1,53 @@
+import pytest
+
+from code_edits import EditError, apply_edit, apply_edits, resolve_code_change
+
+SCRIPT = "import os\n\n\ndef main():\n    print('hello')\n\n\nmain()\n"
+
+
+def test_exact_edit():
+    assert apply_edit(SCRIPT, "print('hello')", "print('bye')") == SCRIPT.replace("hello", "bye")
+
+
+def test_edit_ignores_surrounding_and_trailing_whitespace():
+    edited = apply_edit(SCRIPT, "\ndef main():   \n    print('hello')  \n", "def main():\n    print('bye')")
+    assert "print('bye')" in edited
+    assert "hello" not in edited
+
+
+def test_empty_search_appends():
+    assert apply_edit(SCRIPT, "", "x = 1\n").endswith("main()\nx = 1\n")
+
+
+def test_ambiguous_and_missing_targets_raise():
+    with pytest.raises(EditError, match="ambiguous"):
+        apply_edit("a = 1\na = 1\n", "a = 1", "a = 2")
+    with pytest.raises(EditError, match="not found"):
+        apply_edit(SCRIPT, "print('nope')", "pass")
+
+
+def test_edits_apply_in_order_and_must_parse():
+    edits = [{"search": "print('hello')", "replace": "print('one')"}, {"search": "'one'", "replace": "'two'"}]
+    assert "print('two')" in apply_edits(SCRIPT, edits)
+    with pytest.raises(EditError, match="does not parse"):
+        apply_edits(SCRIPT, [{"search": "def main():", "replace": "def main(:"}])
+    with pytest.raises(EditError):
+        apply_edits(SCRIPT, [])
+    with pytest.raises(EditError, match="Malformed"):
+        apply_edits(SCRIPT, [{"search": "x"}])
+
+
+def test_resolve_code_change():
+    change = {"Request_type": "Code_change", "edits": [{"search": "hello", "replace": "hi"}]}
+    assert "print('hi')" in resolve_code_change(change, SCRIPT)["python"]
+    question = {"Request_type": "Cross_questioning", "Response": "It prints."}
+    assert resolve_code_change(question, SCRIPT)["python"] == "NULL"
+
+
+def test_edits_limited_to_a_line_span():
+    source = "x = 1\nprint(x)\ny = (\nx = 1\nprint(x)\n"
+    # "x = 1" also occurs outside lines 3-4, but only the span is searched
+    edited = apply_edits(source, [{"search": "y = (\nx = 1", "replace": "y = (\n    1)"}], lines=(3, 4))
+    assert edited == "x = 1\nprint(x)\ny = (\n    1)\nprint(x)\n"
+    with pytest.raises(EditError, match="not found"):
+        apply_edits(source, [{"search": "print(x)", "replace": "pass"}], lines=(3, 4))
@@ -0,0 +1,66 @@
+import cost_estimator
+from cost_estimator import COST_LOOP_ITERATIONS, estimate, load_pricing, match_model
+
+SCRIPT = '''
+from openai import OpenAI
+from langchain_openai import OpenAIEmbeddings
+
+client = OpenAI()
+emb = OpenAIEmbeddings(model="text-embedding-3-large")
+
+
+def summarize(text):
+    return client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": text}], max_tokens=200)
+
+
+def summarize_all(docs):
+    return [summarize(doc) for doc in docs]
+
+
+def main(question, docs):
+    vector = emb.embed_query(question)
+    for batch in client.chat.completions.create(model="gpt-4o-mini", messages=[]):
+        print(batch)
+    return summarize_all(docs)
+'''
+
+
+def components(code):
+    return {component["model"]: component for component in estimate(code)["components"]}
+
+
+def test_dated_and_prefixed_names_match_their_base_model():
+    pricing = load_pricing()
+    assert match_model("gpt-4o-2024-08-06", pricing) == "gpt-4o"
+    assert match_model("models/gemini-1.5-flash", pricing) == "gemini-1.5-flash"
+    assert match_model("not a model", pricing) is None
+    assert match_model("gpt-4o-mini", pricing) == "gpt-4o-mini"
+
+
+def test_model_matches_are_cached_in_a_bounded_cache():
+    pricing = load_pricing()
+    for index in range(50):
+        match_model(f"label-{index}", pricing)
+    info = cost_estimator._match_name.cache_info()
+    assert info.maxsize is not None and info.currsize <= info.maxsize
+    assert "matches" not in pricing
+
+
+def test_embedding_calls_count_on_any_receiver():
+    found = components(SCRIPT)
+    line = SCRIPT.splitlines().index("    vector = emb.embed_query(question)") + 1
+    assert found["text-embedding-3-large"]["lines"] == [line]
+    assert found["text-embedding-3-large"]["callsPerSession"] == 1
+
+
+def test_calls_in_functions_reached_from_a_loop_are_repeated_and_flagged():
+    found = components(SCRIPT)
+    assert found["gpt-4o"]["inLoop"]
+    assert found["gpt-4o"]["callsPerSession"] == COST_LOOP_ITERATIONS
+    assert found["gpt-4o"]["completionTokens"] == 200 * COST_LOOP_ITERATIONS
+
+
+def test_the_iterable_of_a_loop_is_called_once():
+    found = components(SCRIPT)
+    assert not found["gpt-4o-mini"]["inLoop"]
+    assert found["gpt-4o-mini"]["callsPerSession"] == 1
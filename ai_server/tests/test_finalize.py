@@ -0,0 +1,74 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import app as flask_app
+import finalize
+
+REVIEW = json.dumps({"ScriptSummary": "s", "TechnicalImprovements": "t", "FeatureSuggestions": "f", "Conclusion": "c"})
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    """A tech review that finishes only after the cost analysis has failed."""
+    cost_failed = threading.Event()
+
+    def tech_review(python_script, search_context):
+        assert cost_failed.wait(2)
+        return REVIEW
+
+    def cost_analysis(python_script, search_context):
+        cost_failed.set()
+        raise RuntimeError("upstream down")
+
+    async def atech_review(python_script, search_context):
+        await asyncio.sleep(0.05)
+        return REVIEW
+
+    async def acost_analysis(python_script, search_context):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(finalize, "REVIEW_AGENTS", {
+        "techReview": (tech_review, atech_review),
+        "costAnalysis": (cost_analysis, acost_analysis),
+    })
+
+
+def test_reviews_are_reported_in_completion_order_with_failures_isolated(agents):
+    results = list(finalize.run_reviews("print(1)", []))
+    assert [section for section, _output, _error in results] == ["costAnalysis", "techReview"]
+    assert isinstance(results[0][2], RuntimeError) and results[0][1] is None
+    assert results[1][1:] == (REVIEW, None)
+
+
+def test_async_reviews_isolate_a_failure(agents):
+    async def collect():
+        return [result async for result in finalize.arun_reviews("print(1)", [])]
+
+    results = asyncio.run(collect())
+    assert [section for section, _output, _error in results] == ["costAnalysis", "techReview"]
+    assert results[1][1] == REVIEW
+
+
+def test_unknown_section_is_rejected():
+    with pytest.raises(ValueError, match="Unknown review sections"):
+        finalize.run_reviews("print(1)", [], ["style"])
+
+
+def test_finalize_streams_one_ndjson_line_per_section(agents):
+    client = flask_app.app.test_client()
+    response = client.post("/api/ai/finalize", json={"pythonScript": "print(1)", "stream": True})
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == {"section": "costAnalysis", "success": False, "error": "upstream down"}
+    assert lines[1]["section"] == "techReview" and lines[1]["success"]
+    assert lines[1]["scriptSummary"] == "s"
+
+
+def test_finalize_reports_partial_failure(agents):
+    body = flask_app.app.test_client().post("/api/ai/finalize", json={"pythonScript": "print(1)"}).get_json()
+    assert not body["success"]
+    assert body["costAnalysis"] == {"success": False, "error": "upstream down"}
+    assert body["techReview"]["success"]
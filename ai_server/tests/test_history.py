@@ -0,0 +1,55 @@
+import json
+
+from history import compact_history, estimate_message_tokens
+
+SCRIPT = "import os\n\n" + "".join(f"def step_{index}(x):\n    return x + {index}\n\n" for index in range(20))
+
+
+def turn(question, answer="Done."):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+def test_short_history_is_kept_as_is():
+    messages = turn("What does this do?") + turn("Add logging")
+    assert compact_history(messages, budget=1000) == messages
+
+
+def test_oldest_turns_are_trimmed_and_summarised():
+    messages = [message for index in range(10) for message in turn(f"Question {index}\nmore detail", "x" * 400)]
+    history = compact_history(messages, budget=400)
+    assert sum(estimate_message_tokens(message) for message in history) <= 400 + 50
+    assert history[-1] == messages[-1]
+    recap = history[0]["content"]
+    assert recap.startswith("Earlier in this conversation (summarised) the user asked:\n- Question 0\n")
+    assert "more detail" not in recap.split("\n\n")[0]
+    kept = len(history) // 2
+    assert recap.endswith("\n\n" + messages[-2 * kept]["content"])
+    assert f"- Question {9 - kept}" in recap and f"- Question {10 - kept}" not in recap.split("\n\n")[0]
+
+
+def test_latest_turn_is_kept_even_over_budget():
+    messages = turn("Question\n\n" + "why not " * 500)
+    assert compact_history(messages, budget=10) == messages
+
+
+def test_old_copies_of_the_script_become_references():
+    reply = json.dumps({"message": "Here it is", "python": SCRIPT})
+    messages = turn("Make a script\n\n" + SCRIPT, "<think>planning</think>" + reply)
+    history = compact_history(messages, current_code=SCRIPT)
+    assert history[0]["content"].startswith("Make a script\n\n[script sha256:")
+    assert "identical to the current script" in history[0]["content"]
+    answer = json.loads(history[1]["content"])
+    assert answer["message"] == "Here it is" and "identical to the current script" in answer["python"]
+    assert "planning" not in history[1]["content"]
+
+
+def test_history_is_normalised_to_alternating_turns():
+    messages = [
+        {"role": "assistant", "content": "Welcome"},
+        {"role": "user", "content": "one"},
+        {"role": "user", "content": "two"},
+        {"role": "system", "content": "ignored"},
+        {"role": "assistant", "content": "reply"},
+        {"role": "user", "content": "pending"},
+    ]
+    assert compact_history(messages) == [{"role": "user", "content": "one\n\ntwo"}, {"role": "assistant", "content": "reply"}]
@@ -0,0 +1,32 @@
+import pytest
+
+from intent_classifier import CODE_CHANGE, classify, confident_question
+
+
+@pytest.mark.parametrize("message", [
+    "Does it support streaming? If not, add it.",
+    "How about adding memory?",
+    "What about caching the embeddings?",
+    "Can you make it answer in French?",
+    "Why do you use httpx instead of requests? I want aiohttp",
+    "Why does it crash with a KeyError?",
+    "What does this do?\n```python\nprint(1)\n```",
+    "",
+])
+def test_requests_and_failures_never_take_the_question_path(message):
+    assert not confident_question(message)
+
+
+@pytest.mark.parametrize("message", [
+    "What does the main function do?",
+    "How do I run this script?",
+    "Which model does this agent use?",
+    "Explain the search_docs function",
+])
+def test_plain_questions_take_the_question_path(message):
+    assert confident_question(message)
+
+
+def test_imperative_edits_classify_as_code_changes():
+    assert classify("Please add retry logic around the API calls")[0] == CODE_CHANGE
+    assert classify("switch the model to gpt-4o-mini")[0] == CODE_CHANGE
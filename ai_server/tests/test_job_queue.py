@@ -0,0 +1,32 @@
+import asyncio
+import functools
+import time
+
+import asgi_app
+import job_queue
+
+
+def test_jobs_left_by_a_dead_process_resume_when_the_server_starts(tmp_path, monkeypatch):
+    path = str(tmp_path / "jobs.sqlite3")
+    monkeypatch.setitem(job_queue.JOB_KINDS, "echo", lambda data, report: {"echo": data["text"]})
+    earlier = job_queue.JobQueue(path, workers=1)
+    job_id = earlier.submit("echo", {"text": "hi"}, "user")
+    # Claimed by a process that has since died
+    earlier._connect().execute("UPDATE jobs SET status = 'running', owner_pid = 2147483646 WHERE id = ?", (job_id,))
+
+    monkeypatch.setattr(job_queue, "_queue", None)
+    monkeypatch.setattr(job_queue, "JobQueue", functools.partial(job_queue.JobQueue, path, workers=1))
+
+    async def serve():
+        async with asgi_app.app.test_app():
+            for _ in range(100):
+                job = earlier.get(job_id)
+                if job["status"] in job_queue.TERMINAL_STATUSES:
+                    return job
+                await asyncio.sleep(0.05)
+        return earlier.get(job_id)
+
+    started = time.monotonic()
+    job = asyncio.run(serve())
+    assert job["status"] == "succeeded" and job["result"] == {"echo": "hi"}
+    assert time.monotonic() - started < 5
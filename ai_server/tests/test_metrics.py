@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+import metrics
+import perplexity_client
+
+seen = []
+
+
+@metrics.prompt_stage("test_agent")
+def build_payload(text: str) -> dict:
+    seen.append(metrics.current_agent.get())
+    return {"model": "sonar", "messages": [{"role": "user", "content": text}]}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Agents current during each fake upstream call."""
+    agents = []
+
+    def chat_completion(payload):
+        agents.append(metrics.current_agent.get())
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+    async def achat_completion(payload):
+        return chat_completion(payload)
+
+    monkeypatch.setattr(perplexity_client, "chat_completion", chat_completion)
+    monkeypatch.setattr(perplexity_client, "achat_completion", achat_completion)
+    return agents
+
+
+def test_prompt_stage_labels_the_payload_without_leaking_the_agent():
+    seen.clear()
+    payload = build_payload("hi")
+    assert seen == ["test_agent"]
+    assert payload.agent == "test_agent" and payload["model"] == "sonar"
+    assert metrics.current_agent.get() == "unknown"
+
+
+def test_prompt_stage_resets_the_agent_when_the_builder_fails():
+    @metrics.prompt_stage("broken_agent")
+    def broken():
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        broken()
+    assert metrics.current_agent.get() == "unknown"
+
+
+def test_upstream_calls_are_labelled_with_the_payload_agent(upstream):
+    assert perplexity_client.complete(build_payload("hi")) == "ok"
+    assert asyncio.run(perplexity_client.acomplete(build_payload("hi"))) == "ok"
+    assert perplexity_client.complete({"model": "sonar", "messages": []}) == "ok"
+    assert upstream == ["test_agent", "test_agent", "unknown"]
+    assert metrics.current_agent.get() == "unknown"
@@ -0,0 +1,94 @@
+import pytest
+
+import metrics
+import model_router
+from model_router import observe, route
+
+POLICY = {"preferred": "sonar-pro", "fallback": "sonar", "slo": 10, "maxQueueWait": 5}
+PAYLOAD = {"model": "sonar-pro", "messages": [{"role": "user", "content": "hi"}]}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """Routes the "test" agent with ``POLICY``; models in the returned set count as rate limited."""
+    limited = set()
+    monkeypatch.setattr(model_router, "_windows", {})
+    monkeypatch.setattr(model_router, "MODEL_ROUTING", True)
+    monkeypatch.setattr(model_router, "ROUTE_POLICIES", {"test": POLICY})
+    monkeypatch.setattr(model_router, "_rate_limited", lambda model, policy, tokens: model in limited)
+    token = metrics.current_agent.set("test")
+    yield limited
+    metrics.current_agent.reset(token)
+
+
+def record(model, seconds, count=model_router.ROUTER_MIN_SAMPLES):
+    window = model_router._window("test", model)
+    for _ in range(count):
+        window.add(seconds, model_router.time.monotonic())
+
+
+def test_healthy_preferred_model_is_kept(router):
+    record("sonar-pro", 1.0)
+    assert route(PAYLOAD) is PAYLOAD
+
+
+def test_slow_preferred_model_is_downgraded_after_one_probe(router):
+    record("sonar-pro", 30.0)
+    assert model_router.choose("test", POLICY, 100) == ("sonar-pro", "probe")
+    routed = route(PAYLOAD)
+    assert routed["model"] == "sonar" and routed["messages"] is PAYLOAD["messages"]
+    assert PAYLOAD["model"] == "sonar-pro"
+
+
+def test_failing_preferred_model_is_downgraded(router):
+    model_router._window("test", "sonar-pro").sent(model_router.time.monotonic())
+    record("sonar-pro", None)
+    assert model_router.choose("test", POLICY, 100) == ("sonar", "errors")
+
+
+def test_rate_limited_model_is_downgraded_without_a_probe(router):
+    router.add("sonar-pro")
+    assert model_router.choose("test", POLICY, 100) == ("sonar", "rate_limited")
+
+
+def test_unhealthy_fallback_keeps_the_preferred_model(router):
+    router.update({"sonar-pro", "sonar"})
+    assert model_router.choose("test", POLICY, 100) == ("sonar-pro", "preferred")
+
+
+def test_too_few_samples_say_nothing(router):
+    record("sonar-pro", 30.0, count=model_router.ROUTER_MIN_SAMPLES - 1)
+    assert model_router.choose("test", POLICY, 100) == ("sonar-pro", "preferred")
+
+
+def test_explicit_model_passes_through_without_a_policy(router, monkeypatch):
+    payload = {**PAYLOAD, "model": "sonar-deep-research"}
+    token = metrics.current_agent.set("unrouted")
+    try:
+        assert route(payload) is payload
+    finally:
+        metrics.current_agent.reset(token)
+    monkeypatch.setattr(model_router, "MODEL_ROUTING", False)
+    router.add("sonar-pro")
+    assert route(payload) is payload
+
+
+def test_observe_records_latency_and_failures(router):
+    with observe(PAYLOAD):
+        pass
+    with pytest.raises(RuntimeError):
+        with observe(PAYLOAD):
+            raise RuntimeError("upstream down")
+    snapshot = model_router.stats()["test"]["sonar-pro"]
+    assert snapshot["calls"] == 2 and snapshot["errorRate"] == 0.5
+    assert snapshot["p95"] is not None and snapshot["p95"] < 1
+
+
+def test_observe_ignores_unrouted_agents(router):
+    token = metrics.current_agent.set("unrouted")
+    try:
+        with observe(PAYLOAD):
+            pass
+    finally:
+        metrics.current_agent.reset(token)
+    assert model_router.stats() == {}
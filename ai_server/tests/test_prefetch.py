@@ -0,0 +1,45 @@
+from concurrent.futures import Future
+
+import prefetch
+
+RECOMMENDATIONS = {"llm": "sonar", "llm_justification": "cheap", "vector_store": "chroma"}
+
+
+def speculate(monkeypatch, data):
+    calls = []
+
+    def submit(fn, *args):
+        calls.append(args)
+        future = Future()
+        future.set_result("prefetched")
+        return future
+
+    monkeypatch.setattr(prefetch, "jobs", prefetch.SpeculativeJobs())
+    monkeypatch.setattr(prefetch._executor, "submit", submit)
+    prefetch.speculate_walkthrough(data, RECOMMENDATIONS)
+    return calls
+
+
+def test_walkthrough_with_the_recommended_options_claims_the_job(monkeypatch):
+    calls = speculate(monkeypatch, {"prompt": "pdf chat", "sessionId": "s"})
+    options = prefetch.walkthrough_options(RECOMMENDATIONS)
+    for tech_stack in ("", prefetch.walkthrough_tech_stack(options)):
+        request = {"prompt": "pdf chat", "sessionId": "s", "options": options, "techStack": tech_stack}
+        assert prefetch.claim_walkthrough(request).result() == "prefetched"
+    # The speculative call was made with the tech stack the route would have used
+    assert calls[0][1] == prefetch.walkthrough_tech_stack(options)
+
+
+def test_options_in_another_order_still_claim_the_job(monkeypatch):
+    speculate(monkeypatch, {"prompt": "pdf chat", "sessionId": "s"})
+    options = dict(reversed(prefetch.walkthrough_options(RECOMMENDATIONS).items()))
+    request = {"prompt": "pdf chat", "sessionId": "s", "options": options, "techStack": prefetch.walkthrough_tech_stack(options)}
+    assert prefetch.claim_walkthrough(request).result() == "prefetched"
+
+
+def test_walkthrough_for_another_tech_stack_does_not_claim_the_job(monkeypatch):
+    speculate(monkeypatch, {"prompt": "pdf chat", "sessionId": "s"})
+    options = prefetch.walkthrough_options(RECOMMENDATIONS)
+    request = {"prompt": "pdf chat", "sessionId": "s", "options": options, "techStack": "Django + Postgres"}
+    assert prefetch.claim_walkthrough(request) is None
+    assert prefetch.jobs.stats()["cancelled"] == 1
@@ -0,0 +1,56 @@
+import threading
+
+import prompt_index
+from prompt_index import PromptIndex, prompt_terms, prompt_vector
+
+ANSWER = {"llm": "sonar"}
+
+
+def test_filler_words_and_synonyms_are_folded():
+    assert prompt_terms("Build an agent to chat with my PDFs") == ["chat", "document"]
+    assert prompt_vector("build me an agent") is None
+
+
+def test_near_duplicate_prompt_reuses_the_answer():
+    index = PromptIndex("schema", path=None, max_entries=4)
+    index.add("chat with my pdfs", ANSWER)
+    hit = index.lookup("An agent to chat with my PDF documents")
+    assert hit["result"] == ANSWER and hit["prompt"] == "chat with my pdfs"
+    assert index.lookup("summarize youtube videos") is None
+    assert index.stats()["hits"] == 1 and index.stats()["misses"] == 1
+
+
+def test_least_recently_used_prompt_is_evicted():
+    index = PromptIndex("schema", path=None, max_entries=2)
+    index.add("chat with my pdfs", {"n": 1})
+    index.add("summarize youtube videos", {"n": 2})
+    index.lookup("chat with my pdfs")
+    index.add("translate emails to spanish", {"n": 3})
+    assert index.lookup("summarize youtube videos") is None
+    assert index.lookup("chat with my pdfs")["result"] == {"n": 1}
+    assert index.stats()["entries"] == 2
+
+
+def test_saved_index_is_reloaded_only_with_the_same_settings(tmp_path):
+    path = str(tmp_path / "index.npz")
+    index = PromptIndex("schema", path=path, max_entries=4)
+    index.add("chat with my pdfs", ANSWER)
+    index.save()
+    assert PromptIndex("schema", path=path, max_entries=4).lookup("chat with my pdfs")["result"] == ANSWER
+    assert PromptIndex("other schema", path=path, max_entries=4).lookup("chat with my pdfs") is None
+    # A smaller index keeps what fits
+    assert PromptIndex("schema", path=path, max_entries=1).stats()["entries"] == 1
+
+
+def test_due_save_runs_on_a_background_thread(tmp_path, monkeypatch):
+    path = str(tmp_path / "index.npz")
+    index = PromptIndex("schema", path=path, max_entries=4)
+    caller = threading.get_ident()
+    savers = []
+    save = index.save
+    monkeypatch.setattr(index, "save", lambda: savers.append(threading.get_ident()) or save())
+    monkeypatch.setattr(prompt_index, "PROMPT_INDEX_SAVE_INTERVAL", 0)
+    index.add("chat with my pdfs", ANSWER)
+    index.flush()
+    assert savers and savers[0] != caller
+    assert PromptIndex("schema", path=path, max_entries=4).lookup("chat with my pdfs")["result"] == ANSWER
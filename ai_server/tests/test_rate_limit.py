@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+import perplexity_client
+import rate_limit
+from rate_limit import CircuitBreaker, TokenBucket
+
+
+def test_token_bucket_reservations_queue_in_order():
+    bucket = TokenBucket(60)  # one per second
+    bucket.tokens = 1.0
+    assert bucket.reserve(1, now=bucket.updated) == 0.0
+    assert bucket.reserve(1, now=bucket.updated) == pytest.approx(1.0)
+    assert bucket.reserve(1, now=bucket.updated) == pytest.approx(2.0)
+    bucket.refund(2)
+    assert bucket.wait(1, now=bucket.updated) == pytest.approx(1.0)
+
+
+def test_token_bucket_pause_delays_everyone():
+    bucket = TokenBucket(600)
+    now = bucket.updated
+    bucket.pause(5, now)
+    assert bucket.reserve(1, now) == pytest.approx(5.0)
+
+
+def test_backoff_respects_retry_after():
+    for attempt in range(6):
+        assert rate_limit.BACKOFF_MAX >= rate_limit.backoff_delay(attempt) >= 0
+    assert rate_limit.backoff_delay(0, retry_after=7) >= 7
+
+
+def open_breaker(cooldown=30.0):
+    breaker = CircuitBreaker(threshold=2, cooldown=cooldown)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_and_lets_one_probe_through():
+    breaker = open_breaker()
+    assert breaker.state == "open" and not breaker.allow()
+    breaker.opened_at -= 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker()
+    breaker.opened_at -= 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_released_probe_frees_the_slot_only_for_its_owner():
+    breaker = open_breaker()
+    breaker.opened_at -= 30
+    assert breaker.allow()
+    probe = breaker.probe
+    breaker.release_probe(object())
+    assert not breaker.allow()
+    breaker.release_probe(probe)
+    assert breaker.allow()
+
+
+def test_stale_probe_expires_after_the_cooldown():
+    breaker = open_breaker()
+    breaker.opened_at -= 30
+    assert breaker.allow()
+    breaker.probe_started -= 30
+    assert breaker.allow()
+
+
+class FakeResponse:
+    status_code = 200
+
+
+def test_cancelled_probe_does_not_wedge_the_breaker():
+    model = "test-cancelled-probe"
+    limiter = rate_limit.get_limiter(model)
+    limiter.breaker = open_breaker()
+    limiter.breaker.opened_at -= 30
+    payload = {"model": model, "messages": [{"role": "user", "content": "hi"}]}
+
+    async def scenario():
+        async def hang():
+            await asyncio.sleep(10)
+
+        probe = asyncio.create_task(perplexity_client._asend(payload, hang))
+        await asyncio.sleep(0.05)
+        assert limiter.breaker.probing
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok():
+            return FakeResponse()
+
+        return await perplexity_client._asend(payload, ok)
+
+    assert isinstance(asyncio.run(scenario()), FakeResponse)
+    assert limiter.breaker.state == "closed"
+
+
+def test_rate_limited_probe_gives_its_slot_back(monkeypatch):
+    model = "test-rate-limited-probe"
+    limiter = rate_limit.get_limiter(model)
+    limiter.breaker = open_breaker()
+    limiter.breaker.opened_at -= 30
+    monkeypatch.setattr(perplexity_client, "MAX_RETRIES", 0)
+    payload = {"model": model, "messages": [{"role": "user", "content": "hi"}]}
+
+    def limited():
+        raise perplexity_client.RateLimitedError("429", retry_after=0.0)
+
+    with pytest.raises(perplexity_client.RateLimitedError):
+        perplexity_client._send(payload, limited)
+    assert not limiter.breaker.probing
+    assert limiter.breaker.state == "half-open"
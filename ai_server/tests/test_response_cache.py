@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import pytest
+
+import perplexity_client
+import response_cache
+from response_cache import MemoryBackend, ResponseCache, SQLiteBackend, cache_key
+from structured_output import validator
+from tech_review_agent import AnswerFormat as TechReviewAnswer
+
+VALID = json.dumps({"ScriptSummary": "s", "TechnicalImprovements": "t", "FeatureSuggestions": "f", "Conclusion": "c"})
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=8)
+    return MemoryBackend(max_entries=8)
+
+
+def test_miss_then_hit(backend):
+    cache = ResponseCache(backend, ttl=60)
+    calls = []
+    compute = lambda: calls.append(1) or "answer"
+    assert cache.get_or_compute("k", compute) == "answer"
+    assert cache.get_or_compute("k", compute) == "answer"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_recomputed(backend, monkeypatch):
+    cache = ResponseCache(backend, ttl=60)
+    now = 1000.0
+    monkeypatch.setattr(response_cache.time, "time", lambda: now)
+    cache.get_or_compute("k", lambda: "old")
+    now += 61
+    assert cache.get_or_compute("k", lambda: "new") == "new"
+    assert cache.stats()["misses"] == 2
+
+
+def test_invalid_output_is_returned_but_not_cached(backend):
+    cache = ResponseCache(backend, ttl=60)
+    check = validator(TechReviewAnswer)
+    assert cache.get_or_compute("k", lambda: '{"ScriptSummary": "trunc', check) == '{"ScriptSummary": "trunc'
+    assert backend.get("k") is None
+    assert cache.get_or_compute("k", lambda: VALID, check) == VALID
+    assert cache.get_or_compute("k", lambda: "never called", check) == VALID
+
+
+def test_async_invalid_output_is_not_cached(backend):
+    cache = ResponseCache(backend, ttl=60)
+    check = validator(TechReviewAnswer)
+
+    async def scenario():
+        async def truncated():
+            return "<think>still going"
+
+        async def valid():
+            return VALID
+
+        first = await cache.aget_or_compute("k", truncated, check)
+        second = await cache.aget_or_compute("k", valid, check)
+        return first, second
+
+    assert asyncio.run(scenario()) == ("<think>still going", VALID)
+    assert backend.get("k") == VALID
+
+
+def test_cache_key_ignores_unrelated_payload_fields():
+    payload = {"model": "sonar", "messages": [{"role": "user", "content": "hi"}]}
+    assert cache_key(payload) == cache_key({**payload, "stream": True})
+    assert cache_key(payload) != cache_key({**payload, "model": "sonar-pro"})
+
+
+def test_complete_does_not_cache_a_malformed_answer(monkeypatch):
+    cache = ResponseCache(MemoryBackend(), ttl=60)
+    answers = iter(["Sorry, I can't", VALID])
+    monkeypatch.setattr(response_cache, "get_cache", lambda: cache)
+    monkeypatch.setattr(perplexity_client, "chat_completion",
+                        lambda payload: {"choices": [{"message": {"content": next(answers)}}]})
+    payload = {"model": "sonar-pro", "messages": [{"role": "user", "content": "review this"}]}
+    check = validator(TechReviewAnswer)
+    assert perplexity_client.complete(payload, cache=True, validate=check) == "Sorry, I can't"
+    assert perplexity_client.complete(payload, cache=True, validate=check) == VALID
+    assert perplexity_client.complete(payload, cache=True, validate=check) == VALID
@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+
+import perplexity_client
+import response_cache
+import tech_review_agent
+from script_chunks import split_chunks
+
+SCRIPT = '''import os
+
+MODEL = "gpt-4o"
+
+
+@decorated
+def first(x):
+    return x + 1
+
+# Comment about the class
+class Agent:
+    def run(self):
+        return first(1)
+
+
+async def second():
+    pass
+
+
+if __name__ == "__main__":
+    Agent().run()
+# trailing comment
+'''
+
+
+def test_each_chunk_starts_and_ends_on_a_top_level_boundary():
+    chunks = split_chunks(SCRIPT, min_chars=0)
+    lines = SCRIPT.splitlines(keepends=True)
+    assert [chunk["name"] for chunk in chunks] == ["module-level code", "first", "Agent", "second", "module-level code"]
+    assert "".join(chunk["source"] for chunk in chunks) == SCRIPT
+    for chunk in chunks:
+        assert chunk["source"] == "".join(lines[chunk["firstLine"] - 1:chunk["lastLine"]])
+    assert chunks[1]["source"].lstrip().startswith("@decorated")
+    assert chunks[2]["source"].lstrip().startswith("# Comment about the class")
+    assert chunks[-1]["source"].endswith("# trailing comment\n")
+
+
+def test_small_chunks_merge_into_the_next_one():
+    chunks = split_chunks(SCRIPT, min_chars=60)
+    assert [chunk["name"] for chunk in chunks] == ["module-level code, first", "Agent", "second, module-level code"]
+    assert "".join(chunk["source"] for chunk in chunks) == SCRIPT
+
+
+def test_editing_one_function_changes_only_its_hash():
+    before = split_chunks(SCRIPT, min_chars=0)
+    after = split_chunks(SCRIPT.replace("return x + 1", "return x + 2"), min_chars=0)
+    changed = [old["name"] for old, new in zip(before, after) if old["hash"] != new["hash"]]
+    assert changed == ["first"]
+
+
+def test_invalid_python_raises():
+    with pytest.raises(SyntaxError):
+        split_chunks("def broken(:\n")
+
+
+REVIEW = {"ScriptSummary": "s", "TechnicalImprovements": "t", "FeatureSuggestions": "f", "Conclusion": "c"}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake upstream: each chunk review echoes the chunk's name; returns the reduce payloads."""
+    reduced = []
+
+    def answer(payload):
+        if payload["messages"][0] is tech_review_agent.CHUNK_SYSTEM_MESSAGE:
+            name = payload["messages"][1]["content"].split("(")[1].split(",")[0]
+            return json.dumps({"Summary": f"summary of {name}", "TechnicalImprovements": "None", "FeatureSuggestions": "None"})
+        assert payload["messages"][0] is tech_review_agent.REDUCE_SYSTEM_MESSAGE
+        reduced.append(payload)
+        return json.dumps(REVIEW)
+
+    async def aanswer(payload, cache=False, validate=None):
+        return answer(payload)
+
+    monkeypatch.setattr(response_cache, "get_cache", lambda: None)
+    monkeypatch.setattr(perplexity_client, "complete", lambda payload, cache=False, validate=None: answer(payload))
+    monkeypatch.setattr(perplexity_client, "acomplete", aanswer)
+    monkeypatch.setattr(tech_review_agent, "split_chunks", lambda code: split_chunks(code, min_chars=0))
+    return reduced
+
+
+def check_merged(answer, reduced):
+    assert json.loads(answer) == REVIEW
+    (payload,) = reduced
+    merged = payload["messages"][1]["content"]
+    names = ["first", "Agent", "second"]
+    positions = [merged.index(f"Summary: summary of {name}") for name in names]
+    assert positions == sorted(positions)
+    assert "### Agent (lines 9-13)" in merged
+
+
+def test_chunked_review_merges_chunk_findings_in_script_order(upstream):
+    check_merged(tech_review_agent.run_tech_review([], SCRIPT, mode="chunked"), upstream)
+
+
+def test_async_chunked_review_merges_chunk_findings(upstream):
+    check_merged(asyncio.run(tech_review_agent.arun_tech_review([], SCRIPT, mode="chunked")), upstream)
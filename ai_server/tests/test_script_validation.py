@@ -0,0 +1,44 @@
+import json
+
+from script_validation import _apply_repair, check_script, missing_packages, repair_request, validate_code_answer
+
+# The broken call repeats a line that also appears far away from the error
+HEAD = "def run(client):\n    return client.ask('hi')\n\n\n" + "".join(f"STEP_{i} = {i}\n" for i in range(20))
+SCRIPT = HEAD + "result = run(client\n    return client.ask('hi')\n"
+
+
+def test_repair_edits_apply_inside_the_region_only():
+    problem = check_script(SCRIPT)
+    request = repair_request(SCRIPT, problem)
+    _, first, last, region = request
+    assert first > 2 and "def run" not in region
+    edits = [{"search": "    return client.ask('hi')\n", "replace": ""}, {"search": "run(client\n", "replace": "run(client)\n"}]
+    output = json.dumps({"edits": edits})
+    fixed = _apply_repair(SCRIPT, request, output)
+    assert fixed == HEAD + "result = run(client)\n"
+    assert check_script(fixed) is None
+
+
+def test_repair_edits_that_only_match_outside_the_region_do_not_apply():
+    problem = check_script(SCRIPT)
+    request = repair_request(SCRIPT, problem)
+    output = json.dumps({"edits": [{"search": "def run(client):", "replace": "def run(client=None):"}]})
+    assert _apply_repair(SCRIPT, request, output) is None
+
+
+def test_missing_imports_are_added_to_the_pip_command():
+    code_json = validate_code_answer({"python": "import requests\nimport os\n", "CLI": "pip install httpx"})
+    assert code_json["CLI"] == "pip install httpx requests"
+    assert code_json["validation"]["addedPackages"] == ["requests"]
+
+
+def test_a_pip_command_is_generated_when_the_cli_has_none():
+    for cli in ("NULL", "", "python app.py"):
+        code_json = validate_code_answer({"python": "import requests\n", "CLI": cli})
+        expected = "pip install requests" if cli in ("NULL", "") else "python app.py\npip install requests"
+        assert code_json["CLI"] == expected
+        assert code_json["validation"]["addedPackages"] == ["requests"]
+
+
+def test_requirements_file_installs_are_left_alone():
+    assert missing_packages("import requests\n", "pip install -r requirements.txt") == []
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_threads_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader, *followers]:
+        thread.join()
+    assert results == ["answer"] * 4
+    assert len(calls) == 1
+    assert flight.coalesced == 3
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def slow():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "answer"
+
+        leader = asyncio.create_task(flight.ado("k", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == "answer"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return calls
+
+    assert len(asyncio.run(scenario())) == 1
+
+
+def test_call_is_cancelled_when_no_caller_is_left():
+    async def scenario():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flight.ado("k", slow))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # A new caller starts a fresh call instead of joining the cancelled one
+        return await flight.ado("k", lambda: asyncio.sleep(0, result="fresh"))
+
+    assert asyncio.run(scenario()) == "fresh"
+
+
+def test_process_mode_shares_only_in_flight_results(tmp_path):
+    # Separate instances open the lock file separately, so they contend like separate processes
+    leader, waiter = SingleFlight(True, str(tmp_path)), SingleFlight(True, str(tmp_path))
+    started = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "first"
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(leader.do("k", slow)))
+    thread.start()
+    started.wait()
+    assert waiter.do("k", lambda: "second") == "first"
+    thread.join()
+    assert results == ["first"] and len(calls) == 1
+    assert os.listdir(tmp_path) == []
+    # Nothing is kept once the call has finished
+    assert waiter.do("k", lambda: "later") == "later"
+    assert os.listdir(tmp_path) == []
+
+
+def test_process_mode_waiter_leads_after_a_failed_leader(tmp_path):
+    leader, waiter = SingleFlight(True, str(tmp_path)), SingleFlight(True, str(tmp_path))
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def run_leader():
+        try:
+            leader.do("k", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run_leader)
+    thread.start()
+    started.wait()
+    assert waiter.do("k", lambda: "retried") == "retried"
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_process_mode_cancelled_wait_releases_the_lock(tmp_path):
+    async def scenario():
+        holder, other = SingleFlight(True, str(tmp_path)), SingleFlight(True, str(tmp_path))
+        release = threading.Event()
+        holding = threading.Event()
+
+        def hold():
+            holding.set()
+            release.wait()
+            raise RuntimeError("upstream down")
+
+        def run_holder():
+            with pytest.raises(RuntimeError):
+                holder.do("k", hold)
+
+        thread = threading.Thread(target=run_holder)
+        thread.start()
+        holding.wait()
+        waiting = asyncio.create_task(other.ado("k", lambda: asyncio.sleep(0, result="never")))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        release.set()
+        await asyncio.to_thread(thread.join)
+        # The holder failed, so the abandoned wait ends up leading; it must release and retire the lock file
+        for _ in range(100):
+            if not os.listdir(tmp_path):
+                break
+            await asyncio.sleep(0.01)
+        assert os.listdir(tmp_path) == []
+        return await asyncio.wait_for(other.ado("k", lambda: asyncio.sleep(0, result="next")), 2)
+
+    assert asyncio.run(scenario()) == "next"
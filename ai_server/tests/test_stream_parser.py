@@ -0,0 +1,40 @@
+import json
+
+from stream_parser import IncrementalFieldParser
+
+ANSWER = {"Name": "PDF chat", "CLI": "pip install httpx", "python": "print(\"hi\\n\")\n", "conclusion": "Done."}
+
+
+def feed_in_chunks(parser, text, size):
+    completed = []
+    for start in range(0, len(text), size):
+        completed.extend(parser.feed(text[start:start + size]))
+    return completed
+
+
+def test_fields_complete_in_order_for_any_chunk_size():
+    text = "<think>Plan: {not json} yet</think>\n```json\n" + json.dumps(ANSWER) + "\n```"
+    for size in (1, 2, 7, len(text)):
+        parser = IncrementalFieldParser()
+        assert feed_in_chunks(parser, text, size) == list(ANSWER.items())
+        assert parser.done
+
+
+def test_field_is_emitted_before_the_rest_arrives():
+    parser = IncrementalFieldParser()
+    assert parser.feed('{"Name": "PDF chat", "python": "import os') == [("Name", "PDF chat")]
+    assert not parser.done
+    assert parser.feed('"}') == [("python", "import os")]
+
+
+def test_nested_values_and_escaped_quotes():
+    answer = {"edits": [{"search": "a \"b\"", "replace": "{c}"}], "note": "x"}
+    parser = IncrementalFieldParser()
+    assert feed_in_chunks(parser, json.dumps(answer), 3) == list(answer.items())
+
+
+def test_no_object_yet_completes_nothing():
+    parser = IncrementalFieldParser()
+    assert parser.feed("<think>still thinking") == []
+    assert parser.feed(" about it") == []
+    assert not parser.done
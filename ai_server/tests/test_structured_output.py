@@ -0,0 +1,30 @@
+import pytest
+from pydantic import BaseModel
+
+from structured_output import StructuredOutputError, answer_offset, extract_json_object, parse_agent_output
+
+
+class Answer(BaseModel):
+    Name: str
+    CLI: str
+
+
+def test_answer_offset():
+    assert answer_offset('{"a": 1}') == 0
+    assert answer_offset("<think>x</think>{}") == len("<think>x</think>")
+
+
+def test_think_block_fence_and_prose_are_skipped():
+    text = '<think>try {"Name": "draft"}</think>\nHere it is:\n```json\n{"Name": "final", "CLI": "pip install x"}\n```'
+    assert parse_agent_output(text, Answer) == {"Name": "final", "CLI": "pip install x"}
+
+
+def test_first_valid_object_wins_over_broken_braces():
+    assert extract_json_object('see {this} and {"a": [1, {"b": 2}]} {"c": 3}') == {"a": [1, {"b": 2}]}
+
+
+def test_missing_or_invalid_answers_raise():
+    with pytest.raises(StructuredOutputError, match="No JSON object"):
+        parse_agent_output("<think>{}</think> no json here")
+    with pytest.raises(StructuredOutputError, match="does not match Answer"):
+        parse_agent_output('{"Name": "only"}', Answer)
@@ -1,15 +1,16 @@
-import os
-import requests
+from pydantic import BaseModel
 
-def walk_me_through_code_agent( search_filter_context, tech_stack, user_prompt):
-    
-
-    class AnswerFormat(BaseModel):
-        Name: str
-        CLI : str
-        python: str
-        conclusion: str
-    AGENT_BUILDER_PROMPT =""" 
+import perplexity_client
+import metrics
+
+class AnswerFormat(BaseModel):
+    Name: str
+    CLI : str
+    python: str
+    conclusion: str
+
+
+AGENT_BUILDER_PROMPT =""" 
         You are a world class AI engineer and have been building agents and LLMs for the last decade. You have mastery over bash , CLI ,python and all the modern coding practices used in LLM frameworks like langchain, llamaindex, crewAI etc. You are tasked with generating a 
         python script for an AI agent ,given a set of detailed instructions , and that script should be such that it can be directly pasted in a single .py file and run for testing. 
         
@@ -40,23 +41,48 @@ def walk_me_through_code_agent( search_filter_context, tech_stack, user_prompt):
         }
             YOUR OUTPUT MUST STRICTLY AND EXCLUSIVELY CONTAIN THE JSON , ABSOLUTELY NOTHING ELSE
         """
-    url = "https://api.perplexity.ai/chat/completions"
-    api_key = os.getenv('PERPLEXITY_API_KEY')
-    headers = {"Authorization": f"Bearer {api_key}"}
-    payload = {
-        "model": "sonar-reasoning-pro",
+
+# Everything but the per-request fields, built once at import; shared by every request, so never mutate it
+PAYLOAD_TEMPLATE = {
+    "model": "sonar-reasoning-pro",
+    "web_search_options": {
+        "search_context_size": "medium"
+    },
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {"schema": AnswerFormat.model_json_schema()},
+    },
+}
+SYSTEM_MESSAGE = {"role": "system", "content": AGENT_BUILDER_PROMPT}
+
+
+@metrics.prompt_stage("walkthrough")
+def build_walk_me_through_payload( search_filter_context, tech_stack, user_prompt) -> dict:
+    return {
+        **PAYLOAD_TEMPLATE,
         "messages": [
-            {"role": "system", "content": AGENT_BUILDER_PROMPT},
+            SYSTEM_MESSAGE,
             {"role": "user", "content": user_prompt + "\n\n" + "Use the configuration below for the tech stack \n\n " + tech_stack}
         ],
-        "web_search_options": {
-            "search_context_size": "medium"
-        },
         "search_domain_filter": search_filter_context,
-        "response_format": {
-                "type": "json_schema",
-            "json_schema": {"schema": AnswerFormat.model_json_schema()},
-        }
     }
-    response = requests.post(url, headers=headers, json=payload).json()
-    return response["choices"][0]["message"]["content"]
\ No newline at end of file
+
+
+def walk_me_through_code_agent( search_filter_context, tech_stack, user_prompt):
+    return perplexity_client.complete(build_walk_me_through_payload(search_filter_context, tech_stack, user_prompt))
+
+
+def stream_walk_me_through_code_agent(search_filter_context, tech_stack, user_prompt):
+    """Yield the raw content deltas of the agent's response as they stream in."""
+    chunks = perplexity_client.stream_chat_completion(build_walk_me_through_payload(search_filter_context, tech_stack, user_prompt))
+    yield from perplexity_client.iter_content(chunks)
+
+
+async def awalk_me_through_code_agent(search_filter_context, tech_stack, user_prompt) -> str:
+    return await perplexity_client.acomplete(build_walk_me_through_payload(search_filter_context, tech_stack, user_prompt))
+
+
+async def astream_walk_me_through_code_agent(search_filter_context, tech_stack, user_prompt):
+    chunks = perplexity_client.astream_chat_completion(build_walk_me_through_payload(search_filter_context, tech_stack, user_prompt))
+    async for content in perplexity_client.aiter_content(chunks):
+        yield content
\ No newline at end of file
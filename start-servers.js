@@ -4,9 +4,9 @@ import { fileURLToPath } from 'url';
 
 const __dirname = path.dirname(fileURLToPath(import.meta.url));
 
-// Start the AI server (Python Flask)
-const aiServer = spawn('python', ['app.py'], {
-  cwd: path.join(__dirname, 'ai_server'),
+// Start the AI server (ASGI by default, see start_ai_server.py)
+const aiServer = spawn('python', ['start_ai_server.py'], {
+  cwd: __dirname,
   stdio: 'inherit'
 });
 
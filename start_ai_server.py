@@ -1,8 +1,36 @@
 #!/usr/bin/env python3
-import subprocess
-import sys
+"""Launch the AI orchestration server.
+
+AI_SERVER_MODE=asgi (the default) serves ai_server/asgi_app.py with uvicorn,
+so slow upstream LLM calls wait on one event loop instead of holding a
+thread each. AI_SERVER_MODE=flask runs the threaded Flask app from app.py.
+"""
 import os
+import sys
+
+# Change to ai_server directory so the agent modules import as top-level modules
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ai_server'))
+sys.path.insert(0, os.getcwd())
+
+HOST = os.getenv('AI_SERVER_HOST', '0.0.0.0')
+PORT = int(os.getenv('AI_SERVER_PORT', '5001'))
+MODE = os.getenv('AI_SERVER_MODE', 'asgi')
+WORKERS = int(os.getenv('AI_SERVER_WORKERS', '1'))
 
-# Change to ai_server directory and start the Flask app
-os.chdir('ai_server')
-subprocess.run([sys.executable, 'app.py'])
\ No newline at end of file
+if __name__ == '__main__':
+    if MODE == 'flask':
+        from app import app
+        from job_queue import get_job_queue
+        # Jobs re-queued from a process that died resume now, not on the first job request
+        get_job_queue()
+        app.run(host=HOST, port=PORT, debug=os.getenv('AI_SERVER_DEBUG') == '1', threaded=True)
+    else:
+        import uvicorn
+        uvicorn.run(
+            'asgi_app:app',
+            host=HOST,
+            port=PORT,
+            workers=WORKERS,
+            app_dir=os.getcwd(),
+            log_level=os.getenv('AI_SERVER_LOG_LEVEL', 'info'),
+        )